@@ -1,166 +1,125 @@
-import os
-from flask import Flask, render_template_string
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+"""
+Application factory.
 
-# -------------------------------------------------
-# App + Config
-# -------------------------------------------------
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY", "dev_secret")
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+create_app() builds the Flask app: config from the environment, the
+database, each component's init_app(), the CLI commands and the view
+blueprints (views/). The module-level `app` is what `gunicorn app:app`,
+`flask --app app` and the scripts that `from app import app` use.
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+Startup stays cheap, because Render's free plan spins the service down and
+the first request after that waits for a cold boot:
 
-# Import models
-from models import (
-    User, Role, Patient, Appointment, DoctorNote,
-    NurseProfile, ReceptionistProfile, AuditLog, TwilioLog
-)
+  * Heavy libraries load on first use, not at import (openpyxl and
+    reportlab in exports.py, cryptography in clinic_registry.py, numpy in
+    seed_scale.py).
+  * Flask-Migrate pulls in alembic and mako, about a quarter of the import
+    time, and only `flask db ...` needs it. So it is set up only when the
+    flask CLI is running.
+  * Under `gunicorn --preload` (the default, see gunicorn.conf.py) the
+    master builds the app once. Workers fork from it and share its pages.
 
-# -------------------------------------------------
-# Base HTML Dashboard Layout
-# -------------------------------------------------
-BASE_DASHBOARD = """
-<!DOCTYPE html>
-<html>
-<head>
-  <title>AI Receptionist Demo</title>
-  <style>
-    body { margin: 0; font-family: Arial, sans-serif; background: #f7f9fc; }
-    header { background: #8B0000; color: white; padding: 15px; font-size: 22px; }
-    .container { display: flex; }
-    nav { width: 220px; background: #333; min-height: 100vh; color: white; padding: 20px 0; }
-    nav h3 { margin-left: 20px; font-size: 16px; color: #ccc; text-transform: uppercase; }
-    nav a { display: block; color: white; padding: 12px 20px; text-decoration: none; }
-    nav a:hover { background: #444; }
-    main { flex: 1; padding: 20px; }
-    h1 { margin-top: 0; color: #333; }
-    table { border-collapse: collapse; width: 100%; margin-top: 15px; background: white; box-shadow: 0 1px 3px rgba(0,0,0,0.1); }
-    th, td { border: 1px solid #ddd; padding: 10px; text-align: left; }
-    th { background: #f2f2f2; }
-    tr:hover { background: #f9f9f9; }
-  </style>
-</head>
-<body>
-  <header>AI Receptionist Dashboard</header>
-  <div class="container">
-    <nav>
-      <h3>Navigation</h3>
-      <a href="/">🏠 Home</a>
-      <a href="/patients">👩‍⚕️ Patients</a>
-      <a href="/appointments">📅 Appointments</a>
-      <a href="/notes">📝 Doctor Notes</a>
-      <a href="/nurse_profiles">👩‍⚕️ Nurses</a>
-      <a href="/receptionist_profiles">👩 Receptionists</a>
-      <a href="/audit_logs">📊 Audit Logs</a>
-      <a href="/twilio_logs">📞 Twilio Logs</a>
-    </nav>
-    <main>
-      <h1>{{ title }}</h1>
-      {{ body|safe }}
-    </main>
-  </div>
-</body>
-</html>
+benchmarks/bench_startup.py measures this and checks it against a target.
 """
+import os
 
-# -------------------------------------------------
-# Home Route
-# -------------------------------------------------
-@app.route("/")
-def home():
-    body = """
-    <p>Welcome to the <b>AI Receptionist Demo</b> dashboard.</p>
-    <p>Use the navigation menu on the left to explore demo data for patients, appointments, doctor notes, staff profiles, logs, and Twilio activity.</p>
-    """
-    return render_template_string(BASE_DASHBOARD, title="Home", body=body)
+from flask import Flask
 
-# -------------------------------------------------
-# Patients
-# -------------------------------------------------
-@app.route("/patients")
-def list_patients():
-    patients = Patient.query.all()
-    body = "<table><tr><th>ID</th><th>Name</th><th>Email</th><th>Phone</th></tr>"
-    for p in patients:
-        body += f"<tr><td>{p.id}</td><td>{p.first_name} {p.last_name}</td><td>{p.email}</td><td>{p.phone}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Patients", body=body)
+import audit
+import calendar_feed
+import caller_id
+import clinic_registry
+import counters
+import dashboards
+import db_pool
+import instrumentation
+import jobs
+import llm_gateway
+import partitions
+import quick_replies
+import reminders
+import rendering
+import rollups
+import twilio_ingest
+import twilio_outbound
+from models import db
+from seed_scale import seed_scale_command
+from views import register_blueprints
 
-# -------------------------------------------------
-# Appointments
-# -------------------------------------------------
-@app.route("/appointments")
-def list_appointments():
-    appts = Appointment.query.order_by(Appointment.scheduled_time).all()
-    body = "<table><tr><th>ID</th><th>Patient</th><th>Doctor</th><th>Time</th></tr>"
-    for a in appts:
-        body += f"<tr><td>{a.id}</td><td>{a.patient_id}</td><td>{a.doctor_id}</td><td>{a.scheduled_time}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Appointments", body=body)
 
-# -------------------------------------------------
-# Doctor Notes
-# -------------------------------------------------
-@app.route("/notes")
-def list_notes():
-    notes = DoctorNote.query.all()
-    body = "<table><tr><th>ID</th><th>Doctor</th><th>Patient</th><th>Note</th><th>Created</th></tr>"
-    for n in notes:
-        body += f"<tr><td>{n.id}</td><td>{n.doctor_id}</td><td>{n.patient_id}</td><td>{n.content}</td><td>{n.created_at}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Doctor Notes", body=body)
+def load_config(app, config=None):
+    app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY", "dev_secret")
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get("TEMPLATE_CACHE_DIR")
+    app.config['AUDIT_QUEUE_SIZE'] = int(os.environ.get("AUDIT_QUEUE_SIZE", 10000))
+    app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+    app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0))
+    app.config['AUDIT_QUEUE_POLICY'] = os.environ.get("AUDIT_QUEUE_POLICY", "block")
+    app.config['JOB_ARTIFACT_DIR'] = os.environ.get("JOB_ARTIFACT_DIR")
+    app.config['APP_ENC_KEY'] = os.environ.get("APP_ENC_KEY")
+    app.config['METRICS_DIR'] = os.environ.get("METRICS_DIR")
+    app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN")
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))
+    app.config['OUTBOUND_SMS_RATE'] = float(os.environ.get("OUTBOUND_SMS_RATE", 1.0))
+    app.config['OUTBOUND_SMS_CONCURRENCY'] = int(os.environ.get("OUTBOUND_SMS_CONCURRENCY", 32))
+    app.config['LLM_BACKEND'] = os.environ.get("LLM_BACKEND")
+    app.config['LLM_MODEL'] = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+    app.config['LLM_SMS_REPLIES'] = os.environ.get("LLM_SMS_REPLIES", "").lower() in ("1", "true", "yes")
+    app.config['TWILIO_AUTH_TOKEN'] = os.environ.get("TWILIO_AUTH_TOKEN")
+    # Only for local development: unsigned webhooks are accepted from anyone.
+    app.config['TWILIO_VALIDATE_SIGNATURE'] = os.environ.get("TWILIO_VALIDATE_SIGNATURE", "true").lower() not in ("0", "false", "no")
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', db_pool.engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
 
-# -------------------------------------------------
-# Nurse Profiles
-# -------------------------------------------------
-@app.route("/nurse_profiles")
-def list_nurse_profiles():
-    nurses = NurseProfile.query.all()
-    body = "<table><tr><th>ID</th><th>User</th><th>Department</th></tr>"
-    for n in nurses:
-        body += f"<tr><td>{n.id}</td><td>{n.nurse_id}</td><td>{n.department}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Nurse Profiles", body=body)
 
-# -------------------------------------------------
-# Receptionist Profiles
-# -------------------------------------------------
-@app.route("/receptionist_profiles")
-def list_receptionist_profiles():
-    recs = ReceptionistProfile.query.all()
-    body = "<table><tr><th>ID</th><th>User</th><th>Front Desk</th></tr>"
-    for r in recs:
-        body += f"<tr><td>{r.id}</td><td>{r.receptionist_id}</td><td>{r.front_desk}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Receptionist Profiles", body=body)
+def init_migrations(app):
+    """Register `flask db ...` (Flask-Migrate), only when running under the flask CLI."""
+    if os.environ.get("FLASK_RUN_FROM_CLI") != "true":
+        return
+    from flask_migrate import Migrate
 
-# -------------------------------------------------
-# Audit Logs
-# -------------------------------------------------
-@app.route("/audit_logs")
-def list_audit_logs():
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).all()
-    body = "<table><tr><th>ID</th><th>User</th><th>Action</th><th>Details</th><th>Timestamp</th></tr>"
-    for l in logs:
-        body += f"<tr><td>{l.id}</td><td>{l.user_id}</td><td>{l.action}</td><td>{l.details}</td><td>{l.timestamp}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Audit Logs", body=body)
+    Migrate(app, db)
 
-# -------------------------------------------------
-# Twilio Logs (SMS, Calls, Faxes)
-# -------------------------------------------------
-@app.route("/twilio_logs")
-def list_twilio_logs():
-    logs = TwilioLog.query.order_by(TwilioLog.timestamp.desc()).all()
-    body = "<table><tr><th>ID</th><th>Type</th><th>From</th><th>To</th><th>Content</th><th>Status</th><th>Time</th></tr>"
-    for t in logs:
-        body += f"<tr><td>{t.id}</td><td>{t.type}</td><td>{t.from_number}</td><td>{t.to_number}</td><td>{t.content}</td><td>{t.status}</td><td>{t.timestamp}</td></tr>"
-    body += "</table>"
-    return render_template_string(BASE_DASHBOARD, title="Twilio Logs", body=body)
+
+def register_commands(app):
+    app.cli.add_command(seed_scale_command)
+    app.cli.add_command(dashboards.check_dashboards_command)
+    app.cli.add_command(rollups.rollups_backfill_command)
+    app.cli.add_command(jobs.worker_command)
+    app.cli.add_command(reminders.reminders_dispatch_command)
+    app.cli.add_command(reminders.reminders_generate_command)
+    app.cli.add_command(partitions.logs_retention_command)
+
+
+def create_app(config=None):
+    """Build the app; `config` overrides what is read from the environment."""
+    app = Flask(__name__)
+    load_config(app, config)
+
+    # The models are declared against models.db, so bind that instance to the
+    # app rather than creating a second, unregistered SQLAlchemy object.
+    db.init_app(app)
+    db_pool.init_app(app, db)
+    init_migrations(app)
+
+    audit.init_app(app)
+    calendar_feed.init_app(app)
+    caller_id.init_app(app)
+    clinic_registry.init_app(app)
+    counters.init_app(app)
+    instrumentation.init_app(app)
+    llm_gateway.init_app(app)
+    quick_replies.init_app(app)
+    rendering.init_app(app)
+    twilio_ingest.init_app(app)
+    twilio_outbound.init_app(app)
+
+    register_commands(app)
+    register_blueprints(app)
+    return app
+
+
+app = create_app()
 
 # -------------------------------------------------
 # Run
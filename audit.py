@@ -0,0 +1,189 @@
+"""
+Buffered audit-log sink.
+
+utils.log_action() used to add an AuditLog to the caller's session and
+commit it inline, so every denied permission check cost a DB round trip and
+also committed whatever else the caller had pending. Entries now go onto a
+bounded in-process queue and a background thread bulk-inserts them on its
+own connection, either when AUDIT_BATCH_SIZE rows are waiting or every
+AUDIT_FLUSH_INTERVAL seconds.
+
+When the queue is full AUDIT_QUEUE_POLICY decides what happens:
+    "block" - the caller waits (up to AUDIT_BLOCK_TIMEOUT seconds) for room
+    "drop"  - the entry is discarded and counted in `dropped`
+
+Set AUDIT_ASYNC = False to write each entry synchronously instead (still on
+a separate connection), which is handy in scripts and the Flask shell.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import current_app
+
+from models import db, AuditLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "AUDIT_ASYNC": True,
+    "AUDIT_QUEUE_SIZE": 10000,
+    "AUDIT_BATCH_SIZE": 500,
+    "AUDIT_FLUSH_INTERVAL": 1.0,
+    "AUDIT_QUEUE_POLICY": "block",
+    "AUDIT_BLOCK_TIMEOUT": 2.0,
+}
+
+
+class AuditSink:
+    def __init__(self, app):
+        self.app = app
+        config = {key: app.config.get(key, default) for key, default in DEFAULTS.items()}
+        self.async_mode = bool(config["AUDIT_ASYNC"])
+        self.batch_size = int(config["AUDIT_BATCH_SIZE"])
+        self.flush_interval = float(config["AUDIT_FLUSH_INTERVAL"])
+        self.policy = config["AUDIT_QUEUE_POLICY"]
+        self.block_timeout = float(config["AUDIT_BLOCK_TIMEOUT"])
+        self.queue_size = int(config["AUDIT_QUEUE_SIZE"])
+        if self.policy not in ("block", "drop"):
+            raise ValueError(f"AUDIT_QUEUE_POLICY must be 'block' or 'drop', not {self.policy!r}")
+
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()  # guards the worker lifecycle
+        self._counter_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stop = None
+        atexit.register(self.close)
+
+    # -------------------------------------------------
+    # Producer side
+    # -------------------------------------------------
+    def record(self, user_id, action, details=None):
+        entry = {
+            "user_id": user_id,
+            "action": action,
+            "details": details,
+            "timestamp": datetime.utcnow(),
+        }
+        if not self.async_mode:
+            self._write([entry])
+            return True
+
+        entries = self._ensure_worker()
+        try:
+            if self.policy == "block":
+                entries.put(entry, timeout=self.block_timeout)
+            else:
+                entries.put_nowait(entry)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            logger.warning("Audit queue full, dropped %s entry", action)
+            return False
+        return True
+
+    def _ensure_worker(self):
+        """The queue of this process's running flusher, started if need be."""
+        # Threads don't survive fork(), so a gunicorn worker forked from a
+        # preloaded master starts its own queue and flusher on first use.
+        entries = self._queue
+        if self._worker_running():
+            return entries
+        with self._lock:
+            if self._worker_running():
+                return self._queue
+            self._pid = os.getpid()
+            # Each flusher gets its own queue and stop event as arguments, so
+            # one that is still finishing after close() never drains (or
+            # waits on) its successor's.
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._queue, self._stop),
+                                            name="audit-flusher", daemon=True)
+            self._thread.start()
+            return self._queue
+
+    def _worker_running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive() and self._pid == os.getpid()
+
+    # -------------------------------------------------
+    # Flusher side
+    # -------------------------------------------------
+    def _run(self, entries, stop):
+        while not stop.is_set():
+            batch = self._drain(entries, wait=self.flush_interval)
+            if batch:
+                self._write(batch)
+        # Final drain after close() asked us to stop.
+        self._write_rest(entries)
+
+    def _write_rest(self, entries):
+        batch = self._drain(entries, wait=0)
+        while batch:
+            self._write(batch)
+            batch = self._drain(entries, wait=0)
+
+    def _drain(self, entries, wait):
+        """Collect up to batch_size entries, waiting at most `wait` seconds for the first."""
+        batch = []
+        try:
+            batch.append(entries.get(timeout=wait) if wait else entries.get_nowait())
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(entries.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # A dedicated connection/transaction: never touches the request's
+        # session, so the caller's pending changes are not committed with it.
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(AuditLog.__table__.insert(), batch)
+        except Exception:
+            logger.exception("Failed to write %d audit log entries", len(batch))
+            with self._counter_lock:
+                self.dropped += len(batch)
+            return
+        with self._counter_lock:
+            self.written += len(batch)
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far; the flusher restarts on the next record()."""
+        self.close(timeout)
+
+    def close(self, timeout=5.0):
+        """Stop the flusher after writing whatever is still queued."""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            thread, entries, self._thread, self._pid = self._thread, self._queue, None, None
+            self._stop.set()
+        thread.join(timeout)
+        if not thread.is_alive():
+            # Entries a record() racing with close() put on this queue after
+            # the flusher's final drain.
+            self._write_rest(entries)
+
+    def stats(self):
+        pending = self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+        return {"written": self.written, "dropped": self.dropped, "pending": pending}
+
+
+def init_app(app):
+    app.extensions["audit_sink"] = AuditSink(app)
+
+
+def get_sink():
+    return current_app.extensions["audit_sink"]
@@ -0,0 +1,231 @@
+"""
+Appointment availability: "when is Dr. Smith free next week?"
+
+Doctors work from weekly templates (doctor_schedules: weekday, start, end and
+slot length, several rows a day for split shifts). Doctors without one get
+DEFAULT_HOURS, the Monday-Friday 09:00-17:00 half-hour day that seed-scale
+generates. Appointments last duration_minutes (30 unless booked otherwise).
+
+open_slots() answers for many doctors at once:
+
+  1. One range query fetches every doctor's appointments, ordered by
+     (doctor_id, scheduled_time) so it walks ix_appointments_doctor_time.
+     Appointments are capped at MAX_DURATION, so starting the range that
+     much early catches any that run into it.
+  2. Busy intervals and candidate slots become flat int64 arrays of
+     minutes. Each doctor is shifted into a band of its own, so intervals
+     of different doctors can never overlap.
+  3. A slot [s, s + d) is taken if an appointment that starts before
+     s + d ends after s. With appointments sorted by start and a running
+     maximum of their ends, that is one searchsorted and one comparison
+     for every slot of every doctor.
+
+book() prevents double booking. It first bumps the doctor's counter in
+cache_versions ("appointments:doctor:<id>"). On PostgreSQL the upsert
+row-locks that counter until commit; SQLite takes its single write lock.
+Either way, concurrent bookings for one doctor queue up. Each booking then
+checks for overlaps only once it holds the lock, and sees every booking
+committed before it. An exclusion constraint would refuse to build over
+the overlapping rows that existing data already has.
+"""
+from datetime import datetime, time, timedelta, timezone
+
+from flask import abort
+from sqlalchemy import String, cast, select
+
+from models import db, Appointment, DoctorSchedule
+from versions import bump_version
+
+DEFAULT_DURATION = 30
+MAX_DURATION = 8 * 60  # minutes; also how far back a range query looks
+MAX_DAYS = 62
+MAX_DOCTORS = 200
+# weekday -> [(start, end, slot minutes)]
+DEFAULT_HOURS = {weekday: [(time(9), time(17), 30)] for weekday in range(5)}
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+# -------------------------------------------------
+# Templates
+# -------------------------------------------------
+def working_hours(doctor_ids):
+    """doctor id -> {weekday: [(start, end, slot minutes)]}, defaults filled in."""
+    rows = db.session.execute(
+        select(DoctorSchedule.doctor_id, DoctorSchedule.weekday, DoctorSchedule.start_time,
+               DoctorSchedule.end_time, DoctorSchedule.slot_minutes)
+        .where(DoctorSchedule.doctor_id.in_(doctor_ids))
+    ).all()
+    hours = {}
+    for doctor_id, weekday, start, end, slot in rows:
+        hours.setdefault(doctor_id, {}).setdefault(weekday, []).append((start, end, slot))
+    return {doctor_id: hours.get(doctor_id, DEFAULT_HOURS) for doctor_id in doctor_ids}
+
+
+def _week_pattern(np, hours, duration):
+    """Slot starts (minutes from Monday 00:00) and lengths for one week."""
+    starts, lengths = [], []
+    for weekday, shifts in hours.items():
+        for start, end, slot in shifts:
+            length = duration or slot
+            first, last = weekday * 1440 + _minutes(start), weekday * 1440 + _minutes(end) - length
+            if last >= first:
+                offsets = np.arange(first, last + 1, slot, dtype=np.int64)
+                starts.append(offsets)
+                lengths.append(np.full(len(offsets), length, dtype=np.int64))
+    if not starts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(starts), np.concatenate(lengths)
+
+
+def doctors_for_clinic(clinic_id):
+    return sorted(db.session.execute(
+        select(DoctorSchedule.doctor_id).where(DoctorSchedule.clinic_id == clinic_id).distinct()
+    ).scalars())
+
+
+# -------------------------------------------------
+# Slot computation
+# -------------------------------------------------
+def open_slots(doctor_ids, start, end, duration=None, not_before=None):
+    """doctor id -> numpy datetime64[m] array of free slot starts in [start, end).
+
+    `duration` (minutes) defaults to each shift's slot length. Slots
+    starting before `not_before` (e.g. now) are left out.
+    """
+    import numpy as np
+
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids or end <= start:
+        return {}
+    range_minutes = int((end - start).total_seconds() // 60)
+    band = range_minutes + 2 * MAX_DURATION  # room for slots and appointments near the edges
+    origin = np.datetime64(start, "m")
+
+    # Candidate slots: each doctor's week pattern repeated over the range.
+    monday = datetime.combine(start.date() - timedelta(days=start.weekday()), time.min)
+    weeks = np.arange(int((monday - start).total_seconds() // 60), range_minutes, 7 * 1440, dtype=np.int64)
+    lower = 0 if not_before is None else max(0, -int((start - not_before).total_seconds() // 60))
+    slot_starts, slot_lengths = [], []
+    for index, (doctor_id, hours) in enumerate(working_hours(doctor_ids).items()):
+        pattern, lengths = _week_pattern(np, hours, duration)
+        starts = (weeks[:, None] + pattern[None, :]).ravel()
+        keep = (starts >= lower) & (starts < range_minutes)
+        slot_starts.append(starts[keep] + index * band)
+        slot_lengths.append(np.broadcast_to(lengths, (len(weeks), len(lengths))).ravel()[keep])
+    slot_starts = np.concatenate(slot_starts)
+    slot_lengths = np.concatenate(slot_lengths)
+
+    # Busy intervals, one range scan over (doctor_id, scheduled_time). Times
+    # come back as text, which NumPy parses far faster than it converts
+    # datetime objects.
+    rows = db.session.connection().execute(
+        select(Appointment.doctor_id, cast(Appointment.scheduled_time, String), Appointment.duration_minutes)
+        .where(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.scheduled_time > start - timedelta(minutes=MAX_DURATION),
+            Appointment.scheduled_time < end,
+        )
+        .order_by(Appointment.doctor_id, Appointment.scheduled_time)
+    ).all()
+    if rows:
+        doctors, times, durations = zip(*rows)
+        bands = np.searchsorted(np.asarray(doctor_ids), np.asarray(doctors)) * band
+        busy_start = (np.asarray(times, dtype="datetime64[m]") - origin).astype(np.int64) + bands
+        busy_end = busy_start + np.minimum(np.asarray(durations, dtype=np.int64), MAX_DURATION)
+        order = np.argsort(busy_start, kind="stable")
+        busy_start, busy_end = busy_start[order], np.maximum.accumulate(busy_end[order])
+        # Appointments starting before each slot ends; taken if the latest end among them is after its start.
+        before = np.searchsorted(busy_start, slot_starts + slot_lengths, side="left")
+        taken = (before > 0) & (busy_end[np.maximum(before - 1, 0)] > slot_starts)
+        slot_starts = slot_starts[~taken]
+
+    owners = slot_starts // band
+    slots = origin + (slot_starts - owners * band).astype("timedelta64[m]")
+    bounds = np.searchsorted(owners, np.arange(len(doctor_ids) + 1))
+    return {
+        doctor_id: np.sort(slots[bounds[index]:bounds[index + 1]])
+        for index, doctor_id in enumerate(doctor_ids)
+    }
+
+
+def to_json(slots_by_doctor):
+    import numpy as np
+
+    return [
+        {"doctor_id": doctor_id, "slots": np.datetime_as_string(slots, unit="m").tolist()}
+        for doctor_id, slots in slots_by_doctor.items()
+    ]
+
+
+def parse_iso(value):
+    """datetime.fromisoformat(value) as naive UTC, which is how appointment
+    times are stored; "2030-01-07T10:00Z" and "2030-01-07T11:00+01:00" agree."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_request(args):
+    """(doctor ids, start, end, duration) from /availability query args; aborts with 400."""
+    try:
+        start = parse_iso(args.get("start") or datetime.utcnow().date().isoformat())
+        end = parse_iso(args["end"]) if args.get("end") else start + timedelta(days=7)
+    except ValueError:
+        abort(400, "start/end must be ISO dates")
+    if end <= start or (end - start).days > MAX_DAYS:
+        abort(400, f"The range must be between 1 minute and {MAX_DAYS} days")
+    duration = args.get("duration", type=int)
+    if duration is not None and not 5 <= duration <= MAX_DURATION:
+        abort(400, f"duration must be 5-{MAX_DURATION} minutes")
+    doctor_ids = args.getlist("doctor_id", type=int)
+    if not doctor_ids and args.get("clinic_id", type=int) is not None:
+        doctor_ids = doctors_for_clinic(args.get("clinic_id", type=int))
+    if not doctor_ids:
+        abort(400, "Pass doctor_id (repeatable) or a clinic_id with doctor schedules")
+    if len(doctor_ids) > MAX_DOCTORS:
+        abort(400, f"At most {MAX_DOCTORS} doctors per request")
+    return doctor_ids, start, end, duration
+
+
+# -------------------------------------------------
+# Booking
+# -------------------------------------------------
+def conflicts(doctor_id, start, duration):
+    """Ids of `doctor_id`'s appointments overlapping [start, start + duration)."""
+    end = start + timedelta(minutes=duration)
+    rows = db.session.execute(
+        select(Appointment.id, Appointment.scheduled_time, Appointment.duration_minutes)
+        .where(
+            Appointment.doctor_id == doctor_id,
+            Appointment.scheduled_time > start - timedelta(minutes=MAX_DURATION),
+            Appointment.scheduled_time < end,
+        )
+    ).all()
+    return [row.id for row in rows if row.scheduled_time + timedelta(minutes=row.duration_minutes) > start]
+
+
+def book(doctor_id, start, duration=None, **fields):
+    """Add an appointment unless it overlaps another one of the doctor's; caller commits.
+
+    Raises SlotUnavailable if the slot is taken.
+    """
+    duration = duration or DEFAULT_DURATION
+    if not 1 <= duration <= MAX_DURATION:
+        raise ValueError(f"duration must be 1-{MAX_DURATION} minutes")
+    # Held until the transaction ends: bookings for this doctor go one at a time.
+    bump_version(db.session.connection(), f"appointments:doctor:{doctor_id}")
+    taken = conflicts(doctor_id, start, duration)
+    if taken:
+        raise SlotUnavailable(f"Doctor {doctor_id} is booked at {start:%Y-%m-%d %H:%M} (appointment {taken[0]})")
+    appointment = Appointment(doctor_id=doctor_id, scheduled_time=start, duration_minutes=duration, **fields)
+    db.session.add(appointment)
+    db.session.flush()
+    return appointment
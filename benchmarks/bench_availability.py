@@ -0,0 +1,57 @@
+"""
+Benchmark: open slots for a whole clinic over a month.
+
+Loads one clinic with D doctors (default 50, each with the default
+Monday-Friday working hours) and enough generated appointments to book
+roughly half of their slots, then times availability.open_slots() for all
+doctors over 31 days. The target is a few milliseconds.
+
+Usage:
+    python benchmarks/bench_availability.py [doctors] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_avail_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+import availability  # noqa: E402
+from models import db, Appointment, DoctorSchedule  # noqa: E402
+from seed_scale import EPOCH, run_seed_scale  # noqa: E402
+
+
+def main():
+    doctors = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with app.app_context():
+        db.create_all()
+        if not DoctorSchedule.query.count():
+            # seed-scale spreads appointments over 455 days, 16 slots a day.
+            run_seed_scale(clinics=1, doctors=doctors, patients=10_000, appointments=doctors * 455 * 8,
+                           twilio_logs=0, seed=7, batch_size=50000, workers=1)
+        doctor_ids = availability.doctors_for_clinic(db.session.query(DoctorSchedule.clinic_id).limit(1).scalar())
+        start = EPOCH + timedelta(days=30)
+        end = start + timedelta(days=31)
+        booked = Appointment.query.filter(Appointment.scheduled_time >= start, Appointment.scheduled_time < end).count()
+        print(f"{len(doctor_ids)} doctors, {booked:,} appointments in the month, {db.engine.dialect.name}")
+
+        samples = []
+        for _ in range(repeats):
+            began = time.perf_counter()
+            slots = availability.open_slots(doctor_ids, start, end)
+            samples.append((time.perf_counter() - began) * 1e3)
+        samples.sort()
+        print(f"open slots: {sum(map(len, slots.values())):,}")
+        print(f"open_slots   p50 {samples[len(samples) // 2]:6.2f} ms   p99 {samples[int(len(samples) * 0.99)]:6.2f} ms")
+
+        began = time.perf_counter()
+        availability.to_json(slots)
+        print(f"to_json          {(time.perf_counter() - began) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
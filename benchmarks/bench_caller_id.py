@@ -0,0 +1,65 @@
+"""
+Benchmark: caller-ID lookups for inbound calls.
+
+Loads N generated patients with seed-scale (skipped if the table already
+has that many), then times caller_id.identify(From, To) for known callers
+and unknown numbers: first uncached (one indexed query), then again from
+the in-process LRU.
+
+Usage:
+    python benchmarks/bench_caller_id.py [patients, e.g. 1M] [lookups]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_caller_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+import caller_id  # noqa: E402
+from models import db, Patient  # noqa: E402
+from seed_scale import clinic_number, parse_count, patient_phone, run_seed_scale  # noqa: E402
+
+
+def timed(calls):
+    samples = []
+    for from_number, to_number in calls:
+        start = time.perf_counter()
+        caller_id.identify(from_number, to_number)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    patients = parse_count(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with app.app_context():
+        db.create_all()
+        existing = Patient.query.count()
+        if existing < patients:
+            print(f"Loading {patients - existing:,} patients...")
+            run_seed_scale(clinics=10, doctors=0, patients=patients - existing, appointments=0,
+                           twilio_logs=0, seed=7, batch_size=50000, workers=1)
+        max_id = db.session.query(db.func.max(Patient.id)).scalar()
+        print(f"{max_id:,} patients, {db.engine.dialect.name}")
+
+        rng = random.Random(1)
+        ids = rng.sample(range(1, max_id + 1), lookups)
+        clinics = dict(db.session.query(Patient.id, Patient.clinic_id).filter(Patient.id.in_(ids)))
+        known = [(patient_phone(pid), clinic_number(clinics[pid])) for pid in ids]
+        unknown = [(f"+1999{rng.randrange(10 ** 7):07d}", to_number) for _, to_number in known]
+
+        caller_id.get_cache().clear()
+        for label, calls in (("known, uncached", known), ("unknown, uncached", unknown),
+                             ("known, cached", known), ("unknown, cached", unknown)):
+            p50, p99 = timed(calls)
+            print(f"{label:<20} p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+        print(caller_id.get_cache().stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: the superadmin tiles with COUNT(*) vs counters.py.
+
+Loads ROWS audit log entries (SQLite unless DATABASE_URL is set), installs
+the counter triggers and compares, per dashboard load:
+
+  * COUNT(*) over the four tables, as superadmin_view used to;
+  * the exact counters read (counters table, PostgreSQL estimates where
+    configured);
+  * a read through the per-process cache, which is what a page load does
+    while the tiles are within their staleness budget.
+
+It also times bulk inserts into audit_logs with and without the triggers,
+which is what the exact counts cost the writers.
+
+Usage:
+    python benchmarks/bench_counters.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_cnt_'), 'bench.db')}")
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+from app import app  # noqa: E402
+import counters  # noqa: E402
+from models import db, Appointment, AuditLog, Clinic, User  # noqa: E402
+
+BATCH = 50_000
+
+
+def timed(fn, repeat):
+    began = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - began) / repeat
+
+
+def load(rows):
+    now = datetime.utcnow()
+    began = time.perf_counter()
+    with db.engine.begin() as conn:
+        for start in range(0, rows, BATCH):
+            conn.execute(insert(AuditLog), [{"action": "view", "details": f"row {i}", "timestamp": now}
+                                            for i in range(start, min(rows, start + BATCH))])
+    return time.perf_counter() - began
+
+
+def drop_triggers(conn):
+    if conn.dialect.name == "postgresql":
+        for trigger in ("counters_insert", "counters_delete", "counters_truncate"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON audit_logs"))
+    else:
+        for event in ("insert", "delete"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS counters_audit_logs_{event}"))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            drop_triggers(conn)
+        existing = db.session.query(func.count(AuditLog.id)).scalar()
+        if existing < rows:
+            print(f"loading {rows - existing:,} audit rows...")
+            load(rows - existing)
+
+        with db.engine.begin() as conn:
+            drop_triggers(conn)
+        plain = load(BATCH)
+        with db.engine.begin() as conn:
+            result = counters.recount(conn)
+        triggered = load(BATCH)
+        print(f"{BATCH:,}-row bulk insert: {plain * 1000:.0f} ms without triggers, {triggered * 1000:.0f} ms with "
+              f"({(triggered / plain - 1) * 100:+.0f}%)")
+        print(f"counted at recount: {result}")
+
+        models = (User, Clinic, Appointment, AuditLog)
+
+        def count_star():
+            with db.engine.connect() as conn:
+                return [conn.execute(select(func.count()).select_from(model)).scalar() for model in models]
+
+        cache = counters.get_counters()
+
+        def counters_read():
+            cache.refresh(counters.TABLES)
+
+        def cached_read():
+            cache.get(*counters.TABLES)
+
+        exact = count_star()
+        cached = cache.get(*counters.TABLES)
+        assert exact[-1] == cached["audit_logs"].value or cached["audit_logs"].approximate, (exact, cached)
+        print(f"audit_logs: {exact[-1]:,} rows; tile shows {cached['audit_logs'].value:,}"
+              f"{' (estimate)' if cached['audit_logs'].approximate else ''}")
+        print(f"COUNT(*) x4        {timed(count_star, 5) * 1000:9.2f} ms per page")
+        print(f"counters read      {timed(counters_read, 200) * 1000:9.2f} ms per page")
+        print(f"through the cache  {timed(cached_read, 10_000) * 1e6:9.2f} us per page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: Twilio webhook ingestion.
+
+A fake Twilio replays the status callbacks of a reminder blast (queued ->
+sent -> delivered/undelivered per message, partly out of order, plus some
+inbound SMS and calls) against /twilio/webhook. It measures:
+
+  * the webhook ack latency with the spool, against the old approach of an
+    ORM insert + commit per callback;
+  * how fast the batch writer turns the spool into twilio_logs rows, and
+    that every message ends up as exactly one row in its final status.
+
+Usage:
+    python benchmarks/bench_ingest.py [messages]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix="bench_ingest_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}")
+
+from flask import request  # noqa: E402
+
+from app import app  # noqa: E402
+import twilio_ingest  # noqa: E402
+from models import db, TwilioLog  # noqa: E402
+
+CLINIC_NUMBER = "+15550000001"
+
+
+def fake_callbacks(messages, seed=0):
+    """Form payloads Twilio would POST for `messages` outbound SMS, shuffled a little."""
+    rng = random.Random(seed)
+    callbacks = []
+    for i in range(messages):
+        sid = f"SM{i:032x}"
+        final = "delivered" if rng.random() > 0.05 else "undelivered"
+        for status in ("queued", "sent", final):
+            callbacks.append({
+                "MessageSid": sid, "SmsSid": sid, "AccountSid": "AC" + "0" * 32,
+                "MessageStatus": status, "SmsStatus": status,
+                "From": CLINIC_NUMBER, "To": f"+1{2000000000 + i:010d}", "ApiVersion": "2010-04-01",
+            })
+        if i % 20 == 0:
+            callbacks.append({
+                "MessageSid": f"SMin{i:030x}", "MessageStatus": "received", "Body": "C",
+                "From": f"+1{2000000000 + i:010d}", "To": CLINIC_NUMBER,
+            })
+        if i % 50 == 0:
+            call_sid = f"CA{i:032x}"
+            callbacks.append({"CallSid": call_sid, "CallStatus": "ringing", "Direction": "inbound",
+                              "From": f"+1{2000000000 + i:010d}", "To": CLINIC_NUMBER})
+            callbacks.append({"CallSid": call_sid, "CallStatus": "completed", "Direction": "inbound",
+                              "CallDuration": str(rng.randint(10, 300)),
+                              "From": f"+1{2000000000 + i:010d}", "To": CLINIC_NUMBER})
+    # Twilio does not promise ordering: swap neighbours now and then.
+    for i in range(len(callbacks) - 1):
+        if rng.random() < 0.1:
+            callbacks[i], callbacks[i + 1] = callbacks[i + 1], callbacks[i]
+    return callbacks
+
+
+def post_all(client, callbacks):
+    latencies = []
+    start = time.perf_counter()
+    for form in callbacks:
+        t0 = time.perf_counter()
+        response = client.post("/twilio/webhook", data=form)
+        latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200, response.status_code
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def report(label, callbacks, elapsed, p50, p99):
+    print(f"{label:<28} {len(callbacks) / elapsed:9,.0f} req/s   "
+          f"p50 {p50 * 1e3:6.2f} ms   p99 {p99 * 1e3:6.2f} ms")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    callbacks = fake_callbacks(messages)
+    app.config["TWILIO_INGEST_THREAD"] = False  # drain explicitly below
+    app.config["TWILIO_VALIDATE_SIGNATURE"] = False  # the fake callbacks are unsigned
+    spool = twilio_ingest.Spool(os.path.join(WORKDIR, "spool"), segment_events=2000, segment_seconds=3600)
+    app.extensions["twilio_spool"] = spool
+    writer = twilio_ingest.BatchWriter(app, spool)
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    print(f"{len(callbacks):,} callbacks for {messages:,} outbound messages")
+
+    # Before: one ORM row and commit per callback, on the request path.
+    @app.route("/bench/sync_webhook", methods=["POST"])
+    def sync_webhook():
+        event = twilio_ingest.parse_callback(request.form)
+        db.session.add(TwilioLog(**{k: v for k, v in event.items() if k not in ("sid", "timestamp")}))
+        db.session.commit()
+        return ""
+
+    sample = callbacks[: min(len(callbacks), 2000)]
+    latencies = []
+    start = time.perf_counter()
+    for form in sample:
+        t0 = time.perf_counter()
+        client.post("/bench/sync_webhook", data=form)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report("insert per webhook (before)", sample, elapsed, latencies[len(latencies) // 2],
+           latencies[int(len(latencies) * 0.99)])
+    with app.app_context():
+        TwilioLog.query.delete()
+        db.session.commit()
+
+    # After: spool append only.
+    report("spooled webhook (after)", callbacks, *post_all(client, callbacks))
+
+    spool.seal()
+    start = time.perf_counter()
+    writer.run(threading.Event(), once=True)
+    elapsed = time.perf_counter() - start
+    print(f"{'batch writer':<28} {len(callbacks) / elapsed:9,.0f} events/s "
+          f"({writer.inserted:,} inserted, {writer.updated:,} updated)")
+
+    with app.app_context():
+        rows = TwilioLog.query.count()
+        outbound = TwilioLog.query.filter(TwilioLog.direction == "outbound").all()
+    expected = messages + len(range(0, messages, 20)) + len(range(0, messages, 50))
+    assert rows == expected, (rows, expected)
+    assert all(log.status in ("delivered", "undelivered") for log in outbound)
+    print(f"{rows:,} rows, every outbound message in its final status")
+
+
+if __name__ == "__main__":
+    main()
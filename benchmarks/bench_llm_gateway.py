@@ -0,0 +1,122 @@
+"""
+Benchmark: receptionist questions through the LLM gateway.
+
+THREADS threads ask REQUESTS questions in all, spread over CLINICS clinics.
+The questions follow a Zipf-like curve over DISTINCT phrasings, and each one
+is re-typed with random case, spacing and trailing punctuation, the way
+patients type. The backend is llm_gateway.StubBackend, answering after
+LATENCY ms. The shared tier is SQLite unless DATABASE_URL is set.
+
+Compared with calling the backend for every question, it reports the hit
+rate per tier, the upstream calls saved, and the p50/p99 time callers
+waited.
+
+Usage:
+    python benchmarks/bench_llm_gateway.py [requests] [threads] [distinct] [latency ms]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_llm_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+from models import db, Clinic  # noqa: E402
+from llm_gateway import Gateway, StubBackend  # noqa: E402
+
+CLINICS = 5
+QUESTIONS = [
+    "what time do you open", "are you open on saturday", "do you take walk-ins", "where do i park",
+    "can i reschedule my appointment", "do you accept my insurance", "how do i get my test results",
+    "is there a pharmacy nearby", "do i need to fast before a blood test", "how long is the wait",
+]
+
+
+def retype(rng, question):
+    words = [word.upper() if rng.random() < 0.1 else word for word in question.split()]
+    text = ("  " if rng.random() < 0.2 else " ").join(words)
+    if rng.random() < 0.5:
+        text = text[0].upper() + text[1:]
+    return text + rng.choice(["", "?", "??", ".", " ?"])
+
+
+def workload(total, distinct, seed=7):
+    rng = random.Random(seed)
+    phrasings = [f"{QUESTIONS[i % len(QUESTIONS)]} (variant {i // len(QUESTIONS)})" if i >= len(QUESTIONS)
+                 else QUESTIONS[i] for i in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    picks = rng.choices(range(distinct), weights=weights, k=total)
+    return [(rng.randrange(CLINICS) + 1, retype(rng, phrasings[pick])) for pick in picks]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    distinct = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    latency = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.2
+
+    with app.app_context():
+        db.create_all()
+        if not db.session.query(Clinic).count():
+            db.session.add_all(Clinic(name=f"Bench Clinic {i}", slug=f"bench-{i}") for i in range(CLINICS))
+            db.session.commit()
+
+    jobs = workload(total, distinct)
+    backend = StubBackend(latency=latency)
+    gateway = Gateway(app, backend, model="stub", max_concurrency=8, queue_timeout=60)
+    waits, errors, lock = [], [], threading.Lock()
+    cursor = iter(jobs)
+
+    def worker():
+        while True:
+            with lock:
+                job = next(cursor, None)
+            if job is None:
+                return
+            try:
+                answer = gateway.answer(job[0], "You are a clinic receptionist.", job[1])
+            except Exception as exc:  # counted, not fatal
+                with lock:
+                    errors.append(exc)
+                continue
+            with lock:
+                waits.append(answer.seconds)
+
+    print(f"{total:,} questions, {threads} threads, {distinct} phrasings x {CLINICS} clinics, "
+          f"{latency * 1000:.0f} ms per model call, 8 calls at a time")
+    began = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    stats = gateway.stats
+    hits = stats["memory_hits"] + stats["db_hits"] + stats["coalesced"]
+    print(f"uncached: {total:,} model calls, ~{total * latency / 8:.1f} s at 8 at a time")
+    print(f"gateway:  {backend.calls:,} model calls in {elapsed:.1f} s ({total / elapsed:,.0f} questions/s)")
+    print(f"hit rate {hits / stats['requests']:.1%}: memory {stats['memory_hits']:,}, table {stats['db_hits']:,}, "
+          f"coalesced {stats['coalesced']:,}; errors {len(errors)}")
+    print(f"wait p50 {percentile(waits, 0.5) * 1000:.2f} ms, p99 {percentile(waits, 0.99) * 1000:.1f} ms")
+
+    # A second process starts with an empty LRU and reads the shared table.
+    cold = Gateway(app, StubBackend(latency=latency), model="stub")
+    began = time.perf_counter()
+    for clinic_id, question in jobs[:500]:
+        cold.answer(clinic_id, "You are a clinic receptionist.", question)
+    print(f"fresh process, 500 questions: {cold.backend.calls} model calls, {cold.stats['db_hits']} from the table, "
+          f"{time.perf_counter() - began:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: a reminder blast through the outbound SMS engine.
+
+Starts a fake Twilio server on localhost (benchmarks/fake_twilio.py) that
+answers after LATENCY ms, holds every from-number to RATE messages/second
+and fails 1% of requests with a 503. It then sends MESSAGES messages spread
+over NUMBERS clinics (one number and one account each), through:
+
+  * the old way: one request at a time, a new connection per message,
+    timed on a sample and extrapolated to the whole blast;
+  * twilio_outbound.OutboundEngine paced at RATE per number, with results
+    written to twilio_logs in bulk (SQLite unless DATABASE_URL is set).
+
+Usage:
+    python benchmarks/bench_outbound.py [messages] [numbers] [rate] [latency ms]
+"""
+import http.client
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_out_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+from fake_twilio import FakeTwilio  # noqa: E402
+from models import db  # noqa: E402
+import twilio_outbound  # noqa: E402
+from twilio_outbound import Credentials, HttpTransport, OutboundEngine, OutboundMessage  # noqa: E402
+
+
+def one_at_a_time(base_url, credentials, messages):
+    parts = urlsplit(base_url)
+    for message in messages:
+        creds = credentials[message.clinic_id]
+        connection = http.client.HTTPConnection(parts.hostname, parts.port)
+        connection.request(
+            "POST", f"/2010-04-01/Accounts/{creds.account_sid}/Messages.json",
+            body=urlencode({"To": message.to_number, "From": creds.from_number, "Body": message.body}),
+            headers={"Authorization": "Basic eDp5", "Content-Type": "application/x-www-form-urlencoded"},
+        )
+        connection.getresponse().read()
+        connection.close()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    numbers = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    latency = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.05
+
+    server = FakeTwilio(latency=latency, rate=rate, error_rate=0.01, seed=3).start()
+    credentials = {
+        clinic: Credentials(f"AC{clinic:032d}", f"token{clinic}", f"+1555{clinic:07d}") for clinic in range(numbers)
+    }
+    messages = [
+        OutboundMessage(i % numbers, f"+1212{i:07d}", f"Hi, this is a reminder of your appointment ({i}).")
+        for i in range(total)
+    ]
+    print(f"{total:,} messages from {numbers} numbers at {rate:g}/s each, {latency * 1000:.0f} ms per request")
+    print(f"floor set by the rate limits: {total / (numbers * rate):.0f} s")
+
+    sample = messages[:100]
+    began = time.perf_counter()
+    one_at_a_time(server.base_url, credentials, sample)
+    per_message = (time.perf_counter() - began) / len(sample)
+    print(f"one at a time      {per_message * 1000:6.1f} ms/message -> {per_message * total / 60:7.1f} min for the blast")
+    server.stats.clear()
+
+    concurrency = max(8, int(numbers * rate * latency * 2))
+    engine = OutboundEngine(HttpTransport(server.base_url, pool_size=concurrency), concurrency=concurrency,
+                            rate=rate, backoff=0.2, backoff_cap=2.0, seed=1)
+    with app.app_context():
+        db.create_all()
+        began = time.perf_counter()
+        sent = failed = 0
+        pending = []
+        for result in engine.iter_send(messages, credentials):
+            pending.append(result)
+            sent, failed = sent + bool(result.sid), failed + (not result.sid)
+            if len(pending) >= 500:
+                twilio_outbound.record(pending)
+                pending = []
+        twilio_outbound.record(pending)
+        elapsed = time.perf_counter() - began
+    print(f"engine (x{concurrency:<3})      {elapsed * 1000 / total:6.1f} ms/message -> {elapsed / 60:7.1f} min "
+          f"({total / elapsed:,.0f} msg/s)")
+    print(f"sent {sent:,}, failed {failed:,}, engine stats {engine.stats}")
+    print(f"fake server: {dict(server.stats)}")
+    engine.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Load test: throughput of a DB-backed page across gunicorn worker models.
+
+Starts gunicorn (with gunicorn.conf.py) once per configuration, drives
+/patients with concurrent clients for a fixed time and reports requests per
+second, latency percentiles and errors. Point DATABASE_URL at PostgreSQL to
+exercise the pooled engine profile from db_pool.py; by default it uses a
+throwaway SQLite file with a few thousand patients.
+
+Usage:
+    python benchmarks/bench_pool.py [seconds] [clients]
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_pool_'), 'bench.db')}")
+
+CONFIGS = [
+    {"GUNICORN_WORKER": "sync", "WEB_CONCURRENCY": "2"},
+    {"GUNICORN_WORKER": "sync", "WEB_CONCURRENCY": "4"},
+    {"GUNICORN_WORKER": "gthread", "WEB_CONCURRENCY": "2", "GUNICORN_THREADS": "4"},
+    {"GUNICORN_WORKER": "gthread", "WEB_CONCURRENCY": "4", "GUNICORN_THREADS": "8"},
+    {"GUNICORN_WORKER": "gevent", "WEB_CONCURRENCY": "2", "GUNICORN_CONNECTIONS": "100"},
+]
+
+
+def prepare_database():
+    from app import app
+    from models import db, Patient
+
+    with app.app_context():
+        db.create_all()
+        if Patient.query.count() == 0:
+            db.session.execute(Patient.__table__.insert(), [
+                {"first_name": f"First{i}", "last_name": f"Last{i}", "email": f"p{i}@example.com",
+                 "phone": f"+1{2000000000 + i:010d}"}
+                for i in range(5000)
+            ])
+            db.session.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not come up on {url}")
+
+
+def drive(url, seconds, clients):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(url, timeout=10).read()
+            except OSError:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    latencies.sort()
+    return latencies, errors
+
+
+def run(config, seconds, clients):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), **config)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    url = f"http://127.0.0.1:{port}/patients?per_page=50"
+    try:
+        wait_until_up(url)
+        latencies, errors = drive(url, seconds, clients)
+    finally:
+        server.terminate()
+        server.wait(10)
+    label = f"{config['GUNICORN_WORKER']} x{config['WEB_CONCURRENCY']}"
+    if config["GUNICORN_WORKER"] == "gthread":
+        label += f" ({config['GUNICORN_THREADS']} threads)"
+    if not latencies:
+        print(f"{label:<26} no successful requests ({errors} errors)")
+        return
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1e3  # noqa: E731
+    print(f"{label:<26} {len(latencies) / seconds:8,.0f} req/s   p50 {p(0.5):7.1f} ms   "
+          f"p99 {p(0.99):7.1f} ms   errors {errors}")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    prepare_database()
+    print(f"{clients} clients for {seconds:g}s each against /patients")
+    for config in CONFIGS:
+        if config["GUNICORN_WORKER"] == "gevent":
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print("gevent x2                  skipped (pip install gevent psycogreen)")
+                continue
+        run(config, seconds, clients)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: matching inbound texts against a clinic's quick-reply keywords.
+
+Builds an automaton over K keywords (default 300: the usual "confirm",
+"cancel", "address"... plus generated phrases) and times
+QuickReplyCache-style matching (normalize + Automaton.best) on typical
+inbound texts, against checking every keyword with its own regex.
+
+Usage:
+    python benchmarks/bench_quick_replies.py [keywords] [texts]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quick_replies import Automaton, normalize  # noqa: E402
+
+BASE = ["confirm", "yes", "cancel", "cancel appointment", "reschedule", "address", "where are you",
+        "opening hours", "parking", "insurance", "refill", "stop", "help"]
+TEXTS = [
+    "Yes, confirm", "I need to cancel my appointment tomorrow", "what's your address?",
+    "Hi! Running 10 minutes late, sorry about that, will be there soon",
+    "Can I reschedule to next Tuesday afternoon?", "Do you take Blue Cross insurance?",
+    "Thanks so much for the reminder, see you then",
+]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    texts = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    rng = random.Random(5)
+    words = ["lab", "results", "billing", "covid", "vaccine", "x ray", "referral", "fax", "portal", "records"]
+    keywords = list(BASE)
+    while len(keywords) < count:
+        phrase = " ".join(rng.sample(words, rng.randint(1, 3)))
+        if phrase not in keywords:
+            keywords.append(phrase)
+    began = time.perf_counter()
+    automaton = Automaton([(keyword, index) for index, keyword in enumerate(keywords)])
+    print(f"{len(keywords)} keywords, built in {(time.perf_counter() - began) * 1000:.1f} ms")
+
+    inputs = [rng.choice(TEXTS) for _ in range(texts)]
+    began = time.perf_counter()
+    hits = sum(automaton.best(normalize(text)) is not None for text in inputs)
+    elapsed = time.perf_counter() - began
+    print(f"automaton   {elapsed / texts * 1e6:6.2f} us/text ({hits:,} of {texts:,} matched)")
+
+    patterns = [re.compile(rf"\b{re.escape(keyword)}\b", re.IGNORECASE) for keyword in keywords]
+    sample = inputs[:max(texts // 20, 1)]
+    began = time.perf_counter()
+    for text in sample:
+        [pattern for pattern in patterns if pattern.search(text)]
+    elapsed = time.perf_counter() - began
+    print(f"per keyword {elapsed / len(sample) * 1e6:6.2f} us/text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: how soon after its send_time a reminder goes out.
+
+Schedules reminders at RATE per hour (default 100,000, about 28 a second)
+over SECONDS seconds starting now, runs one reminders.Dispatcher against
+them with FakeTwilioSender (LATENCY ms per send) and reports the delay
+between each reminder's send_time and the moment the fake accepted it.
+The target is under a second at p99.
+
+Usage:
+    python benchmarks/bench_reminders.py [seconds] [rate per hour] [latency ms]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_rem_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+from models import db, Reminder  # noqa: E402
+import reminders  # noqa: E402
+
+TARGET_SECONDS = 1.0
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    count = int(seconds * rate / 3600)
+
+    with app.app_context():
+        db.create_all()
+        # Start a little ahead so inserting the rows isn't part of the delay.
+        began = time.time() + 2
+        due_at = {}
+        rows = []
+        for i in range(count):
+            at = began + i * seconds / count
+            phone = f"+1999{i:07d}"
+            due_at[phone] = at
+            rows.append({"phone": phone, "message": f"Reminder {i}", "send_time": datetime.utcfromtimestamp(at),
+                         "status": "pending", "attempts": 0, "created_at": datetime.utcnow()})
+        with db.engine.begin() as conn:
+            conn.execute(Reminder.__table__.insert(), rows)
+        print(f"{count:,} reminders over {seconds:.0f}s ({rate:,.0f}/hour), {latency * 1000:.0f} ms per send, "
+              f"{db.engine.dialect.name}")
+
+    sender = reminders.FakeTwilioSender(latency=latency)
+    dispatcher = reminders.Dispatcher(app, sender=sender)
+    dispatcher.generate_every = float("inf")
+    stop = threading.Event()
+    thread = threading.Thread(target=dispatcher.run, args=(stop,))
+    thread.start()
+    deadline = time.time() + seconds + 2 + 30
+    while len(sender.sent) < count and time.time() < deadline:
+        time.sleep(0.2)
+    stop.set()
+    thread.join()
+
+    delays = sorted(message["at"] - due_at[message["to"]] for message in sender.sent)
+    if not delays:
+        print("nothing was sent")
+        return
+    p50, p99 = delays[len(delays) // 2], delays[min(int(len(delays) * 0.99), len(delays) - 1)]
+    print(f"sent {len(delays):,}/{count:,}")
+    print(f"delay after send_time   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms   max {delays[-1] * 1000:7.1f} ms")
+    print(f"target p99 < {TARGET_SECONDS:.0f}s: {'met' if p99 < TARGET_SECONDS else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark: per-request cost of rendering the dashboard layout.
+
+Compares the old approach (render_template_string on the layout source,
+which parses and compiles it on every call) with the compiled, cached
+layout from rendering.get_layout(), and a cold compile with and without the
+on-disk bytecode cache.
+
+Usage:
+    python benchmarks/bench_render.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("TEMPLATE_CACHE_DIR", tempfile.mkdtemp(prefix="jinja_cache_"))
+
+from flask import render_template_string  # noqa: E402
+from jinja2 import FileSystemBytecodeCache  # noqa: E402
+
+from app import app  # noqa: E402
+from rendering import LAYOUT_TEMPLATE, render_dashboard  # noqa: E402
+
+BODY = "<p>" + "benchmark body " * 50 + "</p>"
+
+
+def timed(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / iterations * 1e6:10.1f} µs/render")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(os.path.join(app.root_path, "templates", LAYOUT_TEMPLATE)) as fh:
+        source = fh.read()
+
+    with app.test_request_context("/"):
+        timed("render_template_string (before)",
+              lambda: render_template_string(source, title="Home", body=BODY), iterations)
+        timed("compiled layout (after)",
+              lambda: render_dashboard("Home", BODY), iterations)
+
+        # Cold start: a fresh environment loading the layout for the first time.
+        def cold(bytecode_cache):
+            env = app.create_jinja_environment()
+            env.bytecode_cache = bytecode_cache
+            env.get_template(LAYOUT_TEMPLATE)
+
+        cache = FileSystemBytecodeCache(os.environ["TEMPLATE_CACHE_DIR"])
+        cold(cache)  # make sure the cache is populated
+        timed("cold load, no bytecode cache", lambda: cold(None), 200)
+        timed("cold load, bytecode cache", lambda: cold(cache), 200)
+
+
+if __name__ == "__main__":
+    main()
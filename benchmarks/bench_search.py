@@ -0,0 +1,83 @@
+"""
+Benchmark: patient typeahead search latency.
+
+Loads N generated patients with seed-scale (skipped if the table already
+has that many), then times patient_search.search() for typical receptionist
+input: partial names, full names with typos, the last digits of a phone
+number, a full number and an email prefix. The target is < 20 ms per lookup.
+
+Runs against DATABASE_URL: PostgreSQL (after `flask db upgrade`) uses the
+pg_trgm/tsvector indexes, anything else the in-memory index.
+
+Usage:
+    python benchmarks/bench_search.py [patients, e.g. 2M] [repeats]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_search_'), 'bench.db')}")
+
+from app import app  # noqa: E402
+import patient_search  # noqa: E402
+from models import db, Patient  # noqa: E402
+from seed_scale import FIRST_NAMES, LAST_NAMES, parse_count, patient_phone, run_seed_scale  # noqa: E402
+
+TARGET_MS = 20
+
+
+def queries(rng, max_id):
+    pid = rng.randint(1, max_id)
+    first, last = rng.choice(FIRST_NAMES).lower(), rng.choice(LAST_NAMES).lower()
+    typo = lambda word: word[:1] + word[2] + word[1] + word[3:] if len(word) > 3 else word  # noqa: E731
+    return {
+        "name prefix": f"{first[:2]} {last[:3]}",
+        "full name": f"{first} {last}",
+        "name with typo": f"{typo(first)} {typo(last)}",
+        "single word": last[:4],
+        "phone last 4": patient_phone(pid)[-4:],
+        "full phone": patient_phone(pid),
+        "email prefix": f"patient{pid}@",
+    }
+
+
+def main():
+    patients = parse_count(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with app.app_context():
+        db.create_all()
+        existing = Patient.query.count()
+        if existing < patients:
+            print(f"Loading {patients - existing:,} patients...")
+            run_seed_scale(clinics=10, doctors=0, patients=patients - existing, appointments=0,
+                           twilio_logs=0, seed=7, batch_size=50000, workers=1)
+        max_id = db.session.query(db.func.max(Patient.id)).scalar()
+        print(f"{max_id:,} patients, {db.engine.dialect.name}")
+
+        start = time.perf_counter()
+        patient_search.search("warm up")
+        print(f"{'first search (index build)':<28} {(time.perf_counter() - start) * 1e3:9.1f} ms")
+
+        rng = random.Random(1)
+        timings = {}
+        for _ in range(repeats):
+            for kind, query in queries(rng, max_id).items():
+                start = time.perf_counter()
+                results = patient_search.search(query)
+                timings.setdefault(kind, []).append((time.perf_counter() - start) * 1e3)
+                if kind in ("full phone", "email prefix"):
+                    assert results, f"no match for {query!r}"
+        worst = 0
+        for kind, samples in timings.items():
+            samples.sort()
+            p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+            worst = max(worst, p99)
+            print(f"{kind:<28} p50 {p50:6.2f} ms   p99 {p99:6.2f} ms   max {samples[-1]:6.2f} ms")
+        print(f"worst p99 {worst:.2f} ms — {'OK' if worst < TARGET_MS else 'OVER'} (target {TARGET_MS} ms)")
+
+
+if __name__ == "__main__":
+    main()
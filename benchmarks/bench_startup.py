@@ -0,0 +1,143 @@
+"""
+Benchmark: cold start, from a fresh interpreter to the first response.
+
+Render's free plan stops the service when it is idle, so the first request
+after that waits for the whole boot. This measures it three ways, RUNS times
+each, in fresh processes:
+
+  * `python -X importtime -c "import app"`: the import tree, with the
+    modules that cost the most;
+  * interpreter start -> create_app() -> first response from the test client;
+  * `gunicorn -c gunicorn.conf.py app:app` started -> first HTTP 200, with
+    --preload on and off.
+
+It exits with status 1 when the median time to the first response under
+gunicorn is above TARGET seconds, so it can run as a check after changes to
+imports or init_app()s.
+
+Usage:
+    python benchmarks/bench_startup.py [runs] [target seconds]
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds from `gunicorn` to the first response on a developer machine: about
+# 0.41 s now, 0.50 s back when alembic loaded with the app. A regression in
+# imports or init_app()s shows up here before it shows up on Render.
+TARGET = 0.45
+
+# Only needed by some routes or CLI commands; none should load with the app.
+DEFERRED = ("flask_migrate", "alembic", "openpyxl", "reportlab", "cryptography", "numpy", "pandas", "twilio")
+
+FIRST_RESPONSE = """
+import time
+began = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+status = app.test_client().get("/").status_code
+print(imported - began, time.perf_counter() - imported, status)
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_boot_'), 'bench.db')}")
+    env.setdefault("TEMPLATE_CACHE_DIR", tempfile.mkdtemp(prefix="bench_boot_jinja_"))
+    env.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="bench_boot_metrics_"))
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    return env
+
+
+def import_profile(env):
+    """Seconds to import app; [(cumulative seconds, module)] for what it imports directly, largest
+    first; and the names of every module loaded on the way."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    total, children, loaded = None, [], set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        loaded.add(name.strip())
+        if name.strip() == "app" and depth == 0:
+            total = int(cumulative) / 1e6
+        elif depth == 1:
+            children.append((int(cumulative) / 1e6, name.strip()))
+    return total, sorted(children, reverse=True), loaded
+
+
+def first_response(env):
+    began = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", FIRST_RESPONSE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    total = time.perf_counter() - began
+    imported, request, status = result.stdout.split()
+    assert status == "200", result.stdout
+    return total, float(imported), float(request)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn_first_response(env, preload, timeout=30.0):
+    port = free_port()
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY="2", GUNICORN_PRELOAD="1" if preload else "0")
+    began = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], cwd=ROOT,
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - began < timeout:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - began
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"gunicorn did not answer within {timeout:g}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    target = float(sys.argv[2]) if len(sys.argv) > 2 else TARGET
+    env = environment()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env, check=True)  # warm .pyc and jinja caches
+
+    total, children, loaded = import_profile(env)
+    print(f"import app: {total * 1000:.0f} ms; largest direct imports:")
+    for seconds, name in children[:8]:
+        print(f"  {seconds * 1000:7.1f} ms  {name}")
+    heavy = [name for name in DEFERRED if name in loaded]
+    print(f"  libraries that should load on first use but loaded at import: {', '.join(heavy) or 'none'}")
+
+    samples = [first_response(env) for _ in range(runs)]
+    print(f"python -> first response: {statistics.median(s[0] for s in samples) * 1000:.0f} ms median "
+          f"(import + create_app {statistics.median(s[1] for s in samples) * 1000:.0f} ms, "
+          f"first request {statistics.median(s[2] for s in samples) * 1000:.1f} ms)")
+
+    results = {}
+    for preload in (True, False):
+        results[preload] = statistics.median(gunicorn_first_response(env, preload) for _ in range(runs))
+        print(f"gunicorn (preload {'on ' if preload else 'off'}) -> first response: {results[preload] * 1000:.0f} ms median")
+
+    ok = results[True] <= target
+    print(f"target {target * 1000:.0f} ms: {'ok' if ok else 'MISSED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+A local stand-in for Twilio's Messages API, for the outbound benchmarks.
+
+    server = FakeTwilio(latency=0.05, rate=10, error_rate=0.01).start()
+    ... HttpTransport(server.base_url) ...
+    server.stop()
+
+POST /2010-04-01/Accounts/<sid>/Messages.json answers 201 with a message
+SID after `latency` seconds, over HTTP/1.1 keep-alive. Like the carriers
+behind Twilio, it holds each From number to `rate` messages/second
+(answering 429 with Retry-After beyond that), and fails `error_rate` of
+the requests with a 503. `stats` counts what it saw.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.fake.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        fake.count("requests")
+        if not self.path.endswith("/Messages.json") or not self.headers.get("Authorization"):
+            self._reply(404, {"code": 20404, "message": "Not found"})
+            return
+        time.sleep(fake.latency)
+        from_number = form.get("From", [""])[0]
+        if not fake.allow(from_number):
+            fake.count("throttled")
+            self._reply(429, {"code": 20429, "message": "Too Many Requests"}, {"Retry-After": "1"})
+            return
+        if fake.fail():
+            fake.count("errors")
+            self._reply(503, {"code": 20503, "message": "Service Unavailable"})
+            return
+        fake.count("accepted")
+        self._reply(201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued",
+                          "to": form.get("To", [""])[0], "from": from_number})
+
+
+class FakeTwilio:
+    def __init__(self, latency=0.05, rate=None, error_rate=0.0, seed=None, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.rate = rate
+        self.error_rate = error_rate
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._allowance = {}  # From -> (tokens, updated)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-twilio", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def allow(self, from_number):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            # Two messages of slack: network jitter can bunch a paced sender's requests up.
+            tokens, updated = self._allowance.get(from_number, (2.0, now))
+            tokens = min(2.0, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1.0
+            self._allowance[from_number] = (tokens - 1.0 if allowed else tokens, now)
+            return allowed
+
+    def fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
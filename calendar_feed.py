@@ -0,0 +1,176 @@
+"""
+FullCalendar event feed: /appointments/feed?start=&end=[&doctor=][&clinic_id=].
+
+FullCalendar fetches the visible range as the user pages through weeks,
+so a response holds a week or a month of appointments rather than the
+clinic's whole history.
+
+Responses are cached per (clinic, doctor, range) for CALENDAR_FEED_TTL
+seconds and carry an ETag, so a calendar re-fetching an unchanged week
+gets a 304. Cache keys include the clinic's appointment counter from
+cache_versions. Every appointment insert, update or delete bumps that
+counter in the same transaction (appointments without a clinic bump
+"appointments:clinic:none"). A write in any worker therefore makes that
+clinic's cached weeks unreachable at once. The feed across all clinics (no
+clinic_id) is keyed on the sum of those counters instead of a counter of
+its own, so appointment writes in different clinics never contend on one
+row. Rows written around the ORM (seed-scale's COPY) show up only when the
+TTL runs out.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from itertools import chain
+
+from flask import abort, current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from availability import MAX_DURATION, parse_iso
+from models import db, Appointment, Patient
+from versions import bump_version, read_version, read_version_total
+
+DEFAULTS = {
+    "CALENDAR_FEED_TTL": 30.0,
+    "CALENDAR_FEED_CACHE_SIZE": 512,
+}
+MAX_DAYS = 62  # a month view shows six weeks
+
+
+VERSION_PREFIX = "appointments:clinic:"
+
+
+def version_name(clinic_id):
+    return f"{VERSION_PREFIX}{'none' if clinic_id is None else clinic_id}"
+
+
+# -------------------------------------------------
+# Cache
+# -------------------------------------------------
+class FeedCache:
+    def __init__(self, ttl=30.0, size=512):
+        self.ttl = ttl
+        self.size = size
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()  # key -> (expires_at, body, etag)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return entry[1], entry[2]
+
+    def put(self, key, body, etag):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions["calendar_feed"] = FeedCache(
+        ttl=float(app.config["CALENDAR_FEED_TTL"]), size=int(app.config["CALENDAR_FEED_CACHE_SIZE"])
+    )
+
+
+def get_cache():
+    return current_app.extensions["calendar_feed"]
+
+
+# -------------------------------------------------
+# Feed
+# -------------------------------------------------
+def _parse(value, name):
+    try:
+        return parse_iso(value)
+    except (TypeError, ValueError):
+        abort(400, f"{name} must be an ISO date or datetime")
+
+
+def parse_request(args):
+    """(start, end, doctor id, clinic id) from FullCalendar's query args; aborts with 400."""
+    start, end = _parse(args.get("start"), "start"), _parse(args.get("end"), "end")
+    if end <= start or end - start > timedelta(days=MAX_DAYS):
+        abort(400, f"end must be after start and at most {MAX_DAYS} days later")
+    return start, end, args.get("doctor", type=int), args.get("clinic_id", type=int)
+
+
+def events(start, end, doctor_id=None, clinic_id=None):
+    """FullCalendar event objects for appointments overlapping [start, end)."""
+    query = (
+        select(Appointment.id, Appointment.doctor_id, Appointment.scheduled_time, Appointment.duration_minutes,
+               Appointment.reason, Patient.first_name, Patient.last_name)
+        .outerjoin(Patient, Patient.id == Appointment.patient_id)
+        .where(
+            Appointment.scheduled_time > start - timedelta(minutes=MAX_DURATION),
+            Appointment.scheduled_time < end,
+        )
+        .order_by(Appointment.scheduled_time)
+    )
+    if doctor_id is not None:
+        query = query.where(Appointment.doctor_id == doctor_id)
+    if clinic_id is not None:
+        query = query.where(Appointment.clinic_id == clinic_id)
+    items = []
+    for row in db.session.execute(query):
+        finish = row.scheduled_time + timedelta(minutes=row.duration_minutes or 30)
+        if finish <= start:
+            continue
+        title = f"{row.first_name} {row.last_name}" if row.first_name else "Appointment"
+        items.append({
+            "id": row.id,
+            "title": f"{title} · {row.reason}" if row.reason else title,
+            "start": row.scheduled_time.isoformat(),
+            "end": finish.isoformat(),
+            "extendedProps": {"doctor_id": row.doctor_id},
+        })
+    return items
+
+
+def feed(start, end, doctor_id=None, clinic_id=None):
+    """(JSON body, etag) for the range, from the cache when the clinic hasn't changed."""
+    conn = db.session.connection()
+    if clinic_id is None:
+        version = read_version_total(conn, VERSION_PREFIX)
+    else:
+        version = read_version(conn, version_name(clinic_id))
+    key = (clinic_id, doctor_id, start, end, version)
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    body = json.dumps(events(start, end, doctor_id, clinic_id), separators=(",", ":"))
+    etag = hashlib.sha1(body.encode()).hexdigest()
+    cache.put(key, body, etag)
+    return body, etag
+
+
+# -------------------------------------------------
+# Invalidation
+# -------------------------------------------------
+# A committed appointment is expired (expire_on_commit), so moving it to
+# another clinic would record no old clinic_id in its history. active_history
+# loads it first, so the hook below bumps the clinic it left too.
+event.listen(Appointment.clinic_id, "set", lambda *args: None, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _appointments_flushed(session, flush_context):
+    clinics = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Appointment):
+            # The clinic it was in and the one it is in now.
+            clinics.update(inspect(obj).attrs.clinic_id.history.sum())
+            clinics.add(obj.clinic_id)
+    for name in sorted(map(version_name, clinics)):  # a fixed lock order across transactions
+        bump_version(session.connection(), name)
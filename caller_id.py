@@ -0,0 +1,209 @@
+"""
+Caller ID: who is calling (or texting) which clinic.
+
+The first thing an inbound call or SMS needs is `To` -> clinic and
+`From` -> patient, before the greeting is spoken. The clinic comes from
+the in-process clinic registry. The patient comes from
+patients.phone_e164, the E.164 form of Patient.phone. An ORM hook keeps
+that column current, and migration 0009 backfills it and adds a unique
+(clinic_id, phone_e164) index, so it is a single index probe. A number
+shared within a clinic (a family phone) identifies whoever had it first;
+the others keep their phone but get no phone_e164.
+
+Answers are kept in a per-process LRU keyed by (clinic id, E.164 number):
+
+  * known callers for CALLER_ID_TTL seconds;
+  * unknown numbers (None) for CALLER_ID_NEGATIVE_TTL seconds, so a
+    robocaller or a new patient dialling again doesn't hit the database
+    on every ring.
+
+Patient changes committed in this process evict the affected keys
+(old and new number) right away. Changes made by other workers show up
+once the entry expires, which is why the negative TTL is short.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from clinic_registry import get_registry
+from models import db, Patient
+from phones import to_e164
+
+DEFAULTS = {
+    "CALLER_ID_CACHE_SIZE": 50000,
+    "CALLER_ID_TTL": 300.0,
+    "CALLER_ID_NEGATIVE_TTL": 30.0,
+}
+
+
+@dataclass(frozen=True)
+class Caller:
+    patient_id: int
+    first_name: str
+    last_name: str
+    clinic_id: int
+
+
+@event.listens_for(Patient, "before_insert")
+@event.listens_for(Patient, "before_update")
+def _normalize_phone(mapper, connection, target):
+    e164 = to_e164(target.phone)
+    if e164 is not None and target.clinic_id is not None and (
+        e164 != target.phone_e164 or inspect(target).attrs.clinic_id.history.has_changes()
+    ):
+        # Migration 0009's rule for shared (family) numbers: whoever has the
+        # number in the clinic keeps it, later patients get no caller-ID key.
+        key = (target.clinic_id, e164)
+        claimed = object_session(target).info.setdefault("caller_id_claimed", set())
+        holder = select(Patient.id).where(Patient.clinic_id == target.clinic_id, Patient.phone_e164 == e164)
+        if target.id is not None:
+            holder = holder.where(Patient.id != target.id)
+        if key in claimed or connection.execute(holder.limit(1)).first() is not None:
+            e164 = None
+        else:
+            claimed.add(key)
+    target.phone_e164 = e164
+
+
+@event.listens_for(Session, "after_flush")
+@event.listens_for(Session, "after_rollback")
+def _forget_claimed(session, *args):
+    session.info.pop("caller_id_claimed", None)
+
+
+# -------------------------------------------------
+# Cache
+# -------------------------------------------------
+class CallerCache:
+    def __init__(self, size=50000, ttl=300.0, negative_ttl=30.0):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()  # (clinic_id, e164) -> (expires_at, Caller | None)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(True, Caller | None) when cached, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats["hits" if entry[1] is not None else "negative_hits"] += 1
+            return True, entry[1]
+
+    def put(self, key, caller):
+        expires_at = time.monotonic() + (self.ttl if caller is not None else self.negative_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, caller)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions["caller_id"] = CallerCache(
+        size=int(app.config["CALLER_ID_CACHE_SIZE"]),
+        ttl=float(app.config["CALLER_ID_TTL"]),
+        negative_ttl=float(app.config["CALLER_ID_NEGATIVE_TTL"]),
+    )
+
+
+def get_cache():
+    return current_app.extensions["caller_id"]
+
+
+# -------------------------------------------------
+# Lookup
+# -------------------------------------------------
+def find_patient(clinic_id, e164):
+    row = db.session.execute(
+        select(Patient.id, Patient.first_name, Patient.last_name)
+        .where(Patient.clinic_id == clinic_id, Patient.phone_e164 == e164)
+    ).first()
+    return Caller(row.id, row.first_name, row.last_name, clinic_id) if row is not None else None
+
+
+def identify(from_number, to_number):
+    """(clinic entry or None, Caller or None) for an inbound call or message."""
+    clinic = get_registry().by_number(to_number)
+    e164 = to_e164(from_number)
+    if clinic is None or e164 is None:
+        return clinic, None
+    cache = get_cache()
+    key = (clinic.id, e164)
+    cached, caller = cache.get(key)
+    if not cached:
+        caller = find_patient(clinic.id, e164)
+        cache.put(key, caller)
+    return clinic, caller
+
+
+def greeting(clinic, caller):
+    name = clinic.name if clinic is not None else "the clinic"
+    if caller is None:
+        return f"Thank you for calling {name}. How can we help you today?"
+    return f"Hi {caller.first_name}, thank you for calling {name}. How can we help you today?"
+
+
+# -------------------------------------------------
+# Invalidation
+# -------------------------------------------------
+def _keys(patient):
+    """Cache keys a pending Patient change touches: its stored and its new number."""
+    # Read the attributes first: that loads them if the object was expired.
+    stored, clinic_id = patient.phone_e164, patient.clinic_id
+    state = inspect(patient)
+    # before_flush: the hook recomputes phone_e164 later in this flush.
+    numbers = {stored, to_e164(patient.phone)} | set(state.attrs.phone_e164.history.sum())
+    clinics = {clinic_id} | set(state.attrs.clinic_id.history.sum())
+    clinic = state.dict.get("clinic")  # assigned through the relationship, not yet flushed
+    if clinic is not None:
+        clinics.add(clinic.id)
+    return {(clinic_id, e164) for clinic_id in clinics for e164 in numbers
+            if clinic_id is not None and e164 is not None}
+
+
+@event.listens_for(Session, "before_flush")
+def _track_callers(session, flush_context, instances):
+    if "caller_id" not in current_app.extensions:
+        return
+    keys = session.info.setdefault("caller_id_keys", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Patient):
+            keys |= _keys(obj)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_callers(session):
+    keys = session.info.pop("caller_id_keys", None)
+    if keys:
+        get_cache().discard(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_callers(session):
+    session.info.pop("caller_id_keys", None)
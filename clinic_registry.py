@@ -0,0 +1,254 @@
+"""
+In-process clinic registry.
+
+Every inbound webhook has to turn a Twilio number into a clinic and its
+(Fernet-encrypted) credentials. The registry loads all clinics in one query,
+decrypts their tokens once and keeps them in dicts keyed by id, twilio_number
+and slug, so a lookup is a dict get: no DB round trip, no decrypt.
+
+The dicts live in an immutable snapshot that is swapped wholesale on reload,
+so readers never take a lock. A snapshot is replaced when:
+
+  * a Clinic is inserted, updated or deleted in this process (after commit);
+  * another worker did so: clinic edits bump the "clinics" row in
+    cache_versions, which a background thread polls every
+    CLINIC_REGISTRY_POLL_INTERVAL seconds (0 turns the shared counter off);
+  * it is older than CLINIC_REGISTRY_TTL seconds, as a backstop.
+
+APP_ENC_KEY may hold several comma-separated Fernet keys (newest first) while
+a key is being rotated. Tokens that fail to decrypt are logged and left out.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import db, Clinic
+from phones import to_e164
+from versions import bump_version, read_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "CLINIC_REGISTRY_TTL": 300.0,
+    "CLINIC_REGISTRY_POLL_INTERVAL": 5.0,
+}
+VERSION_NAME = "clinics"
+
+
+@dataclass(frozen=True)
+class ClinicEntry:
+    id: int
+    name: str
+    slug: str
+    twilio_number: str
+    account_sid: str
+    auth_token: str
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    by_id: dict
+    by_number: dict
+    by_slug: dict
+    version: int
+    loaded_at: float
+
+
+# -------------------------------------------------
+# Credentials
+# -------------------------------------------------
+def _fernet(key=None):
+    key = key if key is not None else os.environ.get("APP_ENC_KEY")
+    if not key:
+        return None
+    from cryptography.fernet import Fernet, MultiFernet
+
+    return MultiFernet([Fernet(k.strip()) for k in key.split(",") if k.strip()])
+
+
+def encrypt_token(token, key=None):
+    """Encrypt a Twilio auth token for Clinic.twilio_token."""
+    fernet = _fernet(key)
+    if fernet is None:
+        raise RuntimeError("APP_ENC_KEY is not set")
+    return fernet.encrypt(token.encode()).decode()
+
+
+def _decrypt(fernet, clinic_id, value):
+    if not value:
+        return None
+    if fernet is None:
+        return value  # no key configured: tokens are stored as-is (local dev)
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return fernet.decrypt(value.encode()).decode()
+    except InvalidToken:
+        logger.warning("Could not decrypt the Twilio token of clinic %s", clinic_id)
+        return None
+
+
+# -------------------------------------------------
+# Registry
+# -------------------------------------------------
+class ClinicRegistry:
+    def __init__(self, app):
+        self.app = app
+        self.ttl = float(app.config.get("CLINIC_REGISTRY_TTL", DEFAULTS["CLINIC_REGISTRY_TTL"]))
+        self.poll_interval = float(
+            app.config.get("CLINIC_REGISTRY_POLL_INTERVAL", DEFAULTS["CLINIC_REGISTRY_POLL_INTERVAL"])
+        )
+        self.shared = self.poll_interval > 0
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0}
+        self._snapshot = None
+        self._dirty = False
+        self._lock = threading.Lock()  # one reload at a time
+        self._counter_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    # -------------------------------------------------
+    # Lookups
+    # -------------------------------------------------
+    def get(self, clinic_id):
+        return self._lookup(self._current().by_id, clinic_id)
+
+    def by_number(self, twilio_number):
+        """Clinic owning `twilio_number`, as Twilio sends it (E.164) or as typed."""
+        snapshot = self._current()
+        if twilio_number not in snapshot.by_number:
+            twilio_number = to_e164(twilio_number) or twilio_number
+        return self._lookup(snapshot.by_number, twilio_number)
+
+    def by_slug(self, slug):
+        return self._lookup(self._current().by_slug, slug)
+
+    def _lookup(self, index, key):
+        entry = index.get(key)
+        with self._counter_lock:
+            self.stats["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None or self._dirty:
+            snapshot = self.reload()
+        if not self._poller_running():
+            self._start_poller()
+            if time.monotonic() - snapshot.loaded_at > self.ttl:
+                snapshot = self.reload()
+        return snapshot
+
+    # -------------------------------------------------
+    # Loading
+    # -------------------------------------------------
+    def reload(self):
+        with self._lock:
+            self._dirty = False
+            with self.app.app_context():
+                with db.engine.connect() as conn:
+                    version = read_version(conn, VERSION_NAME) if self.shared else 0
+                    rows = conn.execute(select(
+                        Clinic.id, Clinic.name, Clinic.slug, Clinic.twilio_number,
+                        Clinic.twilio_sid, Clinic.twilio_token,
+                    )).all()
+            fernet = _fernet(self.app.config.get("APP_ENC_KEY"))
+            entries = [
+                ClinicEntry(row.id, row.name, row.slug, row.twilio_number, row.twilio_sid,
+                            _decrypt(fernet, row.id, row.twilio_token))
+                for row in rows
+            ]
+            snapshot = _Snapshot(
+                by_id={entry.id: entry for entry in entries},
+                by_number={
+                    number: entry
+                    for entry in entries if entry.twilio_number
+                    for number in {entry.twilio_number, to_e164(entry.twilio_number)} if number
+                },
+                by_slug={entry.slug: entry for entry in entries},
+                version=version,
+                loaded_at=time.monotonic(),
+            )
+            self._snapshot = snapshot
+            with self._counter_lock:
+                self.stats["reloads"] += 1
+            return snapshot
+
+    def invalidate(self):
+        """Reload on the next lookup."""
+        self._dirty = True
+
+    # -------------------------------------------------
+    # Background refresh
+    # -------------------------------------------------
+    def _poller_running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive() and self._pid == os.getpid()
+
+    def _start_poller(self):
+        # Like the audit flusher, a forked gunicorn worker starts its own.
+        with self._lock:
+            if self._poller_running():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._poll, name="clinic-registry", daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        pid = os.getpid()
+        interval = self.poll_interval if self.shared else self.ttl
+        while self._pid == pid:
+            time.sleep(interval)
+            snapshot = self._snapshot
+            try:
+                if time.monotonic() - snapshot.loaded_at > self.ttl:
+                    self.reload()
+                elif self.shared:
+                    with self.app.app_context():
+                        with db.engine.connect() as conn:
+                            version = read_version(conn, VERSION_NAME)
+                    if version != snapshot.version:
+                        self.reload()
+            except Exception:
+                logger.exception("Clinic registry refresh failed; keeping the current snapshot")
+
+
+def init_app(app):
+    app.extensions["clinic_registry"] = ClinicRegistry(app)
+
+
+def get_registry():
+    return current_app.extensions["clinic_registry"]
+
+
+# -------------------------------------------------
+# Invalidation
+# -------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _clinics_flushed(session, flush_context):
+    if not any(isinstance(obj, Clinic) for obj in chain(session.new, session.dirty, session.deleted)):
+        return
+    registry = current_app.extensions.get("clinic_registry")
+    if registry is None:
+        return
+    session.info["clinics_changed"] = True
+    if registry.shared:
+        bump_version(session.connection(), VERSION_NAME)
+
+
+@event.listens_for(Session, "after_commit")
+def _clinics_committed(session):
+    if session.info.pop("clinics_changed", False):
+        get_registry().invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clinics_rolled_back(session):
+    session.info.pop("clinics_changed", None)
@@ -0,0 +1,316 @@
+"""
+Row counts for the dashboard tiles without a COUNT(*) per page load.
+
+The superadmin page shows how many users, clinics, appointments and audit
+log entries there are. On PostgreSQL, COUNT(*) over tens of millions of
+audit rows is a full scan, so each tile reads its count in one of two ways:
+
+  exact        The counters table, kept by triggers on the counted tables
+               (migration 0014). Triggers see every write, including the audit
+               sink's bulk inserts, COPY and retention DELETEs. On PostgreSQL,
+               one statement trigger per INSERT/DELETE/TRUNCATE adds the
+               statement's row count to a slot picked by the backend's pid
+               (SLOTS rows per table), so concurrent writers don't queue on
+               one row. A read sums at most SLOTS rows.
+  approximate  PostgreSQL's own estimate: pg_class.reltuples per partition,
+               scaled to each partition's current size the way the planner
+               does. It costs a catalog lookup and is usually within a few
+               percent. When a table has no usable estimate (never analyzed,
+               or not PostgreSQL), the tile reads the exact count instead.
+
+Each worker keeps the last value of every tile. A tile is re-read once it is
+older than its staleness budget (COUNTERS: table -> (mode, seconds)). A
+background thread re-reads tiles when they are halfway through their budget,
+so the dashboard normally renders from memory. A read never scans the counted
+table. The only exception is a database whose counters were never seeded
+(built with db.create_all()): COUNT(*) is used there until `flask
+counters-recount` installs the triggers and takes the counts. seed-scale,
+seed_demo.py and the test fixtures recount after building their tables.
+
+Retention (partitions.py) detaches whole partitions, which no trigger sees.
+It subtracts the partition's rows in the same transaction.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import click
+from flask import current_app
+from sqlalchemy import func, select, table, text
+
+from models import db, Counter
+
+logger = logging.getLogger(__name__)
+
+EXACT = "exact"
+APPROXIMATE = "approximate"
+
+# Tables with counter triggers.
+TABLES = ("users", "clinics", "appointments", "audit_logs")
+SLOTS = 16
+
+DEFAULTS = {
+    # table: (mode, staleness budget in seconds)
+    "COUNTERS": {
+        "users": (EXACT, 60),
+        "clinics": (EXACT, 300),
+        "appointments": (EXACT, 30),
+        "audit_logs": (APPROXIMATE, 300),
+    },
+    "COUNTERS_REFRESH_INTERVAL": 1.0,  # how often the refresher looks for tiles due
+}
+
+
+@dataclass(frozen=True)
+class Count:
+    value: int
+    approximate: bool
+    loaded_at: float  # time.monotonic()
+
+
+# -------------------------------------------------
+# Reading
+# -------------------------------------------------
+def exact_counts(conn, tables):
+    """{table: rows} from the counters table, with COUNT(*) for tables it has no rows for."""
+    rows = conn.execute(
+        select(Counter.name, func.sum(Counter.value)).where(Counter.name.in_(tables)).group_by(Counter.name)
+    ).all()
+    result = {name: int(value) for name, value in rows}
+    for name in tables:
+        if name not in result:
+            logger.warning("No counter rows for %s; counting it. Run `flask counters-recount`.", name)
+            result[name] = conn.execute(select(func.count()).select_from(table(name))).scalar()
+    return result
+
+
+APPROXIMATE_SQL = text("""
+    SELECT n.name,
+           SUM(CASE
+                 WHEN c.reltuples >= 0 AND c.relpages > 0
+                   THEN c.reltuples / c.relpages * (pg_relation_size(c.oid) / current_setting('block_size')::int)
+                 WHEN c.reltuples >= 0 THEN c.reltuples
+                 WHEN pg_relation_size(c.oid) = 0 THEN 0
+               END) AS estimate,
+           bool_or(c.reltuples < 0 AND pg_relation_size(c.oid) > 0) AS unknown
+    FROM unnest(CAST(:names AS text[])) AS n(name)
+    JOIN pg_class parent ON parent.oid = to_regclass(n.name)
+    LEFT JOIN pg_inherits i ON i.inhparent = parent.oid
+    JOIN pg_class c ON c.oid = COALESCE(i.inhrelid, parent.oid)
+    WHERE c.relkind IN ('r', 'm')
+    GROUP BY n.name
+""")
+
+
+def approximate_counts(conn, tables):
+    """{table: estimated rows} from the PostgreSQL catalog, leaving out tables without an estimate."""
+    if conn.dialect.name != "postgresql":
+        return {}
+    rows = conn.execute(APPROXIMATE_SQL, {"names": list(tables)}).all()
+    return {name: int(round(estimate)) for name, estimate, unknown in rows if estimate is not None and not unknown}
+
+
+# -------------------------------------------------
+# Per-process cache
+# -------------------------------------------------
+class CounterCache:
+    def __init__(self, app, counters, refresh_interval=1.0):
+        self.app = app
+        self.counters = dict(counters)
+        self.refresh_interval = refresh_interval
+        self.stats = {"reads": 0, "stale_reads": 0, "refreshes": 0, "refresh_errors": 0, "approximate_misses": 0}
+        self._values = {}  # table -> Count
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def get(self, *tables):
+        """{table: Count} for `tables`, each no older than its staleness budget."""
+        self._ensure_refresher()
+        now = time.monotonic()
+        due = [name for name in tables if self._age(name, now) > self.counters[name][1]]
+        with self._lock:
+            self.stats["reads"] += 1
+            self.stats["stale_reads"] += bool(due)
+        if due:
+            self.refresh(due)
+        return {name: self._values[name] for name in tables}
+
+    def refresh(self, tables=None):
+        tables = list(tables or self.counters)
+        approximate = [name for name in tables if self.counters[name][0] == APPROXIMATE]
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                estimates = approximate_counts(conn, approximate) if approximate else {}
+                exact = exact_counts(conn, [name for name in tables if name not in estimates])
+        loaded_at = time.monotonic()
+        with self._lock:
+            for name, value in estimates.items():
+                self._values[name] = Count(value, True, loaded_at)
+            for name, value in exact.items():
+                self._values[name] = Count(value, False, loaded_at)
+            self.stats["refreshes"] += 1
+            self.stats["approximate_misses"] += len(approximate) - len(estimates)
+
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+
+    def _age(self, name, now):
+        count = self._values.get(name)
+        return float("inf") if count is None else now - count.loaded_at
+
+    # -------------------------------------------------
+    # Refresher
+    # -------------------------------------------------
+    def _ensure_refresher(self):
+        # Threads don't survive fork(), so each gunicorn worker starts its own.
+        if self._refresher_running():
+            return
+        with self._lock:
+            if self._refresher_running():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="counters-refresher", daemon=True)
+            self._thread.start()
+
+    def _refresher_running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive() and self._pid == os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            now = time.monotonic()
+            # Halfway through the budget, so readers rarely find a tile stale.
+            due = [name for name, (_, budget) in self.counters.items()
+                   if name in self._values and self._age(name, now) > budget / 2]
+            if not due:
+                continue
+            try:
+                self.refresh(due)
+            except Exception:
+                with self._lock:
+                    self.stats["refresh_errors"] += 1
+                logger.exception("Could not refresh counters %s", due)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    counters = app.config["COUNTERS"]
+    unknown = set(counters) - set(TABLES)
+    if unknown:
+        raise ValueError(f"COUNTERS: no counter triggers on {', '.join(sorted(unknown))}")
+    app.extensions["counters"] = CounterCache(
+        app, counters, refresh_interval=float(app.config["COUNTERS_REFRESH_INTERVAL"])
+    )
+    app.cli.add_command(counters_recount_command)
+
+
+def get_counters():
+    return current_app.extensions["counters"]
+
+
+def counts(*tables):
+    """{table: Count} through this process's cache."""
+    return get_counters().get(*tables)
+
+
+def add(conn, name, delta):
+    """Adjust `name`'s exact count on `conn` for rows no trigger saw (a detached partition)."""
+    conn.execute(
+        Counter.__table__.update()
+        .where(Counter.name == name, Counter.slot == select(func.min(Counter.slot))
+               .where(Counter.name == name).scalar_subquery())
+        .values(value=Counter.value + delta)
+    )
+
+
+# -------------------------------------------------
+# Triggers (the same DDL as migration 0014)
+# -------------------------------------------------
+def _postgresql_ddl(tables):
+    statements = [
+        f"""CREATE OR REPLACE FUNCTION counters_add_inserted() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO counters (name, slot, value)
+                SELECT TG_TABLE_NAME, pg_backend_pid() % {SLOTS}, count(*) FROM inserted_rows HAVING count(*) > 0
+                ON CONFLICT (name, slot) DO UPDATE SET value = counters.value + EXCLUDED.value;
+                RETURN NULL;
+            END $$""",
+        f"""CREATE OR REPLACE FUNCTION counters_subtract_deleted() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO counters (name, slot, value)
+                SELECT TG_TABLE_NAME, pg_backend_pid() % {SLOTS}, -count(*) FROM deleted_rows HAVING count(*) > 0
+                ON CONFLICT (name, slot) DO UPDATE SET value = counters.value + EXCLUDED.value;
+                RETURN NULL;
+            END $$""",
+        """CREATE OR REPLACE FUNCTION counters_reset() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                UPDATE counters SET value = 0 WHERE name = TG_TABLE_NAME;
+                RETURN NULL;
+            END $$""",
+    ]
+    for name in tables:
+        statements += [
+            f"DROP TRIGGER IF EXISTS counters_insert ON {name}",
+            f"DROP TRIGGER IF EXISTS counters_delete ON {name}",
+            f"DROP TRIGGER IF EXISTS counters_truncate ON {name}",
+            f"CREATE TRIGGER counters_insert AFTER INSERT ON {name} REFERENCING NEW TABLE AS inserted_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION counters_add_inserted()",
+            f"CREATE TRIGGER counters_delete AFTER DELETE ON {name} REFERENCING OLD TABLE AS deleted_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION counters_subtract_deleted()",
+            f"CREATE TRIGGER counters_truncate AFTER TRUNCATE ON {name} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION counters_reset()",
+        ]
+    return statements
+
+
+def _sqlite_ddl(tables):
+    statements = []
+    for name in tables:
+        for event, delta in (("insert", "+ 1"), ("delete", "- 1")):
+            statements.append(f"""CREATE TRIGGER IF NOT EXISTS counters_{name}_{event} AFTER {event.upper()} ON {name} BEGIN
+                INSERT INTO counters (name, slot, value) VALUES ('{name}', 0, 0 {delta})
+                ON CONFLICT (name, slot) DO UPDATE SET value = value {delta};
+            END""")
+    return statements
+
+
+def recount(conn, tables=TABLES):
+    """Install the triggers on `tables` and reset their counters to an exact COUNT(*); returns {table: rows}."""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        ddl = _postgresql_ddl(tables)
+    elif dialect == "sqlite":
+        ddl = _sqlite_ddl(tables)
+    else:
+        raise click.ClickException(f"No counter triggers for {dialect}")
+    for statement in ddl:
+        conn.execute(text(statement))
+    result = {}
+    for name in tables:
+        if dialect == "postgresql":
+            # Writers wait while the table is counted, so no insert falls between the count and the reset.
+            conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        conn.execute(Counter.__table__.delete().where(Counter.name == name))
+        result[name] = conn.execute(select(func.count()).select_from(table(name))).scalar()
+        conn.execute(Counter.__table__.insert().values(name=name, slot=0, value=result[name]))
+    return result
+
+
+@click.command("counters-recount")
+@click.argument("tables", nargs=-1)
+def counters_recount_command(tables):
+    """Install the counter triggers and recount (all tables, or the ones named)."""
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise click.BadParameter(f"not a counted table: {', '.join(sorted(unknown))}")
+    with db.engine.begin() as conn:
+        result = recount(conn, tables or TABLES)
+    for name, rows in result.items():
+        click.echo(f"{name:<13} {rows:,}")
+    get_counters().invalidate()
@@ -0,0 +1,222 @@
+"""
+Data for the role dashboards, loaded with a fixed number of queries.
+
+The dashboard templates print `appt.patient.name`, `note.patient.name`,
+`log.user.email`... With the lazy relationships in models.py each of those
+was a SELECT per row. Every view here loads the related rows up front
+(joinedload for a handful of many-to-one rows, selectinload where many rows
+share the same parents) and only the columns the template shows, so the
+query count stays the same however much data there is.
+
+QUERY_BUDGETS records that count per dashboard; `flask check-dashboards`
+builds and renders each one against the current database and fails if any
+goes over budget (a template touching an attribute that was not loaded
+shows up there as an extra query).
+"""
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask import current_app, render_template
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+import counters
+import rollups
+from models import (
+    db, Appointment, AuditLog, DoctorNote, NurseProfile, Patient, TwilioLog, User,
+)
+from query_counter import TooManyQueries, assert_max_queries
+
+RECENT_LIMIT = 10
+UPCOMING_LIMIT = 20
+PATIENT_LIMIT = 50
+
+
+def _with_patient(loader=joinedload):
+    return loader(Appointment.patient).load_only(Patient.id, Patient.first_name, Patient.last_name)
+
+
+def _appointment_columns():
+    return load_only(Appointment.id, Appointment.patient_id, Appointment.scheduled_time, Appointment.reason)
+
+
+# -------------------------------------------------
+# Views
+# -------------------------------------------------
+def doctor_view(doctor_id, day=None):
+    start = datetime.combine(day or date.today(), time.min)
+    todays_appointments = (
+        Appointment.query
+        .options(_appointment_columns(), _with_patient())
+        .filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.scheduled_time >= start,
+            Appointment.scheduled_time < start + timedelta(days=1),
+        )
+        .order_by(Appointment.scheduled_time)
+        .all()
+    )
+    patients = (
+        Patient.query
+        .options(load_only(Patient.id, Patient.first_name, Patient.last_name, Patient.dob))
+        .filter(Patient.id.in_(select(Appointment.patient_id).where(Appointment.doctor_id == doctor_id)))
+        .order_by(Patient.last_name, Patient.first_name)
+        .limit(PATIENT_LIMIT)
+        .all()
+    )
+    notes = (
+        DoctorNote.query
+        .options(
+            load_only(DoctorNote.id, DoctorNote.patient_id, DoctorNote.content, DoctorNote.created_at),
+            joinedload(DoctorNote.patient).load_only(Patient.id, Patient.first_name, Patient.last_name),
+        )
+        .filter(DoctorNote.doctor_id == doctor_id)
+        .order_by(DoctorNote.created_at.desc())
+        .limit(RECENT_LIMIT)
+        .all()
+    )
+    return {"todays_appointments": todays_appointments, "patients": patients, "notes": notes}
+
+
+def _recent_twilio(message_type, clinic_id):
+    query = (
+        TwilioLog.query
+        .options(load_only(TwilioLog.id, TwilioLog.from_number, TwilioLog.to_number, TwilioLog.status,
+                           TwilioLog.duration, TwilioLog.body, TwilioLog.timestamp))
+        .filter(TwilioLog.message_type == message_type)
+    )
+    if clinic_id is not None:
+        query = query.filter(TwilioLog.clinic_id == clinic_id)
+    return query.order_by(TwilioLog.timestamp.desc()).limit(RECENT_LIMIT).all()
+
+
+def receptionist_view(clinic_id=None):
+    patients = Patient.query
+    appointments = Appointment.query
+    messages = TwilioLog.query.filter(TwilioLog.message_type == "sms")
+    if clinic_id is not None:
+        patients = patients.filter(Patient.clinic_id == clinic_id)
+        appointments = appointments.filter(Appointment.clinic_id == clinic_id)
+        messages = messages.filter(TwilioLog.clinic_id == clinic_id)
+    upcoming = (
+        # selectinload: a busy day repeats the same patients, so fetch each once.
+        appointments.options(_appointment_columns(), _with_patient(selectinload))
+        .filter(Appointment.scheduled_time >= datetime.utcnow())
+        .order_by(Appointment.scheduled_time)
+        .limit(UPCOMING_LIMIT)
+        .all()
+    )
+    return {
+        "patients_count": patients.count(),
+        "appointments_count": appointments.count(),
+        "messages_count": messages.count(),
+        "appointments": upcoming,
+        "calls": _recent_twilio("call", clinic_id),
+        "messages": _recent_twilio("sms", clinic_id),
+    }
+
+
+def nurse_view(user_id, clinic_id=None):
+    upcoming = Appointment.query.options(_appointment_columns(), _with_patient())
+    patients = Patient.query.options(load_only(Patient.id, Patient.first_name, Patient.last_name, Patient.email))
+    if clinic_id is not None:
+        upcoming = upcoming.filter(Appointment.clinic_id == clinic_id)
+        patients = patients.filter(Patient.clinic_id == clinic_id)
+    recent_logs = (
+        AuditLog.query
+        .options(load_only(AuditLog.id, AuditLog.action, AuditLog.details, AuditLog.timestamp))
+        .filter(AuditLog.user_id == user_id)
+        .order_by(AuditLog.timestamp.desc())
+        .limit(UPCOMING_LIMIT)
+        .all()
+    )
+    return {
+        "upcoming_appointments": (
+            upcoming.filter(Appointment.scheduled_time >= datetime.utcnow())
+            .order_by(Appointment.scheduled_time)
+            .limit(UPCOMING_LIMIT)
+            .all()
+        ),
+        "patients": patients.order_by(Patient.last_name, Patient.first_name).limit(PATIENT_LIMIT).all(),
+        "recent_logs": recent_logs,
+    }
+
+
+def superadmin_view():
+    activity = rollups.totals(days=30)
+    # Tile counts come from counters.py (kept by triggers, or estimated), not COUNT(*).
+    tiles = counters.counts("users", "clinics", "appointments", "audit_logs")
+    return {
+        "users_count": tiles["users"].value,
+        "clinics_count": tiles["clinics"].value,
+        "appointments_count": tiles["appointments"].value,
+        "audit_logs_count": tiles["audit_logs"].value,
+        "approximate_counts": {name for name, count in tiles.items() if count.approximate},
+        "calls_30d": activity.get("call", 0),
+        "messages_30d": activity.get("sms", 0),
+        "audit_logs": (
+            AuditLog.query
+            .options(
+                load_only(AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.timestamp),
+                joinedload(AuditLog.user).load_only(User.id, User.email),
+            )
+            .order_by(AuditLog.timestamp.desc())
+            .limit(RECENT_LIMIT)
+            .all()
+        ),
+    }
+
+
+# -------------------------------------------------
+# Query budgets
+# -------------------------------------------------
+# name: (template, title, queries to build *and* render the page)
+QUERY_BUDGETS = {
+    "doctor": ("doctor_dashboard.html", "Doctor Dashboard", 3),
+    "receptionist": ("receptionist_dashboard.html", "Receptionist Dashboard", 7),
+    "nurse": ("dashboards/nurse_dashboards.html", "Nurse Dashboard", 3),
+    # Counters refreshed inline when stale: + 2 (estimate, exact); otherwise from memory.
+    "superadmin": ("superadmin_dashboard.html", "Superadmin Dashboard", 4),
+}
+
+
+def build(name, **params):
+    views = {
+        "doctor": lambda: doctor_view(params["doctor_id"]),
+        "receptionist": lambda: receptionist_view(params.get("clinic_id")),
+        "nurse": lambda: nurse_view(params["user_id"], params.get("clinic_id")),
+        "superadmin": superadmin_view,
+    }
+    return views[name]()
+
+
+def check(name, **params):
+    """Build and render dashboard `name`; raises TooManyQueries if it goes over budget."""
+    template, title, budget = QUERY_BUDGETS[name]
+    with current_app.test_request_context():
+        db.session.expunge_all()  # nothing preloaded from an earlier check
+        with assert_max_queries(budget, label=f"{name} dashboard") as counter:
+            render_template(template, title=title, **build(name, **params))
+    return counter.count
+
+
+@click.command("check-dashboards")
+@click.option("--doctor-id", type=int, default=None, help="Defaults to the doctor with the most appointments.")
+@click.option("--nurse-id", type=int, default=None, help="Defaults to the first nurse.")
+@click.option("--clinic-id", type=int, default=None)
+def check_dashboards_command(doctor_id, nurse_id, clinic_id):
+    """Fail if a dashboard runs more queries than its budget (N+1 guard)."""
+    if doctor_id is None:
+        doctor_id = db.session.execute(
+            select(Appointment.doctor_id).group_by(Appointment.doctor_id)
+            .order_by(db.func.count().desc()).limit(1)
+        ).scalar() or 0
+    if nurse_id is None:
+        nurse_id = db.session.execute(select(NurseProfile.nurse_id).limit(1)).scalar() or 0
+    params = {"doctor_id": doctor_id, "user_id": nurse_id, "clinic_id": clinic_id}
+    for name, (_, _, budget) in QUERY_BUDGETS.items():
+        try:
+            count = check(name, **params)
+        except TooManyQueries as exc:
+            raise click.ClickException(str(exc))
+        click.echo(f"{name:<13} {count} queries (budget {budget})")
@@ -0,0 +1,196 @@
+"""
+Production engine profile for PostgreSQL under gunicorn.
+
+SQLALCHEMY_ENGINE_OPTIONS comes from engine_options(), tuned from the
+environment:
+
+    DB_POOL_SIZE        connections kept open per process (default: max(5, threads))
+    DB_MAX_OVERFLOW     extra connections allowed under burst (10)
+    DB_POOL_TIMEOUT     seconds to wait for a free connection before failing (10)
+    DB_POOL_RECYCLE     replace connections older than this (1800s), below the
+                        managed Postgres idle cutoff
+    DB_POOL_PRE_PING    test a connection before handing it out (on)
+    DB_CONNECT_TIMEOUT  seconds for a new connection (5)
+
+The pool is LIFO, so under light load a few connections stay hot and the
+rest age out through recycle instead of being dropped by the server and
+failing the first request that picks them up. TCP keepalives catch
+connections that die silently.
+
+A forked worker must not reuse sockets opened by its parent (gunicorn
+--preload, the job worker...). init_app() registers an at-fork hook that
+drops the inherited pool without closing the parent's connections, so each
+worker opens its own, lazily, instead of the whole fleet connecting at boot.
+
+Sessions are already scoped per app context by Flask-SQLAlchemy, and app
+contexts are per thread / per greenlet (contextvars), so the same code runs
+under the sync, gthread and gevent workers; see gunicorn.conf.py.
+
+pool_stats() reports checkouts, waits for a free connection, timeouts and
+how long connections are held.
+"""
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+SLOW_CHECKOUT = 0.5  # seconds; waits longer than this are logged
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def engine_options(database_url=None, environ=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url` (pooling applies to PostgreSQL only)."""
+    environ = os.environ if environ is None else environ
+    database_url = database_url or environ.get("DATABASE_URL") or ""
+    if not database_url.startswith(("postgresql", "postgres")):
+        return {}
+
+    threads = _env_int(environ, "GUNICORN_THREADS", 1)
+    options = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": _env_int(environ, "DB_POOL_SIZE", max(5, threads)),
+        "max_overflow": _env_int(environ, "DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int(environ, "DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int(environ, "DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool(environ, "DB_POOL_PRE_PING", True),
+        "pool_use_lifo": True,
+        "connect_args": {
+            "connect_timeout": _env_int(environ, "DB_CONNECT_TIMEOUT", 5),
+            "application_name": environ.get("DB_APPLICATION_NAME", "ai-receptionist"),
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+        },
+    }
+    return options
+
+
+# -------------------------------------------------
+# Metrics
+# -------------------------------------------------
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.waits = 0  # checkouts that had to queue for a connection
+            self.wait_seconds = 0.0
+            self.max_wait = 0.0
+            self.timeouts = 0
+            self.hold_seconds = 0.0
+
+    def record_wait(self, seconds, waited):
+        with self._lock:
+            if waited:
+                self.waits += 1
+                self.wait_seconds += seconds
+                self.max_wait = max(self.max_wait, seconds)
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that times how long callers wait for a connection."""
+
+    def _do_get(self):
+        # Only a checkout with the pool and its overflow both used up has to queue.
+        waited = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metrics.add("timeouts")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.record_wait(elapsed, waited)
+            if elapsed > SLOW_CHECKOUT:
+                logger.warning("Waited %.2fs for a DB connection (%s)", elapsed, self.status())
+
+
+def _instrument(engine):
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        metrics.add("connects")
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.add("checkouts")
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            metrics.add("hold_seconds", time.perf_counter() - started)
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        metrics.add("invalidations")
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {
+        "checkouts": metrics.checkouts,
+        "connects": metrics.connects,
+        "invalidations": metrics.invalidations,
+        "waits": metrics.waits,
+        "wait_seconds": round(metrics.wait_seconds, 4),
+        "max_wait_seconds": round(metrics.max_wait, 4),
+        "timeouts": metrics.timeouts,
+        "hold_seconds": round(metrics.hold_seconds, 4),
+    }
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(),
+                     overflow=pool.overflow())
+    return stats
+
+
+# -------------------------------------------------
+# Wiring
+# -------------------------------------------------
+def init_app(app, db):
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        _instrument(engine)
+    app.extensions["db_engines"] = engines
+
+    def after_fork_in_child():
+        # close=False: the parent (gunicorn master or a sibling) still owns
+        # those sockets; the child just forgets them and connects on demand.
+        global metrics
+        for engine in engines:
+            engine.dispose(close=False)
+        metrics = PoolMetrics()  # not reset(): another thread may have held its lock at fork
+
+    os.register_at_fork(after_in_child=after_fork_in_child)
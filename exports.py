@@ -0,0 +1,210 @@
+"""
+Audit-log export engine (CSV, XLSX, PDF).
+
+Rows are read from a server-side cursor in EXPORT_CHUNK_SIZE batches and
+written out as they arrive; nothing holds the whole result set:
+
+  * CSV is a chunked HTTP response, one chunk per batch; memory is constant.
+  * XLSX uses openpyxl's write-only workbook (rows are spooled to disk by
+    openpyxl) and is sent from a temporary file; memory is constant.
+  * PDF is drawn page by page on a reportlab canvas (no flowable list) into
+    a temporary file, which is then streamed back. The canvas keeps every
+    page (10-20 KB each) until save(), so memory grows with the row count:
+    a PDF holds at most PDF_MAX_ROWS rows, and larger exports are refused
+    (ExportTooLarge) in favour of CSV/XLSX or narrower filters.
+
+All formats honour the audit log filters: ?user=<email>&action=&start=&end=.
+openpyxl and reportlab are imported only when those formats are requested.
+
+The write_* functions produce the same files outside a request, which is
+how the background job worker (jobs.py) builds exports.
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Response, abort, send_file, stream_with_context
+from sqlalchemy import select
+
+from models import db, AuditLog, User
+
+EXPORT_CHUNK_SIZE = 2000
+HEADERS = ["ID", "User", "Action", "Details", "Timestamp"]
+
+
+# -------------------------------------------------
+# Query
+# -------------------------------------------------
+def audit_log_query(args=None):
+    """SELECT for the audit log export, with the filters from `args` applied."""
+    args = args or {}
+    query = (
+        select(AuditLog.id, User.email, AuditLog.action, AuditLog.details, AuditLog.timestamp)
+        .outerjoin(User, User.id == AuditLog.user_id)
+        .order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())
+    )
+    if args.get("user"):
+        query = query.where(User.email.ilike(f"%{args['user']}%"))
+    if args.get("action"):
+        query = query.where(AuditLog.action.ilike(f"%{args['action']}%"))
+    if args.get("start"):
+        query = query.where(AuditLog.timestamp >= _parse_date(args["start"]))
+    if args.get("end"):
+        # "To Date" is inclusive of the whole day.
+        query = query.where(AuditLog.timestamp < _parse_date(args["end"]) + timedelta(days=1))
+    return query
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f"Invalid date: {value}")
+
+
+def iter_chunks(query, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples, fetched through a server-side cursor."""
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    try:
+        for partition in result.partitions():
+            yield [_format_row(row) for row in partition]
+    finally:
+        result.close()
+
+
+def _format_row(row):
+    log_id, email, action, details, timestamp = row
+    return (
+        log_id,
+        email or "Unauthenticated",
+        action,
+        details or "",
+        timestamp.strftime("%Y-%m-%d %H:%M:%S") if timestamp else "",
+    )
+
+
+def _filename(extension):
+    return f"audit_logs_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}"
+
+
+# -------------------------------------------------
+# CSV
+# -------------------------------------------------
+def iter_csv(query):
+    """Yield the CSV export as text chunks, one per cursor batch."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HEADERS)
+    yield buf.getvalue()
+    for chunk in iter_chunks(query):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(chunk)
+        yield buf.getvalue()
+
+
+def write_csv(query, out):
+    """Write the export to `out` (a text file)."""
+    for text in iter_csv(query):
+        out.write(text)
+
+
+def export_csv(query):
+    return Response(
+        stream_with_context(iter_csv(query)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={_filename('csv')}"},
+    )
+
+
+# -------------------------------------------------
+# XLSX
+# -------------------------------------------------
+def write_xlsx(query, out):
+    """Write the export to `out` (a path or binary file)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Audit Logs")
+    sheet.append(HEADERS)
+    for chunk in iter_chunks(query):
+        for row in chunk:
+            sheet.append(row)
+    workbook.save(out)
+
+
+def export_xlsx(query):
+    out = tempfile.TemporaryFile()
+    write_xlsx(query, out)
+    out.seek(0)
+    return send_file(
+        out,
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        as_attachment=True,
+        download_name=_filename("xlsx"),
+    )
+
+
+# -------------------------------------------------
+# PDF
+# -------------------------------------------------
+PDF_COLUMNS = [(36, "ID", 6), (76, "User", 28), (236, "Action", 30), (416, "Details", 40), (646, "Timestamp", 19)]
+# About 560 pages; the canvas holds them all (about 10 MB) until save().
+PDF_MAX_ROWS = 20_000
+
+
+class ExportTooLarge(ValueError):
+    pass
+
+
+def write_pdf(query, out, title="Audit Logs", max_rows=None):
+    """Write the export to `out` (a path or binary file); raises
+    ExportTooLarge past `max_rows` (PDF_MAX_ROWS) rows."""
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.pdfgen import canvas
+
+    width, height = landscape(letter)
+    line_height, top, bottom = 14, height - 60, 40
+
+    pdf = canvas.Canvas(out, pagesize=(width, height), pageCompression=1)
+    page = 1
+
+    def start_page():
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawString(36, height - 36, f"{title} — page {page}")
+        pdf.setFont("Helvetica-Bold", 9)
+        for x, header, _ in PDF_COLUMNS:
+            pdf.drawString(x, top, header)
+        pdf.setFont("Helvetica", 8)
+        return top - line_height
+
+    y = start_page()
+    max_rows = max_rows or PDF_MAX_ROWS
+    rows = 0
+    for chunk in iter_chunks(query):
+        rows += len(chunk)
+        if rows > max_rows:
+            raise ExportTooLarge(f"PDF exports are limited to {max_rows:,} rows; "
+                                 "narrow the filters or export CSV or Excel instead")
+        for row in chunk:
+            if y < bottom:
+                pdf.showPage()
+                page += 1
+                y = start_page()
+            for (x, _, max_chars), value in zip(PDF_COLUMNS, row):
+                text = str(value)
+                pdf.drawString(x, y, text if len(text) <= max_chars else text[: max_chars - 1] + "…")
+            y -= line_height
+    pdf.save()
+
+
+def export_pdf(query):
+    out = tempfile.TemporaryFile()
+    try:
+        write_pdf(query, out)
+    except ExportTooLarge as exc:
+        out.close()
+        abort(400, str(exc))
+    out.seek(0)
+    return send_file(out, mimetype="application/pdf", as_attachment=True, download_name=_filename("pdf"))
@@ -0,0 +1,65 @@
+"""
+gunicorn settings, read from the environment.
+
+    WEB_CONCURRENCY      worker processes (default 2)
+    GUNICORN_WORKER      sync | gthread | gevent (default sync)
+    GUNICORN_THREADS     threads per gthread worker (default 4)
+    GUNICORN_CONNECTIONS greenlets per gevent worker (default 100)
+    METRICS_DIR          where workers leave their metrics snapshots for /metrics
+                         (default <tmp>/ai-receptionist-metrics; see instrumentation.py)
+
+Each worker opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections (see
+db_pool.py), so keep WEB_CONCURRENCY * that below the database's limit.
+gevent needs `pip install gevent psycogreen`; psycopg2 is then made
+cooperative in each worker.
+"""
+import gc
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = os.environ.get("GUNICORN_WORKER", "sync")
+threads = int(os.environ.get("GUNICORN_THREADS", 4)) if worker_class == "gthread" else 1
+worker_connections = int(os.environ.get("GUNICORN_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+# Load the app once in the master and fork it: workers share the imported
+# code and compiled templates (see pre_fork). db_pool drops the inherited
+# pool in each child.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+# Restart workers now and then so slow leaks don't accumulate; jitter keeps
+# them from all reconnecting at the same moment.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+# gthread sizes its DB pool from this (db_pool.engine_options).
+os.environ.setdefault("GUNICORN_THREADS", str(threads))
+# Shared by this server's workers so /metrics can sum them.
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ai-receptionist-metrics"))
+
+
+def on_starting(server):
+    from instrumentation import reset_directory
+
+    reset_directory(os.environ["METRICS_DIR"])
+
+
+def child_exit(server, worker):
+    from instrumentation import mark_process_dead
+
+    mark_process_dead(worker.pid, os.environ["METRICS_DIR"])
+
+
+def pre_fork(server, worker):
+    # Park everything the master has built in the GC's permanent generation.
+    # Otherwise each worker's first collections write to those objects'
+    # headers and copy the pages the fork shared.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
@@ -0,0 +1,604 @@
+"""
+Per-request latency and SQL metrics, a slow-request sampler, and /metrics.
+
+Every request records, under its Flask endpoint (never the raw path, so
+/dashboard/doctor/17 and /dashboard/doctor/18 are one series):
+
+    http_requests_total{endpoint, method, status}
+    http_request_duration_seconds{endpoint, method}     histogram
+    http_request_sql_queries{endpoint}                  histogram, statements per request
+    http_request_sql_seconds_total{endpoint}            time spent in the driver
+    http_slow_requests_total{endpoint}
+
+SQL is timed with before/after_cursor_execute and charged to the request
+running in the current context (threads, gthread and gevent greenlets
+alike); background flushers and pollers are not counted. A statement
+slower than SLOW_QUERY_SECONDS is logged wherever it runs.
+
+Slow requests: a background thread samples the Python stack of every
+request that has been running for SLOW_REQUEST_PROFILE_AFTER seconds, every
+SLOW_REQUEST_SAMPLE_INTERVAL. It only wakes up for that while a request is
+in flight; an idle worker's thread sleeps until the next snapshot flush. A
+request that ends up slower than
+SLOW_REQUEST_SECONDS is logged with its hottest stacks and saved to
+<SLOW_REQUEST_DIR>/<time>-<pid>.json (newest SLOW_REQUEST_KEEP kept). The
+saved stacks are in the folded "a;b;c count" format that flamegraph.pl and
+speedscope read. GET /metrics/slow lists the latest ones. The sampler needs
+real threads; under gevent it sees no frames and only timings are kept.
+
+Cross-worker aggregation: each process writes a snapshot of its metrics
+to METRICS_DIR/worker-<pid>.json every METRICS_FLUSH_INTERVAL seconds.
+/metrics sums the snapshots of all workers, so it reports the same totals
+whichever worker answers the scrape. gunicorn.conf.py points METRICS_DIR at
+a shared directory, empties it at startup and, when a worker exits, folds
+the worker's counters into archive.json so totals don't drop when
+max_requests recycles a worker. Gauges only come from live workers. Without
+METRICS_DIR (flask run) /metrics covers the current process only.
+
+The snapshot also carries the counters of the components that keep their
+own stats: the DB pool, the role cache, the audit sink, the clinic
+registry, the Twilio writer, the outbound SMS engine, the quick-reply
+matcher, the LLM gateway, the dashboard counters, and the caller-ID and
+calendar feed caches (app_<component>_<stat>).
+
+Set METRICS_TOKEN to require `Authorization: Bearer <token>` on /metrics.
+"""
+import atexit
+import bisect
+import contextlib
+import hmac
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+
+from flask import Response, abort, current_app, jsonify, request
+from sqlalchemy import event
+
+try:
+    import fcntl
+except ImportError:  # POSIX only; elsewhere the archive is merged without a lock
+    fcntl = None
+
+import db_pool
+from permissions import permission_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "METRICS_DIR": None,
+    "METRICS_TOKEN": None,
+    "METRICS_FLUSH_INTERVAL": 2.0,
+    "SLOW_QUERY_SECONDS": 0.25,
+    "SLOW_REQUEST_SECONDS": 1.0,
+    "SLOW_REQUEST_PROFILE_AFTER": 0.1,
+    "SLOW_REQUEST_SAMPLE_INTERVAL": 0.01,
+    "SLOW_REQUEST_DIR": None,  # defaults to <instance>/slow_requests
+    "SLOW_REQUEST_KEEP": 200,
+}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+TOP_STATEMENTS = 5  # slowest statements kept per request for the slow-request record
+ARCHIVE = "archive.json"
+
+HELP = {
+    "http_requests_total": ("counter", "Requests by endpoint, method and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency, streaming included."),
+    "http_request_sql_queries": ("histogram", "SQL statements per request."),
+    "http_request_sql_seconds_total": ("counter", "Seconds spent executing SQL, by endpoint."),
+    "http_slow_requests_total": ("counter", "Requests slower than SLOW_REQUEST_SECONDS."),
+    "http_requests_in_progress": ("gauge", "Requests being served."),
+}
+# app.extensions key -> metric prefix; each has .stats (a dict or a method)
+EXTENSION_STATS = {
+    "audit_sink": "audit_sink",
+    "clinic_registry": "clinic_registry",
+    "twilio_writer": "twilio_writer",
+    "caller_id": "caller_id_cache",
+    "calendar_feed": "calendar_feed_cache",
+    "twilio_outbound": "sms_outbound",
+    "quick_replies": "quick_replies",
+    "llm_gateway": "llm",
+    "counters": "counters",
+}
+# Component stats that are levels rather than running totals.
+GAUGES = {"app_audit_sink_pending", "app_twilio_writer_backlog_segments", "app_db_pool_size",
+          "app_db_pool_checked_out", "app_db_pool_idle", "app_db_pool_overflow", "app_db_pool_max_wait_seconds"}
+MAX_GAUGES = {"app_db_pool_max_wait_seconds"}  # combined across workers with max() rather than a sum
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def setting(name, app=None):
+    return (app or current_app).config.get(name, DEFAULTS[name])
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _series(name, labels):
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# -------------------------------------------------
+# Per-request state
+# -------------------------------------------------
+class RequestMetrics:
+    def __init__(self, endpoint, method, path):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.status = 500  # until after_request says otherwise
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.thread = threading.get_ident()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.slowest = []  # heap of (seconds, statement), TOP_STATEMENTS long
+        self.samples = Counter()  # folded stack -> samples
+
+    def add_statement(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.slowest) < TOP_STATEMENTS:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+
+def _fold(frame):
+    """The stack from `frame` up, root first, as one folded-stack line."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# -------------------------------------------------
+# Registry (one per process)
+# -------------------------------------------------
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [bucket counts..., +Inf count, sum]}
+        self.in_progress = 0
+
+    def inc(self, name, labels, amount=1):
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, buckets, value):
+        series = self.histograms.setdefault(name, {})
+        counts = series.get(labels)
+        if counts is None:
+            counts = series[labels] = [0] * (len(buckets) + 2)
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def started(self):
+        with self._lock:
+            self.in_progress += 1
+
+    def finished(self, metrics, seconds, slow):
+        endpoint = _labels(endpoint=metrics.endpoint)
+        with self._lock:
+            self.in_progress -= 1
+            self.inc("http_requests_total",
+                     _labels(endpoint=metrics.endpoint, method=metrics.method, status=metrics.status))
+            self.observe("http_request_duration_seconds", _labels(endpoint=metrics.endpoint, method=metrics.method),
+                         LATENCY_BUCKETS, seconds)
+            self.observe("http_request_sql_queries", endpoint, SQL_COUNT_BUCKETS, metrics.sql_count)
+            self.inc("http_request_sql_seconds_total", endpoint, metrics.sql_seconds)
+            if slow:
+                self.inc("http_slow_requests_total", endpoint)
+
+    def snapshot(self, app):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {labels: list(counts) for labels, counts in series.items()}
+                          for name, series in self.histograms.items()}
+            gauges = {"http_requests_in_progress": {"": self.in_progress}}
+        for name, value in _component_stats(app):
+            if name in GAUGES:
+                gauges[name] = {"": value}
+            else:
+                counters[f"{name}_total"] = {"": value}
+        return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _component_stats(app):
+    """(app_<component>_<stat> name, value) for every component's own counters."""
+    sources = [("permissions", permission_stats())]
+    engines = app.extensions.get("db_engines") or []
+    if engines:
+        # The pool counters are process-wide; sizes are the default engine's.
+        sources.append(("db_pool", db_pool.pool_stats(engines[0])))
+    for key, prefix in EXTENSION_STATS.items():
+        component = app.extensions.get(key)
+        if component is not None:
+            stats = component.stats() if callable(component.stats) else dict(component.stats)
+            sources.append((prefix, stats))
+    for prefix, stats in sources:
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                yield f"app_{prefix}_{stat}", value
+
+
+# -------------------------------------------------
+# Shared directory
+# -------------------------------------------------
+def _write_json(path, data):
+    partial = f"{path}.{os.getpid()}.partial"
+    with open(partial, "w") as out:
+        json.dump(data, out, separators=(",", ":"))
+    os.replace(partial, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def _locked(directory, shared=False):
+    # /metrics can be scraped before any worker has flushed into METRICS_DIR.
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _add(total, snapshot, gauges=True):
+    for name, series in snapshot.get("counters", {}).items():
+        target = total["counters"].setdefault(name, {})
+        for labels, value in series.items():
+            target[labels] = target.get(labels, 0) + value
+    for name, series in snapshot.get("histograms", {}).items():
+        target = total["histograms"].setdefault(name, {})
+        for labels, counts in series.items():
+            current = target.get(labels)
+            target[labels] = counts if current is None else [a + b for a, b in zip(current, counts)]
+    if gauges:
+        for name, series in snapshot.get("gauges", {}).items():
+            target = total["gauges"].setdefault(name, {})
+            for labels, value in series.items():
+                combine = max if name in MAX_GAUGES else (lambda a, b: a + b)
+                target[labels] = value if labels not in target else combine(target[labels], value)
+    return total
+
+
+def _empty():
+    return {"counters": {}, "histograms": {}, "gauges": {}}
+
+
+def reset_directory(directory):
+    """Empty METRICS_DIR; gunicorn calls this as the master starts."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith((".json", ".partial")):
+            os.remove(os.path.join(directory, name))
+
+
+def mark_process_dead(pid, directory):
+    """Fold an exited worker's counters into archive.json; gunicorn's child_exit calls this."""
+    path = os.path.join(directory, f"worker-{pid}.json")
+    if not os.path.exists(path):
+        return
+    with _locked(directory):
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            archive = _read_json(os.path.join(directory, ARCHIVE)) or _empty()
+            _write_json(os.path.join(directory, ARCHIVE), _add(archive, snapshot, gauges=False))
+        os.remove(path)
+
+
+def collect(app=None):
+    """Totals across all workers (or this process alone without METRICS_DIR)."""
+    app = app or current_app
+    state = app.extensions["instrumentation"]
+    own = state.registry.snapshot(app)
+    directory = setting("METRICS_DIR", app)
+    if not directory:
+        return own
+    total = _add(_empty(), own)
+    with _locked(directory, shared=True):
+        for name in os.listdir(directory):
+            if name == ARCHIVE:
+                total = _add(total, _read_json(os.path.join(directory, name)) or _empty(), gauges=False)
+            elif name.startswith("worker-") and name.endswith(".json"):
+                snapshot = _read_json(os.path.join(directory, name))
+                if snapshot is None or snapshot["pid"] == own["pid"]:
+                    continue
+                total = _add(total, snapshot, gauges=_alive(snapshot["pid"]))
+    return total
+
+
+def render(total):
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+
+    def header(name, kind):
+        kind, text = HELP.get(name, (kind, None))
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name in sorted(total["counters"]):
+        header(name, "counter")
+        for labels, value in sorted(total["counters"][name].items()):
+            lines.append(f"{_series(name, labels)} {value}")
+    for name in sorted(total["gauges"]):
+        header(name, "gauge")
+        for labels, value in sorted(total["gauges"][name].items()):
+            lines.append(f"{_series(name, labels)} {value}")
+    for name in sorted(total["histograms"]):
+        header(name, "histogram")
+        buckets = SQL_COUNT_BUCKETS if name == "http_request_sql_queries" else LATENCY_BUCKETS
+        for labels, counts in sorted(total["histograms"][name].items()):
+            prefix = f"{labels}," if labels else ""
+            running = 0
+            for bound, count in zip(buckets, counts):
+                running += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {running}')
+            running += counts[len(buckets)]
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {running}')
+            lines.append(f"{_series(name + '_sum', labels)} {counts[-1]}")
+            lines.append(f"{_series(name + '_count', labels)} {running}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------
+# Background thread: stack sampling and snapshot flushing
+# -------------------------------------------------
+class Instrumentation:
+    def __init__(self, app):
+        self.app = app
+        self.registry = Registry()
+        self.inflight = {}  # id(RequestMetrics) -> RequestMetrics
+        self.busy = threading.Event()  # set while inflight isn't empty
+        self._inflight_lock = threading.Lock()
+        self.profile_after = float(setting("SLOW_REQUEST_PROFILE_AFTER", app))
+        self.sample_interval = float(setting("SLOW_REQUEST_SAMPLE_INTERVAL", app))
+        self.flush_interval = float(setting("METRICS_FLUSH_INTERVAL", app))
+        self.directory = setting("METRICS_DIR", app)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        atexit.register(self.flush)
+
+    def ensure_thread(self):
+        # Like the audit flusher: a forked worker starts its own on first use.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Counts and requests inherited through fork belong to the parent.
+                self.registry = Registry()
+                self.inflight = {}
+                self.busy = threading.Event()
+                self._inflight_lock = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._thread.start()
+
+    def request_started(self, metrics):
+        with self._inflight_lock:
+            self.inflight[id(metrics)] = metrics
+            self.busy.set()
+
+    def request_finished(self, metrics):
+        with self._inflight_lock:
+            self.inflight.pop(id(metrics), None)
+            if not self.inflight:
+                self.busy.clear()
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            until_flush = max(next_flush - time.monotonic(), 0.0) if self.directory else None
+            # Idle, this blocks until a request starts or a flush is due.
+            if self.busy.wait(until_flush):
+                time.sleep(max(self.sample(), self.sample_interval))
+            if self.directory and time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                self.flush()
+
+    def sample(self):
+        """Sample the requests past profile_after; returns how many seconds
+        until the next in-flight request gets there (0 if one already has)."""
+        now = time.perf_counter()
+        running = list(self.inflight.values())
+        due = [metrics for metrics in running if now - metrics.started >= self.profile_after]
+        if not due:
+            return min((metrics.started + self.profile_after - now for metrics in running), default=0.0)
+        frames = sys._current_frames()
+        for metrics in due:
+            frame = frames.get(metrics.thread)
+            if frame is not None:
+                metrics.samples[_fold(frame)] += 1
+        return 0.0
+
+    def flush(self):
+        if not self.directory or self._pid != os.getpid():
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(os.path.join(self.directory, f"worker-{os.getpid()}.json"),
+                        self.registry.snapshot(self.app))
+        except Exception:
+            logger.exception("Failed to write metrics snapshot")
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    state = app.extensions["instrumentation"] = Instrumentation(app)
+    slow_query = float(app.config["SLOW_QUERY_SECONDS"])
+    slow_request = float(app.config["SLOW_REQUEST_SECONDS"])
+
+    for engine in app.extensions.get("db_engines") or []:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - conn.info["query_started"].pop()
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.add_statement(statement, seconds)
+            if seconds >= slow_query:
+                logger.warning("Slow query (%.3fs): %s", seconds, " ".join(statement.split())[:500])
+
+        @event.listens_for(engine, "handle_error")
+        def _error(context):
+            # after_cursor_execute doesn't run for a failed statement.
+            started = context.connection.info.get("query_started") if context.connection is not None else None
+            if started:
+                started.pop()
+
+    @app.before_request
+    def _start_request():
+        state.ensure_thread()
+        rule = request.url_rule
+        metrics = RequestMetrics(rule.endpoint if rule is not None else "none", request.method, request.path)
+        request.environ["instrumentation.token"] = _current.set(metrics)
+        state.request_started(metrics)
+        state.registry.started()
+
+    @app.after_request
+    def _record_status(response):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        # Runs after a streamed body has been sent (stream_with_context keeps
+        # the request open), so streaming time is included.
+        metrics = _current.get()
+        token = request.environ.pop("instrumentation.token", None)
+        if metrics is None or token is None:
+            return
+        try:
+            _current.reset(token)
+        except ValueError:  # torn down in another context than it started in
+            _current.set(None)
+        state.request_finished(metrics)
+        seconds = time.perf_counter() - metrics.started
+        slow = seconds >= slow_request
+        state.registry.finished(metrics, seconds, slow)
+        if slow:
+            _record_slow(app, metrics, seconds)
+
+
+# -------------------------------------------------
+# Slow requests
+# -------------------------------------------------
+def slow_dir(app=None):
+    app = app or current_app
+    return setting("SLOW_REQUEST_DIR", app) or os.path.join(app.instance_path, "slow_requests")
+
+
+def _record_slow(app, metrics, seconds):
+    top = metrics.samples.most_common(3)
+    logger.warning(
+        "Slow request %s %s (%s) %.2fs, status %s, %d queries in %.2fs; hottest: %s",
+        metrics.method, metrics.path, metrics.endpoint, seconds, metrics.status, metrics.sql_count,
+        metrics.sql_seconds, " | ".join(f"{stack.rsplit(';', 1)[-1]} x{count}" for stack, count in top) or "no samples",
+    )
+    record = {
+        "at": metrics.started_at.isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        "endpoint": metrics.endpoint,
+        "method": metrics.method,
+        "path": metrics.path,
+        "status": metrics.status,
+        "seconds": round(seconds, 4),
+        "sql_count": metrics.sql_count,
+        "sql_seconds": round(metrics.sql_seconds, 4),
+        "slowest_statements": [{"seconds": round(s, 4), "sql": " ".join(sql.split())[:1000]}
+                               for s, sql in sorted(metrics.slowest, reverse=True)],
+        "samples": sum(metrics.samples.values()),
+        "sample_interval": float(setting("SLOW_REQUEST_SAMPLE_INTERVAL", app)),
+        "folded": [f"{stack} {count}" for stack, count in metrics.samples.most_common()],
+    }
+    directory = slow_dir(app)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, f"{metrics.started_at:%Y%m%dT%H%M%S.%f}-{os.getpid()}.json"), record)
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+        for name in names[:-int(setting("SLOW_REQUEST_KEEP", app))]:
+            os.remove(os.path.join(directory, name))
+    except OSError:
+        logger.exception("Failed to save slow request profile")
+
+
+def recent_slow(limit=20, stacks=False):
+    """The newest saved slow requests, newest first (folded stacks only if asked)."""
+    directory = slow_dir()
+    if not os.path.isdir(directory):
+        return []
+    records = []
+    for name in sorted((name for name in os.listdir(directory) if name.endswith(".json")), reverse=True)[:limit]:
+        record = _read_json(os.path.join(directory, name))
+        if record is None:
+            continue
+        if not stacks:
+            record.pop("folded", None)
+        records.append(record)
+    return records
+
+
+# -------------------------------------------------
+# Views
+# -------------------------------------------------
+def check_token():
+    token = setting("METRICS_TOKEN")
+    if not token:
+        return
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        abort(401)
+
+
+def metrics_response():
+    check_token()
+    return Response(render(collect()), mimetype="text/plain; version=0.0.4")
+
+
+def slow_response():
+    check_token()
+    limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+    return jsonify(recent_slow(limit, stacks=request.args.get("stacks") == "1"))
@@ -0,0 +1,274 @@
+"""
+DB-backed background job queue.
+
+Heavy work (exports, rollup rebuilds...) is enqueued as a row in `jobs` and
+executed by a separate process:
+
+    flask worker --concurrency 4 --mode thread
+
+Workers claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED on
+PostgreSQL (a guarded UPDATE elsewhere), so several workers can share the
+queue. A claim holds a lease (JOB_LEASE_SECONDS); a job whose worker died is
+picked up again once its lease runs out, up to JOB_MAX_ATTEMPTS times, and
+then marked failed. A job that raises is retried the same number of times,
+JOB_RETRY_BACKOFF_SECONDS * attempts later, unless the error is permanent
+(PermanentJobError, or an HTTPException such as abort(400) on bad params):
+that fails it on the spot.
+
+Handlers write their output into JOB_ARTIFACT_DIR on local disk; the web app
+serves it from /jobs/<id>/download once the job is done.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+from werkzeug.exceptions import HTTPException
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 3600
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF_SECONDS = 30
+POLL_INTERVAL = 1.0
+
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """A failure retrying won't fix (bad params, an export over its cap...)."""
+
+
+PERMANENT_ERRORS = (PermanentJobError, HTTPException)
+
+
+def register(kind):
+    """Register `fn(params, artifact_base) -> artifact path or None` for a job kind."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def artifact_dir(app=None):
+    app = app or current_app
+    path = app.config.get("JOB_ARTIFACT_DIR") or os.path.join(app.instance_path, "job_artifacts")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# -------------------------------------------------
+# Producer side
+# -------------------------------------------------
+def enqueue(kind, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _last_line(error):
+    lines = (error or "").strip().splitlines()
+    return lines[-1] if lines else None
+
+
+def job_status(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": _last_line(job.error),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# -------------------------------------------------
+# Worker side
+# -------------------------------------------------
+def claim_jobs(limit, worker_id):
+    """Atomically mark up to `limit` runnable jobs as ours; returns their ids."""
+    now = datetime.utcnow()
+    lease = timedelta(seconds=current_app.config.get("JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+    max_attempts = current_app.config.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+    expired = and_(Job.status == "running", Job.locked_until < now)
+    runnable = or_(
+        # locked_until on a queued job is when a failed attempt may be retried.
+        and_(Job.status == "queued", or_(Job.locked_until.is_(None), Job.locked_until <= now)),
+        and_(expired, Job.attempts < max_attempts),
+    )
+    with db.engine.begin() as conn:
+        # A job whose last allowed attempt ran out its lease most likely
+        # kills its worker (OOM, segfault...): stop handing it out.
+        conn.execute(
+            update(Job)
+            .where(expired, Job.attempts >= max_attempts)
+            .values(status="failed", finished_at=now, locked_until=None,
+                    error=f"Lease expired with no attempts left (JOB_MAX_ATTEMPTS={max_attempts}): the worker died or hung")
+        )
+        query = select(Job.id).where(runnable).order_by(Job.created_at, Job.id).limit(limit)
+        if conn.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        ids = conn.execute(query).scalars().all()
+        if not ids:
+            return []
+        # `runnable` is repeated so that, without row locks, a job another
+        # worker grabbed in the meantime is left alone.
+        conn.execute(
+            update(Job)
+            .where(Job.id.in_(ids), runnable)
+            .values(status="running", worker=worker_id, started_at=now,
+                    locked_until=now + lease, attempts=Job.attempts + 1)
+        )
+        return conn.execute(
+            select(Job.id).where(Job.id.in_(ids), Job.worker == worker_id, Job.started_at == now)
+        ).scalars().all()
+
+
+def run_job(job_id):
+    """Execute one claimed job inside the current app context."""
+    job = db.session.get(Job, job_id)
+    retry_at = None
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise PermanentJobError(f"Unknown job kind: {job.kind}")
+        params = json.loads(job.params or "{}")
+        path = handler(params, os.path.join(artifact_dir(), f"job_{job.id}"))
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        max_attempts = current_app.config.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+        if isinstance(exc, PERMANENT_ERRORS) or job.attempts >= max_attempts:
+            job.status = "failed"
+        else:
+            job.status = "queued"
+            backoff = current_app.config.get("JOB_RETRY_BACKOFF_SECONDS", DEFAULT_RETRY_BACKOFF_SECONDS)
+            retry_at = datetime.utcnow() + timedelta(seconds=backoff * job.attempts)
+        job.error = traceback.format_exc()
+        logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+    else:
+        job.status = "done"
+        job.artifact_path = path
+        job.error = None
+    job.finished_at = datetime.utcnow()
+    job.locked_until = retry_at
+    db.session.commit()
+    return job.status
+
+
+def _run_in_thread(app, job_id):
+    with app.app_context():
+        return run_job(job_id)
+
+
+def _run_in_process(job_id):
+    # Spawned processes start from scratch, so they build their own app
+    # (and connection pool) rather than sharing the parent's sockets.
+    from app import app
+    with app.app_context():
+        return run_job(job_id)
+
+
+def run_worker(app, concurrency=2, mode="thread", poll_interval=POLL_INTERVAL, once=False):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    if mode == "process":
+        pool = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context("spawn"))
+        submit = lambda job_id: pool.submit(_run_in_process, job_id)  # noqa: E731
+    else:
+        pool = ThreadPoolExecutor(concurrency, thread_name_prefix="job")
+        submit = lambda job_id: pool.submit(_run_in_thread, app, job_id)  # noqa: E731
+
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop.set())
+
+    logger.info("Worker %s started (%s x %d)", worker_id, mode, concurrency)
+    running = set()
+    try:
+        while not stop.is_set():
+            running = {future for future in running if not future.done()}
+            claimed = []
+            if len(running) < concurrency:
+                with app.app_context():
+                    claimed = claim_jobs(concurrency - len(running), worker_id)
+                running.update(submit(job_id) for job_id in claimed)
+            if once and not claimed and not running:
+                break
+            if not claimed:
+                stop.wait(poll_interval)
+    finally:
+        # Let in-flight jobs finish; anything unfinished is retried after its lease.
+        pool.shutdown(wait=True)
+    logger.info("Worker %s stopped", worker_id)
+
+
+@click.command("worker")
+@click.option("--concurrency", default=2, show_default=True, help="Jobs run at the same time.")
+@click.option("--mode", type=click.Choice(["thread", "process"]), default="thread", show_default=True)
+@click.option("--poll-interval", default=POLL_INTERVAL, show_default=True, help="Seconds between polls when idle.")
+@click.option("--once", is_flag=True, help="Exit once the queue is empty.")
+def worker_command(concurrency, mode, poll_interval, once):
+    """Run the background job worker."""
+    run_worker(current_app._get_current_object(), concurrency, mode, poll_interval, once)
+
+
+# -------------------------------------------------
+# Job handlers
+# -------------------------------------------------
+@register("audit_log_export")
+def _audit_log_export(params, artifact_base):
+    import exports
+
+    fmt = params.get("format", "csv")
+    query = exports.audit_log_query(params.get("filters"))
+    path = f"{artifact_base}.{fmt}"
+    partial = path + ".part"
+    if fmt == "csv":
+        with open(partial, "w", newline="") as out:
+            exports.write_csv(query, out)
+    elif fmt == "xlsx":
+        exports.write_xlsx(query, partial)
+    elif fmt == "pdf":
+        try:
+            exports.write_pdf(query, partial)
+        except exports.ExportTooLarge as exc:
+            raise PermanentJobError(str(exc)) from exc
+    else:
+        raise PermanentJobError(f"Unknown export format: {fmt}")
+    os.replace(partial, path)
+    return path
+
+
+@register("rollups_backfill")
+def _rollups_backfill(params, artifact_base):
+    import rollups
+
+    since = datetime.fromisoformat(params["since"]) if params.get("since") else None
+    with db.engine.begin() as conn:
+        rollups.backfill(conn, since)
+    return None
+
+
+@register("sms_reply")
+def _sms_reply(params, artifact_base):
+    import llm_gateway
+
+    llm_gateway.send_sms_reply(params["clinic_id"], params["to_number"], params["body"])
+    return None
@@ -0,0 +1,418 @@
+"""
+LLM gateway: every model call goes through here, and most don't leave.
+
+Receptionist questions repeat ("what time do you open?", "do you take
+walk-ins?"), and a model round trip costs seconds and money. Before calling
+upstream, the gateway looks for an earlier answer to the same prompt:
+
+  1. An in-process LRU (LLM_CACHE_SIZE entries, LLM_MEMORY_TTL seconds).
+  2. The llm_responses table, shared by every worker and kept for
+     LLM_CACHE_TTL seconds.
+  3. The backend, at most LLM_MAX_CONCURRENCY calls at once per process.
+     A caller that can't get a slot within LLM_QUEUE_TIMEOUT gets LLMBusy.
+
+Prompts are normalized before hashing: Unicode NFKC, case-folded, runs of
+whitespace collapsed, trailing punctuation dropped. So "What time do you
+open?" and "what time do you  open" share an entry. The key also covers the
+clinic, the model and the system prompt, so one clinic's answers are never
+served to another. forget(clinic_id) drops a clinic's entries, for example
+after its hours change. Other workers' LRUs let go within LLM_MEMORY_TTL.
+
+Concurrent identical prompts in a process are coalesced. The first caller
+checks the table and, if it must, calls upstream. The others wait for its
+result instead of making the same call.
+
+Backends implement complete(system, prompt) -> Completion. LLM_BACKEND
+chooses one:
+  * "openai": chat completions over HTTPS, using OPENAI_API_KEY;
+  * "stub": a deterministic local stand-in with optional latency, for
+    tests and benchmarks.
+The default is "openai" when a key is set and "stub" otherwise.
+
+`stats` counts requests, hits per tier, coalesced waits, upstream calls,
+errors, seconds and tokens, plus the total time callers waited. /metrics
+exports them as app_llm_*. Hit rate is (memory_hits + db_hits + coalesced)
+/ requests. Upstream time saved is roughly the hits times upstream_seconds
+/ upstream_calls.
+
+With LLM_SMS_REPLIES on, inbound texts that no quick reply matched are
+answered by the model. A model call can take longer than Twilio waits for a
+webhook (15 s), so /twilio/webhook only queues an sms_reply job and answers
+with empty TwiML; the job (`flask worker`) asks the gateway and texts the
+answer back through twilio_outbound.
+"""
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, select
+
+import jobs
+import twilio_outbound
+from clinic_registry import get_registry
+from models import db, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "LLM_BACKEND": None,  # "openai" or "stub"; see above
+    "LLM_MODEL": "gpt-4o-mini",
+    "LLM_TIMEOUT": 30.0,
+    "LLM_MAX_CONCURRENCY": 8,
+    "LLM_QUEUE_TIMEOUT": 10.0,
+    "LLM_CACHE_SIZE": 10000,
+    "LLM_MEMORY_TTL": 300.0,
+    "LLM_CACHE_TTL": 7 * 24 * 3600,
+    "LLM_SMS_REPLIES": False,
+}
+
+HIT_COUNTERS = {"memory": "memory_hits", "db": "db_hits", "coalesced": "coalesced"}
+
+_whitespace = re.compile(r"\s+")
+_trailing = re.compile(r"[\s.!?]+$")
+
+
+def setting(name, app=None):
+    return (app or current_app).config.get(name, DEFAULTS[name])
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMBusy(LLMError):
+    """Every upstream slot stayed taken for LLM_QUEUE_TIMEOUT seconds."""
+
+
+@dataclass(frozen=True)
+class Completion:
+    text: str
+    tokens: int = 0
+
+
+@dataclass(frozen=True)
+class Answer:
+    text: str
+    source: str  # memory / db / coalesced / upstream
+    seconds: float
+
+
+def normalize(prompt):
+    text = unicodedata.normalize("NFKC", prompt or "").casefold()
+    return _trailing.sub("", _whitespace.sub(" ", text).strip())
+
+
+def cache_key(clinic_id, model, system, prompt):
+    """sha256 over clinic, model, system prompt and the normalized prompt."""
+    material = "\x1f".join((str(clinic_id), model, normalize(system), normalize(prompt)))
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+# -------------------------------------------------
+# Backends
+# -------------------------------------------------
+class StubBackend:
+    """Deterministic stand-in: the same prompt always gets the same answer, after `latency` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, system, prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(f"{system}\x1f{prompt}".encode()).hexdigest()[:8]
+        text = f"Thanks for your message. A member of our team will follow up shortly. (ref {digest})"
+        return Completion(text, tokens=len(system.split()) + len(prompt.split()) + len(text.split()))
+
+
+class OpenAIBackend:
+    """Chat completions over kept-alive HTTPS connections."""
+
+    def __init__(self, api_key, model, timeout=30.0, host="api.openai.com", pool_size=8):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.host = host
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def complete(self, system, prompt):
+        body = json.dumps({
+            "model": self.model,
+            "temperature": 0,  # repeatable answers are what make caching them sound
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+        })
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        try:
+            connection.request("POST", "/v1/chat/completions", body=body, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            raise LLMError(f"OpenAI request failed: {exc}") from exc
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+        if response.status != 200:
+            raise LLMError(f"OpenAI returned HTTP {response.status}: {payload[:200]!r}")
+        data = json.loads(payload)
+        return Completion(data["choices"][0]["message"]["content"].strip(),
+                          tokens=(data.get("usage") or {}).get("total_tokens", 0))
+
+
+# -------------------------------------------------
+# Gateway
+# -------------------------------------------------
+class Gateway:
+    def __init__(self, app, backend, model, max_concurrency=8, queue_timeout=10.0, cache_size=10000,
+                 memory_ttl=300.0, cache_ttl=7 * 24 * 3600):
+        self.app = app
+        self.backend = backend
+        self.model = model
+        self.queue_timeout = queue_timeout
+        self.cache_size = cache_size
+        self.memory_ttl = memory_ttl
+        self.cache_ttl = cache_ttl
+        self.stats = {
+            "requests": 0, "memory_hits": 0, "db_hits": 0, "coalesced": 0, "upstream_calls": 0,
+            "upstream_errors": 0, "rejected": 0, "upstream_seconds": 0.0, "upstream_tokens": 0,
+            "wait_seconds": 0.0,
+        }
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._memory = OrderedDict()  # key -> (expires_at, clinic_id, text)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    # -------------------------------------------------
+    # Memory tier
+    # -------------------------------------------------
+    def _remember(self, key, clinic_id, text, ttl):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + min(ttl, self.memory_ttl), clinic_id, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[2]
+
+    # -------------------------------------------------
+    # Table tier
+    # -------------------------------------------------
+    def _load(self, key):
+        """(text, seconds left) from llm_responses, or None."""
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    select(LLMResponse.response, LLMResponse.expires_at).where(LLMResponse.key == key)
+                ).first()
+        if row is None:
+            return None
+        left = (row.expires_at - datetime.utcnow()).total_seconds()
+        return (row.response, left) if left > 0 else None
+
+    def _store(self, key, clinic_id, prompt, text):
+        now = datetime.utcnow()
+        values = {"key": key, "clinic_id": clinic_id, "model": self.model, "prompt": normalize(prompt),
+                  "response": text, "created_at": now, "expires_at": now + timedelta(seconds=self.cache_ttl)}
+        table = LLMResponse.__table__
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    dialect = conn.dialect.name
+                    if dialect in ("postgresql", "sqlite"):
+                        if dialect == "postgresql":
+                            from sqlalchemy.dialects.postgresql import insert as upsert
+                        else:
+                            from sqlalchemy.dialects.sqlite import insert as upsert
+                        stmt = upsert(table).values(values)
+                        conn.execute(stmt.on_conflict_do_update(
+                            index_elements=["key"],
+                            set_={name: stmt.excluded[name] for name in ("response", "created_at", "expires_at")},
+                        ))
+                    else:
+                        conn.execute(table.delete().where(table.c.key == key))
+                        conn.execute(table.insert().values(values))
+        except Exception:
+            # The answer is still good; only the shared tier misses out.
+            logger.exception("Could not store an LLM response")
+
+    # -------------------------------------------------
+    # Upstream
+    # -------------------------------------------------
+    def _call_upstream(self, system, prompt):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count(rejected=1)
+            raise LLMBusy(f"No free LLM slot within {self.queue_timeout:g}s")
+        started = time.perf_counter()
+        try:
+            completion = self.backend.complete(system, prompt)
+        except LLMError:
+            self._count(upstream_errors=1)
+            raise
+        except Exception as exc:
+            self._count(upstream_errors=1)
+            raise LLMError(str(exc) or exc.__class__.__name__) from exc
+        finally:
+            self._slots.release()
+        self._count(upstream_calls=1, upstream_seconds=time.perf_counter() - started,
+                    upstream_tokens=completion.tokens)
+        return completion
+
+    def _fetch(self, key, clinic_id, system, prompt):
+        """(text, source) from the table or upstream; fills the caches."""
+        stored = self._load(key)
+        if stored is not None:
+            text, left = stored
+            self._remember(key, clinic_id, text, left)
+            return text, "db"
+        completion = self._call_upstream(system, prompt)
+        self._store(key, clinic_id, prompt, completion.text)
+        self._remember(key, clinic_id, completion.text, self.cache_ttl)
+        return completion.text, "upstream"
+
+    # -------------------------------------------------
+    # API
+    # -------------------------------------------------
+    def answer(self, clinic_id, system, prompt):
+        """The model's answer to `prompt` for `clinic_id`, cached; raises LLMError."""
+        started = time.perf_counter()
+        key = cache_key(clinic_id, self.model, system, prompt)
+        text, source = self._recall(key), "memory"
+        if text is None:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+            if leader:
+                try:
+                    text, source = self._fetch(key, clinic_id, system, prompt)
+                    future.set_result(text)
+                except BaseException as exc:
+                    future.set_exception(exc)
+                    raise
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+            else:
+                text, source = future.result(), "coalesced"
+        seconds = time.perf_counter() - started
+        hit = {HIT_COUNTERS[source]: 1} if source in HIT_COUNTERS else {}
+        self._count(requests=1, wait_seconds=seconds, **hit)
+        return Answer(text, source, seconds)
+
+    def forget(self, clinic_id):
+        """Drop a clinic's cached answers (this process's LRU and the shared table)."""
+        with self._lock:
+            for key in [key for key, entry in self._memory.items() if entry[1] == clinic_id]:
+                del self._memory[key]
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                return conn.execute(delete(LLMResponse).where(LLMResponse.clinic_id == clinic_id)).rowcount
+
+
+def make_backend(app):
+    kind = setting("LLM_BACKEND", app) or ("openai" if os.environ.get("OPENAI_API_KEY") else "stub")
+    if kind == "openai":
+        return OpenAIBackend(os.environ["OPENAI_API_KEY"], setting("LLM_MODEL", app),
+                             timeout=float(setting("LLM_TIMEOUT", app)))
+    if kind == "stub":
+        return StubBackend()
+    raise ValueError(f"LLM_BACKEND must be 'openai' or 'stub', not {kind!r}")
+
+
+def init_app(app, backend=None):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions["llm_gateway"] = Gateway(
+        app,
+        backend or make_backend(app),
+        model=app.config["LLM_MODEL"],
+        max_concurrency=int(app.config["LLM_MAX_CONCURRENCY"]),
+        queue_timeout=float(app.config["LLM_QUEUE_TIMEOUT"]),
+        cache_size=int(app.config["LLM_CACHE_SIZE"]),
+        memory_ttl=float(app.config["LLM_MEMORY_TTL"]),
+        cache_ttl=float(app.config["LLM_CACHE_TTL"]),
+    )
+    app.cli.add_command(llm_cache_prune_command)
+
+
+def get_gateway():
+    return current_app.extensions["llm_gateway"]
+
+
+# -------------------------------------------------
+# Inbound SMS
+# -------------------------------------------------
+def receptionist_prompt(clinic):
+    return (
+        f"You are the receptionist for {clinic.name}, answering patients by SMS. Reply in at most two short "
+        "sentences. Never give medical advice; for anything clinical or urgent, ask the patient to call the clinic."
+    )
+
+
+def queue_sms_reply(form):
+    """Queue a job that answers an inbound SMS with the model; returns the
+    job, or None (off, or not an inbound text to a known clinic)."""
+    from quick_replies import is_inbound_sms
+
+    if not setting("LLM_SMS_REPLIES") or not is_inbound_sms(form) or not form.get("Body"):
+        return None
+    clinic = get_registry().by_number(form.get("To"))
+    if clinic is None:
+        return None
+    return jobs.enqueue("sms_reply", clinic_id=clinic.id, to_number=form.get("From"), body=form["Body"])
+
+
+def send_sms_reply(clinic_id, to_number, body):
+    """Ask the model about `body` and text the answer back (the sms_reply job).
+    LLMError propagates, so the job is retried."""
+    clinic = get_registry().get(clinic_id)
+    if clinic is None:
+        return
+    answer = get_gateway().answer(clinic.id, receptionist_prompt(clinic), body)
+    message = twilio_outbound.OutboundMessage(clinic_id=clinic.id, to_number=to_number, body=answer.text)
+    twilio_outbound.send_and_record([message])
+
+
+@click.command("llm-cache-prune")
+def llm_cache_prune_command():
+    """Delete expired rows from llm_responses."""
+    with db.engine.begin() as conn:
+        deleted = conn.execute(delete(LLMResponse).where(LLMResponse.expires_at <= datetime.utcnow())).rowcount
+    click.echo(f"Deleted {deleted:,} expired LLM responses")
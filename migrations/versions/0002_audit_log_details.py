@@ -0,0 +1,25 @@
+"""Add details column to audit_logs
+
+Revision ID: 0002_audit_log_details
+Revises: 0001_initial_full
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0002_audit_log_details"
+down_revision = "0001_initial_full"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # utils.log_action and the audit log views already write/read this column
+    op.add_column("audit_logs", sa.Column("details", sa.Text))
+
+
+def downgrade():
+    op.drop_column("audit_logs", "details")
@@ -0,0 +1,47 @@
+"""Twilio log rollup table, plus clinic/duration on twilio_logs
+
+Revision ID: 0003_twilio_rollups
+Revises: 0002_audit_log_details
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0003_twilio_rollups"
+down_revision = "0002_audit_log_details"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("twilio_logs", sa.Column("clinic_id", sa.Integer, sa.ForeignKey("clinics.id")))
+    op.add_column("twilio_logs", sa.Column("duration", sa.Integer))
+
+    op.create_table(
+        "twilio_rollups",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("clinic_id", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("granularity", sa.String(4), nullable=False),  # day / hour
+        sa.Column("bucket", sa.DateTime, nullable=False),
+        sa.Column("message_type", sa.String(20), nullable=False, server_default=""),
+        sa.Column("direction", sa.String(10), nullable=False, server_default=""),
+        sa.Column("status", sa.String(50), nullable=False, server_default=""),
+        sa.Column("count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("duration", sa.BigInteger, nullable=False, server_default="0"),
+        sa.UniqueConstraint(
+            "clinic_id", "granularity", "bucket", "message_type", "direction", "status",
+            name="uq_twilio_rollups_key",
+        ),
+    )
+    op.create_index(
+        "ix_twilio_rollups_granularity_bucket", "twilio_rollups", ["granularity", "bucket"]
+    )
+
+
+def downgrade():
+    op.drop_table("twilio_rollups")
+    op.drop_column("twilio_logs", "duration")
+    op.drop_column("twilio_logs", "clinic_id")
@@ -0,0 +1,41 @@
+"""Scheduled SMS reminders
+
+Revision ID: 0005_reminders
+Revises: 0004_jobs
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0005_reminders"
+down_revision = "0004_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reminders",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("clinic_id", sa.Integer, sa.ForeignKey("clinics.id")),
+        sa.Column("appointment_id", sa.Integer, sa.ForeignKey("appointments.id"), unique=True),
+        sa.Column("phone", sa.String(20), nullable=False),
+        sa.Column("message", sa.Text, nullable=False),
+        sa.Column("send_time", sa.DateTime, nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("locked_until", sa.DateTime),
+        sa.Column("sent_at", sa.DateTime),
+        sa.Column("error", sa.Text),
+        sa.Column("created_at", sa.DateTime, server_default=sa.func.now()),
+    )
+    # The dispatcher's claim query is "status = 'pending' AND send_time <= now()
+    # ORDER BY send_time", which this index answers directly.
+    op.create_index("ix_reminders_status_send_time", "reminders", ["status", "send_time"])
+
+
+def downgrade():
+    op.drop_table("reminders")
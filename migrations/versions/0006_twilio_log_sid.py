@@ -0,0 +1,26 @@
+"""Twilio SID on twilio_logs so status callbacks update one row
+
+Revision ID: 0006_twilio_log_sid
+Revises: 0005_reminders
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0006_twilio_log_sid"
+down_revision = "0005_reminders"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("twilio_logs", sa.Column("sid", sa.String(64)))
+    op.create_index("ix_twilio_logs_sid", "twilio_logs", ["sid"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_twilio_logs_sid", table_name="twilio_logs")
+    op.drop_column("twilio_logs", "sid")
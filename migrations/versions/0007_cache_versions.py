@@ -0,0 +1,28 @@
+"""Version counters for cross-worker cache invalidation
+
+Revision ID: 0007_cache_versions
+Revises: 0006_twilio_log_sid
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0007_cache_versions"
+down_revision = "0006_twilio_log_sid"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "cache_versions",
+        sa.Column("name", sa.String(50), primary_key=True),
+        sa.Column("version", sa.BigInteger, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_table("cache_versions")
@@ -0,0 +1,102 @@
+"""Normalized patient search keys with trigram/tsvector indexes
+
+Revision ID: 0008_patient_search
+Revises: 0007_cache_versions
+Create Date: 2026-10-18
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0008_patient_search"
+down_revision = "0007_cache_versions"
+branch_labels = None
+depends_on = None
+
+BATCH = 10000
+
+
+# Same rules as patient_search.normalize_name / phone_digits, copied so the
+# migration does not depend on application code that may change later.
+def _normalize_name(first_name, last_name):
+    value = unicodedata.normalize("NFKD", f"{first_name or ''} {last_name or ''}")
+    value = "".join(ch for ch in value if not unicodedata.combining(ch)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", value).strip()
+
+
+def _phone_digits(phone):
+    return re.sub(r"\D+", "", phone or "") or None
+
+
+def upgrade():
+    op.add_column("patients", sa.Column("search_name", sa.String(161)))
+    op.add_column("patients", sa.Column("phone_digits", sa.String(20)))
+
+    # Backfill in id order, one batch per round trip.
+    bind = op.get_bind()
+    patients = sa.table(
+        "patients",
+        sa.column("id", sa.Integer), sa.column("first_name"), sa.column("last_name"),
+        sa.column("phone"), sa.column("search_name"), sa.column("phone_digits"),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(patients.c.id, patients.c.first_name, patients.c.last_name, patients.c.phone)
+            .where(patients.c.id > last_id)
+            .order_by(patients.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            patients.update()
+            .where(patients.c.id == sa.bindparam("pid"))
+            .values(search_name=sa.bindparam("name"), phone_digits=sa.bindparam("digits")),
+            [
+                {"pid": row.id, "name": _normalize_name(row.first_name, row.last_name),
+                 "digits": _phone_digits(row.phone)}
+                for row in rows
+            ],
+        )
+        last_id = rows[-1].id
+
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # CONCURRENTLY cannot run inside the migration's transaction.
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_search_tsv ON patients "
+                "USING gin (to_tsvector('simple'::regconfig, search_name))"
+            )
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_search_name_trgm ON patients "
+                "USING gin (search_name gin_trgm_ops)"
+            )
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_phone_digits_trgm ON patients "
+                "USING gin (phone_digits gin_trgm_ops)"
+            )
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_email_lower ON patients "
+                "(lower(email) text_pattern_ops)"
+            )
+    else:
+        op.create_index("ix_patients_search_name", "patients", ["search_name"])
+        op.create_index("ix_patients_phone_digits", "patients", ["phone_digits"])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        for name in ("ix_patients_search_tsv", "ix_patients_search_name_trgm",
+                     "ix_patients_phone_digits_trgm", "ix_patients_email_lower"):
+            op.execute(f"DROP INDEX IF EXISTS {name}")
+    else:
+        op.drop_index("ix_patients_phone_digits", table_name="patients")
+        op.drop_index("ix_patients_search_name", table_name="patients")
+    op.drop_column("patients", "phone_digits")
+    op.drop_column("patients", "search_name")
@@ -0,0 +1,92 @@
+"""E.164 patient phone with a unique per-clinic caller-ID index
+
+Revision ID: 0009_patient_phone_e164
+Revises: 0008_patient_search
+Create Date: 2026-10-18
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0009_patient_phone_e164"
+down_revision = "0008_patient_search"
+branch_labels = None
+depends_on = None
+
+BATCH = 10000
+COUNTRY_CODE = "1"
+
+_extension = re.compile(r"(?:[a-z#;,].*)$", re.IGNORECASE)
+_non_digit = re.compile(r"\D+")
+
+
+# Same rules as phones.to_e164, copied so the migration does not depend on
+# application code that may change later.
+def _to_e164(phone):
+    raw = _extension.sub("", (phone or "").strip())
+    digits = _non_digit.sub("", raw)
+    if not digits:
+        return None
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("011"):
+        digits = digits[3:]
+    elif len(digits) == 10:
+        digits = COUNTRY_CODE + digits
+    elif not (len(digits) == 11 and digits.startswith("1")):
+        return None
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+
+def upgrade():
+    op.add_column("patients", sa.Column("phone_e164", sa.String(16)))
+
+    bind = op.get_bind()
+    patients = sa.table(
+        "patients", sa.column("id", sa.Integer), sa.column("phone"), sa.column("phone_e164"),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(patients.c.id, patients.c.phone)
+            .where(patients.c.id > last_id, patients.c.phone.isnot(None))
+            .order_by(patients.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            patients.update().where(patients.c.id == sa.bindparam("pid")).values(phone_e164=sa.bindparam("e164")),
+            [{"pid": row.id, "e164": _to_e164(row.phone)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    # Several patients of one clinic sharing a number (family members, data
+    # entry duplicates) would break the unique index: the oldest record keeps
+    # the caller-ID key, the others are left unmatched until someone fixes them.
+    op.execute(
+        "UPDATE patients SET phone_e164 = NULL WHERE phone_e164 IS NOT NULL AND EXISTS ("
+        "SELECT 1 FROM patients AS older WHERE older.clinic_id = patients.clinic_id "
+        "AND older.phone_e164 = patients.phone_e164 AND older.id < patients.id)"
+    )
+
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_clinic_phone_e164 "
+                "ON patients (clinic_id, phone_e164)"
+            )
+    else:
+        op.create_index("ix_patients_clinic_phone_e164", "patients", ["clinic_id", "phone_e164"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_patients_clinic_phone_e164", table_name="patients")
+    op.drop_column("patients", "phone_e164")
@@ -0,0 +1,44 @@
+"""Appointment durations and doctor working-hour templates
+
+Revision ID: 0010_availability
+Revises: 0009_patient_phone_e164
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0010_availability"
+down_revision = "0009_patient_phone_e164"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant server default: existing rows become 30-minute appointments
+    # without rewriting the table on PostgreSQL 11+.
+    op.add_column(
+        "appointments",
+        sa.Column("duration_minutes", sa.Integer, nullable=False, server_default="30"),
+    )
+    op.create_table(
+        "doctor_schedules",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("doctor_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("clinic_id", sa.Integer, sa.ForeignKey("clinics.id")),
+        sa.Column("weekday", sa.SmallInteger, nullable=False),
+        sa.Column("start_time", sa.Time, nullable=False),
+        sa.Column("end_time", sa.Time, nullable=False),
+        sa.Column("slot_minutes", sa.Integer, nullable=False, server_default="30"),
+    )
+    op.create_index("ix_doctor_schedules_doctor_id", "doctor_schedules", ["doctor_id"])
+    op.create_index("ix_doctor_schedules_clinic_id", "doctor_schedules", ["clinic_id"])
+    # ix_appointments_doctor_time (doctor_id, scheduled_time) from 0001 serves
+    # the availability range scans; nothing to add there.
+
+
+def downgrade():
+    op.drop_table("doctor_schedules")
+    op.drop_column("appointments", "duration_minutes")
@@ -0,0 +1,133 @@
+"""Monthly range partitions for audit_logs and twilio_logs (PostgreSQL)
+
+Revision ID: 0011_partition_logs
+Revises: 0010_availability
+Create Date: 2026-10-18
+
+The existing table is kept as it is and attached as the first partition
+(<table>_legacy, MINVALUE up to the month after its newest row), so the
+migration copies no rows. Monthly partitions follow, up to three months
+ahead, then a default partition. `flask logs-retention` (partitions.py)
+keeps creating months and retires old ones, the legacy partition included
+once it is past the retention window.
+
+Other databases are left alone; partitions.py archives and deletes by month
+there instead.
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0011_partition_logs"
+down_revision = "0010_availability"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+# table -> (indexed columns, foreign keys)
+TABLES = {
+    "audit_logs": (["user_id"], {"user_id": "users"}),
+    "twilio_logs": (["sid", "clinic_id"], {"clinic_id": "clinics"}),
+}
+
+
+def _add_months(month, count):
+    years, index = divmod(month.month - 1 + count, 12)
+    return datetime(month.year + years, index + 1, 1)
+
+
+def _key(columns):
+    # The models call it "timestamp"; databases created by 0001 alone have created_at.
+    return "timestamp" if "timestamp" in columns else "created_at"
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for table, (indexed, foreign_keys) in TABLES.items():
+        columns = {column["name"] for column in sa.inspect(bind).get_columns(table)}
+        key = _key(columns)
+        legacy = f"{table}_legacy"
+        sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+
+        # The partition key can't be NULL.
+        op.execute(f"UPDATE {table} SET \"{key}\" = '1970-01-01' WHERE \"{key}\" IS NULL")
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{key}" SET NOT NULL')
+        newest = bind.execute(sa.text(f'SELECT max("{key}") FROM {table}')).scalar()
+        boundary = max(_add_months(newest.replace(day=1, hour=0, minute=0, second=0, microsecond=0), 1),
+                       this_month) if newest else this_month
+
+        # Move the old table (and its index names) out of the way.
+        op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        for index in bind.execute(
+            sa.text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy}
+        ).scalars().all():
+            op.execute(f'ALTER INDEX "{index}" RENAME TO "{index[:56]}_legacy"')
+
+        op.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("{key}")')
+        # Unique constraints on a partitioned table must include the partition
+        # key, so the primary key is (id, key). The SID stays unique through
+        # twilio_ingest.insert_logs, which every writer goes through, not a
+        # global index.
+        op.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "{key}")')
+        op.execute(f'CREATE INDEX ix_{table}_{key} ON {table} ("{key}")')
+        for column in indexed:
+            if column in columns:
+                op.execute(f"CREATE INDEX ix_{table}_{column} ON {table} ({column})")
+        for column, target in foreign_keys.items():
+            if column in columns:
+                op.execute(f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} "
+                           f"FOREIGN KEY ({column}) REFERENCES {target} (id)")
+        if sequence:
+            # Otherwise dropping the legacy partition would drop the id sequence.
+            op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+        # A partition can't keep a primary key of its own; ATTACH builds the
+        # (id, key) one from the parent's.
+        primary_key = bind.execute(sa.text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'"
+        ), {"table": legacy}).scalar()
+        if primary_key:
+            op.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT "{primary_key}"')
+        op.execute(f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+                   f"FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')")
+        month = boundary
+        while month <= _add_months(this_month, MONTHS_AHEAD):
+            end = _add_months(month, 1)
+            op.execute(f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+                       f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')")
+            month = end
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def downgrade():
+    # Copies the rows still in the database back into plain tables; months
+    # already archived by `flask logs-retention` stay in their csv.gz files.
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table, (indexed, foreign_keys) in TABLES.items():
+        columns = {column["name"] for column in sa.inspect(bind).get_columns(table)}
+        key = _key(columns)
+        sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+        op.execute(f"CREATE TABLE {table}_flat (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table}_flat SELECT * FROM {table}")
+        if sequence:
+            op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}_flat.id")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {table}_flat RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{key}" DROP NOT NULL')
+        op.execute(f'CREATE INDEX ix_{table}_{key} ON {table} ("{key}")')
+        for column in indexed:
+            if column in columns:
+                unique = "UNIQUE " if column == "sid" else ""
+                op.execute(f"CREATE {unique}INDEX ix_{table}_{column} ON {table} ({column})")
+        for column, target in foreign_keys.items():
+            if column in columns:
+                op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {target} (id)")
@@ -0,0 +1,33 @@
+"""Per-clinic quick replies for inbound SMS
+
+Revision ID: 0012_quick_replies
+Revises: 0011_partition_logs
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0012_quick_replies"
+down_revision = "0011_partition_logs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "quick_replies",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("clinic_id", sa.Integer, sa.ForeignKey("clinics.id"), nullable=False),
+        sa.Column("keywords", sa.Text, nullable=False),
+        sa.Column("reply", sa.Text, nullable=False),
+        sa.Column("active", sa.Boolean, nullable=False, server_default=sa.true()),
+        sa.Column("updated_at", sa.DateTime),
+    )
+    op.create_index("ix_quick_replies_clinic_id", "quick_replies", ["clinic_id"])
+
+
+def downgrade():
+    op.drop_table("quick_replies")
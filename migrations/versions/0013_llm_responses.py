@@ -0,0 +1,35 @@
+"""Shared cache of LLM answers
+
+Revision ID: 0013_llm_responses
+Revises: 0012_quick_replies
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0013_llm_responses"
+down_revision = "0012_quick_replies"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "llm_responses",
+        sa.Column("key", sa.String(64), primary_key=True),
+        sa.Column("clinic_id", sa.Integer, sa.ForeignKey("clinics.id")),
+        sa.Column("model", sa.String(100), nullable=False),
+        sa.Column("prompt", sa.Text, nullable=False),
+        sa.Column("response", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("expires_at", sa.DateTime, nullable=False),
+    )
+    op.create_index("ix_llm_responses_clinic_id", "llm_responses", ["clinic_id"])
+    op.create_index("ix_llm_responses_expires_at", "llm_responses", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("llm_responses")
@@ -0,0 +1,97 @@
+"""Trigger-maintained row counters for the dashboard tiles
+
+Revision ID: 0014_counters
+Revises: 0013_llm_responses
+Create Date: 2026-10-18
+
+Each counted table gets triggers that add inserted rows to, and subtract
+deleted rows from, its row in counters. On PostgreSQL they are statement
+triggers over transition tables, so a bulk insert costs one counter update
+rather than one per row, and each backend writes its own slot, so
+concurrent writers don't queue on a single row. The initial counts are
+taken with each table locked against writes (SHARE), which briefly blocks
+inserts into the big ones. counters.py (`flask counters-recount`) carries
+the same DDL for databases built with create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "0014_counters"
+down_revision = "0013_llm_responses"
+branch_labels = None
+depends_on = None
+
+TABLES = ["users", "clinics", "appointments", "audit_logs"]
+SLOTS = 16
+
+
+def upgrade():
+    op.create_table(
+        "counters",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column("slot", sa.Integer, primary_key=True),
+        sa.Column("value", sa.BigInteger, nullable=False, server_default="0"),
+    )
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION counters_add_inserted() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO counters (name, slot, value)
+                SELECT TG_TABLE_NAME, pg_backend_pid() % {SLOTS}, count(*) FROM inserted_rows HAVING count(*) > 0
+                ON CONFLICT (name, slot) DO UPDATE SET value = counters.value + EXCLUDED.value;
+                RETURN NULL;
+            END $$
+        """)
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION counters_subtract_deleted() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO counters (name, slot, value)
+                SELECT TG_TABLE_NAME, pg_backend_pid() % {SLOTS}, -count(*) FROM deleted_rows HAVING count(*) > 0
+                ON CONFLICT (name, slot) DO UPDATE SET value = counters.value + EXCLUDED.value;
+                RETURN NULL;
+            END $$
+        """)
+        op.execute("""
+            CREATE OR REPLACE FUNCTION counters_reset() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                UPDATE counters SET value = 0 WHERE name = TG_TABLE_NAME;
+                RETURN NULL;
+            END $$
+        """)
+        for table in TABLES:
+            op.execute(f"LOCK TABLE {table} IN SHARE MODE")
+            op.execute(f"CREATE TRIGGER counters_insert AFTER INSERT ON {table} REFERENCING NEW TABLE AS inserted_rows "
+                       "FOR EACH STATEMENT EXECUTE FUNCTION counters_add_inserted()")
+            op.execute(f"CREATE TRIGGER counters_delete AFTER DELETE ON {table} REFERENCING OLD TABLE AS deleted_rows "
+                       "FOR EACH STATEMENT EXECUTE FUNCTION counters_subtract_deleted()")
+            op.execute(f"CREATE TRIGGER counters_truncate AFTER TRUNCATE ON {table} "
+                       "FOR EACH STATEMENT EXECUTE FUNCTION counters_reset()")
+            op.execute(f"INSERT INTO counters (name, slot, value) SELECT '{table}', 0, count(*) FROM {table}")
+    elif dialect == "sqlite":
+        for table in TABLES:
+            for event, delta in (("insert", "+ 1"), ("delete", "- 1")):
+                op.execute(f"""
+                    CREATE TRIGGER counters_{table}_{event} AFTER {event.upper()} ON {table} BEGIN
+                        INSERT INTO counters (name, slot, value) VALUES ('{table}', 0, 0 {delta})
+                        ON CONFLICT (name, slot) DO UPDATE SET value = value {delta};
+                    END
+                """)
+            op.execute(f"INSERT INTO counters (name, slot, value) SELECT '{table}', 0, count(*) FROM {table}")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        for table in TABLES:
+            for trigger in ("counters_insert", "counters_delete", "counters_truncate"):
+                op.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+        for function in ("counters_add_inserted", "counters_subtract_deleted", "counters_reset"):
+            op.execute(f"DROP FUNCTION IF EXISTS {function}()")
+    elif dialect == "sqlite":
+        for table in TABLES:
+            for event in ("insert", "delete"):
+                op.execute(f"DROP TRIGGER IF EXISTS counters_{table}_{event}")
+    op.drop_table("counters")
@@ -52,10 +52,23 @@ class Patient(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"))
+    # Search keys, maintained by patient_search.py
+    search_name = db.Column(db.String(161), nullable=True)
+    phone_digits = db.Column(db.String(20), nullable=True)
+    # Caller-ID key, maintained by caller_id.py
+    phone_e164 = db.Column(db.String(16), nullable=True)
 
     appointments = db.relationship("Appointment", backref="patient", lazy=True)
     doctor_notes = db.relationship("DoctorNote", backref="patient", lazy=True)
 
+    __table_args__ = (
+        db.Index("ix_patients_clinic_phone_e164", "clinic_id", "phone_e164", unique=True),
+    )
+
+    @property
+    def name(self):
+        return f"{self.first_name} {self.last_name}"
+
 
 class Appointment(db.Model):
     __tablename__ = "appointments"
@@ -64,10 +77,28 @@ class Appointment(db.Model):
     doctor_id = db.Column(db.Integer, nullable=False)
     clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"))
     scheduled_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=30, server_default="30")
     reason = db.Column(db.String(255), nullable=True)
 
     notes = db.relationship("DoctorNote", backref="appointment", lazy=True)
 
+    __table_args__ = (
+        db.Index("ix_appointments_doctor_time", "doctor_id", "scheduled_time"),
+        db.Index("ix_appointments_scheduled_time", "scheduled_time"),
+    )
+
+
+class DoctorSchedule(db.Model):
+    """Weekly working hours; several rows per weekday for split shifts (see availability.py)."""
+    __tablename__ = "doctor_schedules"
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"), nullable=True, index=True)
+    weekday = db.Column(db.SmallInteger, nullable=False)  # 0 = Monday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30, server_default="30")
+
 
 class DoctorNote(db.Model):
     __tablename__ = "doctor_notes"
@@ -98,7 +129,8 @@ class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     action = db.Column(db.String(255), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    details = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # partition key (partitions.py)
 
 
 # ----------------------------
@@ -108,10 +140,141 @@ class AuditLog(db.Model):
 class TwilioLog(db.Model):
     __tablename__ = "twilio_logs"
     id = db.Column(db.Integer, primary_key=True)
+    # Twilio MessageSid / CallSid / FaxSid. Unique index on SQLite; on partitioned
+    # PostgreSQL (migration 0011) twilio_ingest.insert_logs keeps it unique.
+    sid = db.Column(db.String(64), unique=True, nullable=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"), nullable=True)
     message_type = db.Column(db.String(20))  # SMS, CALL, FAX
     direction = db.Column(db.String(10))  # inbound / outbound
     from_number = db.Column(db.String(20))
     to_number = db.Column(db.String(20))
     status = db.Column(db.String(50))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    duration = db.Column(db.Integer, nullable=True)  # seconds, calls only
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # partition key (partitions.py)
     body = db.Column(db.Text, nullable=True)
+
+
+class TwilioRollup(db.Model):
+    """Pre-aggregated TwilioLog counts per clinic/bucket, maintained by rollups.py."""
+    __tablename__ = "twilio_rollups"
+    id = db.Column(db.Integer, primary_key=True)
+    clinic_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = no clinic
+    granularity = db.Column(db.String(4), nullable=False)  # day / hour
+    bucket = db.Column(db.DateTime, nullable=False)
+    message_type = db.Column(db.String(20), nullable=False, default="")
+    direction = db.Column(db.String(10), nullable=False, default="")
+    status = db.Column(db.String(50), nullable=False, default="")
+    count = db.Column(db.Integer, nullable=False, default=0)
+    duration = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "clinic_id", "granularity", "bucket", "message_type", "direction", "status",
+            name="uq_twilio_rollups_key",
+        ),
+        db.Index("ix_twilio_rollups_granularity_bucket", "granularity", "bucket"),
+    )
+
+
+# ----------------------------
+# Background Jobs
+# ----------------------------
+
+class Job(db.Model):
+    """A unit of background work picked up by `flask worker` (see jobs.py)."""
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / done / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    artifact_path = db.Column(db.String(255), nullable=True)
+    worker = db.Column(db.String(120), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+
+
+# ----------------------------
+# Reminders
+# ----------------------------
+
+class Reminder(db.Model):
+    """An SMS due at send_time; dispatched by `flask reminders-dispatch` (see reminders.py)."""
+    __tablename__ = "reminders"
+    id = db.Column(db.Integer, primary_key=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"), nullable=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey("appointments.id"), nullable=True, unique=True)
+    phone = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    send_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending / sending / sent / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_reminders_status_send_time", "status", "send_time"),
+    )
+
+
+# ----------------------------
+# Quick replies
+# ----------------------------
+
+class QuickReply(db.Model):
+    """A canned SMS answer, sent when an inbound text contains one of its keywords (see quick_replies.py)."""
+    __tablename__ = "quick_replies"
+    id = db.Column(db.Integer, primary_key=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"), nullable=False, index=True)
+    keywords = db.Column(db.Text, nullable=False)  # comma or newline separated words/phrases
+    reply = db.Column(db.Text, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ----------------------------
+# LLM response cache
+# ----------------------------
+
+class LLMResponse(db.Model):
+    """A cached model answer (see llm_gateway.py), keyed by a hash of clinic, model and normalized prompt."""
+    __tablename__ = "llm_responses"
+    key = db.Column(db.String(64), primary_key=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey("clinics.id"), nullable=True, index=True)
+    model = db.Column(db.String(100), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)  # normalized, for inspection
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# ----------------------------
+# Row counters
+# ----------------------------
+
+class Counter(db.Model):
+    """Running row count of table `name`, kept by triggers (see counters.py); the count is the sum over slots."""
+    __tablename__ = "counters"
+    name = db.Column(db.String(64), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True)  # spreads concurrent writers over rows
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# ----------------------------
+# Cache versions
+# ----------------------------
+
+class CacheVersion(db.Model):
+    """Counter bumped on writes so every worker's in-process cache of `name` can tell it is stale."""
+    __tablename__ = "cache_versions"
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,145 @@
+"""
+Keyset (cursor) pagination for the dashboard list views.
+
+Pages are addressed by the sort key of the last/first row shown rather than
+by an OFFSET, so fetching page 10,000 costs the same index range scan as
+fetching page 1.
+
+Query string:
+    ?limit=50                  page size (capped at MAX_PAGE_SIZE)
+    ?after=<cursor>            rows that follow <cursor> in display order
+    ?before=<cursor>           rows that precede <cursor> in display order
+
+For id-ordered lists the cursor is the row id. For time-ordered lists it is
+an ISO timestamp, optionally suffixed with "~<id>" to break ties between
+rows sharing the same timestamp (the links we generate always include it).
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+@dataclass
+class Page:
+    items: list
+    limit: int
+    next_cursor: str = None
+    prev_cursor: str = None
+    extra_args: dict = field(default_factory=dict)
+
+    @property
+    def next_url(self):
+        if self.next_cursor is None:
+            return None
+        return url_for(request.endpoint, after=self.next_cursor, limit=self.limit, **self.extra_args)
+
+    @property
+    def prev_url(self):
+        if self.prev_cursor is None:
+            return None
+        return url_for(request.endpoint, before=self.prev_cursor, limit=self.limit, **self.extra_args)
+
+
+def page_size(args=None):
+    """Read ?limit= and clamp it to [1, MAX_PAGE_SIZE]."""
+    args = request.args if args is None else args
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+# -------------------------------------------------
+# Cursor encoding
+# -------------------------------------------------
+def encode_cursor(key, row_id=None):
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    if row_id is None:
+        return str(key)
+    return f"{key}~{row_id}"
+
+
+def decode_cursor(raw, time_keyed):
+    """Return (key, id) for a cursor string, or None if it is malformed."""
+    if not raw:
+        return None
+    try:
+        if not time_keyed:
+            row_id = int(raw)
+            return row_id, row_id
+        stamp, _, row_id = raw.partition("~")
+        return datetime.fromisoformat(stamp), int(row_id) if row_id else None
+    except ValueError:
+        return None
+
+
+# -------------------------------------------------
+# Paging
+# -------------------------------------------------
+def paginate(query, id_column, sort_column=None, descending=False, args=None, extra_args=None):
+    """
+    Return one keyset Page of `query`.
+
+    `sort_column` is the indexed column the list is ordered by (e.g.
+    AuditLog.timestamp); `id_column` breaks ties. If `sort_column` is None
+    the list is ordered by id alone.
+    """
+    args = request.args if args is None else args
+    limit = page_size(args)
+    time_keyed = sort_column is not None
+    sort_column = sort_column if time_keyed else id_column
+
+    after = decode_cursor(args.get("after"), time_keyed)
+    before = None if after else decode_cursor(args.get("before"), time_keyed)
+    cursor = after or before
+
+    # Walking backwards means reading the index in the opposite direction
+    # and flipping the rows afterwards.
+    backwards = before is not None
+    reverse = descending != backwards
+
+    if cursor:
+        key, row_id = cursor
+        if not time_keyed or row_id is None:
+            bound, value = sort_column, key
+        else:
+            bound, value = tuple_(sort_column, id_column), (key, row_id)
+        query = query.filter(bound < value if reverse else bound > value)
+
+    if time_keyed:
+        order = (sort_column.desc(), id_column.desc()) if reverse else (sort_column.asc(), id_column.asc())
+    else:
+        order = (id_column.desc(),) if reverse else (id_column.asc(),)
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        if time_keyed:
+            return encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+        return encode_cursor(getattr(row, id_column.key))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = cursor_for(rows[-1])
+        if cursor and (not backwards or has_more):
+            prev_cursor = cursor_for(rows[0])
+
+    return Page(
+        items=rows,
+        limit=limit,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        extra_args=extra_args or {},
+    )
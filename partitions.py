@@ -0,0 +1,276 @@
+"""
+Monthly partitions and retention for the append-only log tables.
+
+On PostgreSQL, migration 0011 turns audit_logs and twilio_logs into tables
+range-partitioned by month on their timestamp:
+
+    <table>_legacy      everything that existed before the migration
+                        (MINVALUE up to the month after the newest row)
+    <table>_pYYYY_MM    one partition per month
+    <table>_default     safety net for rows outside every range
+
+Queries keep using the parent table. Time-bounded ones (the list views,
+exports, the feed) only touch the months they cover, and each partition's
+indexes stay the size of a month.
+
+`flask logs-retention` runs daily:
+
+  1. It creates the partitions for the next PARTITION_MONTHS_AHEAD months.
+     Any rows that landed in the default partition for those months are
+     moved in.
+  2. For every partition that ends before the retention cutoff
+     (AUDIT_LOG_RETENTION_MONTHS / TWILIO_LOG_RETENTION_MONTHS), it:
+     - detaches the partition;
+     - archives it with COPY to <LOG_ARCHIVE_DIR>/<table>/<partition>.csv.gz,
+       checking the row count;
+     - drops it.
+     A run that stops halfway leaves a detached table behind; the next run
+     archives and drops it first.
+
+Other databases (SQLite dev) have no partitions. There, the job archives
+each whole month older than the cutoff to the same file layout and
+DELETEs its rows.
+
+twilio_rollups is not touched, so reports keep their history after the raw
+logs are archived.
+"""
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import func, select, text
+
+import counters
+from models import db, AuditLog, TwilioLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "AUDIT_LOG_RETENTION_MONTHS": 12,
+    "TWILIO_LOG_RETENTION_MONTHS": 18,
+    "PARTITION_MONTHS_AHEAD": 3,
+    "LOG_ARCHIVE_DIR": None,  # defaults to <instance>/log_archive
+}
+# table -> (model, retention setting)
+TABLES = {
+    "audit_logs": (AuditLog, "AUDIT_LOG_RETENTION_MONTHS"),
+    "twilio_logs": (TwilioLog, "TWILIO_LOG_RETENTION_MONTHS"),
+}
+
+_upper_bound = re.compile(r"TO \('([^']+)'\)")
+
+
+def setting(name, app=None):
+    return (app or current_app).config.get(name, DEFAULTS[name])
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    years, index = divmod(month.month - 1 + count, 12)
+    return datetime(month.year + years, index + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def archive_dir(app=None):
+    app = app or current_app
+    return setting("LOG_ARCHIVE_DIR", app) or os.path.join(app.instance_path, "log_archive")
+
+
+# -------------------------------------------------
+# PostgreSQL catalog
+# -------------------------------------------------
+def is_partitioned(conn, table):
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    ).scalar())
+
+
+def partition_key(conn, table):
+    """The partitioning column: "timestamp", or created_at on older schemas."""
+    definition = conn.execute(text("SELECT pg_get_partkeydef(to_regclass(:table))"), {"table": table}).scalar()
+    return re.search(r"\(\"?([^\")]+)\"?\)", definition).group(1)
+
+
+def partitions(conn, table):
+    """[(name, upper bound or None)] of the attached partitions; None = default/MAXVALUE."""
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {"table": table}).all()
+    result = []
+    for name, bound in rows:
+        match = _upper_bound.search(bound)
+        result.append((name, datetime.fromisoformat(match.group(1)) if match else None))
+    return result
+
+
+def detached(conn, table):
+    """Partitions a previous run detached but did not get to archive and drop."""
+    return conn.execute(text(
+        "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND NOT c.relispartition "
+        "AND (c.relname = :legacy OR c.relname ~ :pattern) ORDER BY c.relname"
+    ), {"legacy": f"{table}_legacy", "pattern": f"^{table}_p[0-9]{{4}}_[0-9]{{2}}$"}).scalars().all()
+
+
+# -------------------------------------------------
+# Maintenance (PostgreSQL)
+# -------------------------------------------------
+def ensure_partitions(engine, table, months_ahead, today=None):
+    """Create monthly partitions up to `months_ahead` months from now; returns the new names."""
+    created = []
+    with engine.begin() as conn:
+        key = partition_key(conn, table)
+        attached = partitions(conn, table)
+        default = next((name for name, upper in attached if name.endswith("_default")), None)
+        uppers = [upper for _, upper in attached if upper is not None]
+        month = max(uppers) if uppers else month_start(today or datetime.utcnow())
+        last = add_months(month_start(today or datetime.utcnow()), months_ahead)
+        while month <= last:
+            name, end = partition_name(table, month), add_months(month, 1)
+            # Built beside the table and attached, so rows that went to the
+            # default partition in the meantime can be moved in first.
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            if default is not None:
+                conn.execute(text(
+                    f'WITH moved AS (DELETE FROM {default} WHERE "{key}" >= :start AND "{key}" < :end RETURNING *) '
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                ), {"start": month, "end": end})
+            conn.execute(text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+            created.append(name)
+            month = end
+    return created
+
+
+def archive_path(directory, table, name):
+    """<directory>/<table>/<name>.csv.gz, numbered if an earlier run already wrote one."""
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+    path, attempt = os.path.join(directory, table, f"{name}.csv.gz"), 1
+    while os.path.exists(path):
+        path = os.path.join(directory, table, f"{name}.{attempt}.csv.gz")
+        attempt += 1
+    return path
+
+
+def _archive_table(engine, name, path):
+    """COPY table `name` to gzipped CSV at `path`; returns the row count."""
+    partial = path + ".partial"
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {name}")
+            expected = cur.fetchone()[0]
+            with gzip.open(partial, "wt", newline="") as out:
+                cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+            written = cur.rowcount
+        raw.commit()
+    finally:
+        raw.close()
+    if written != expected:
+        os.remove(partial)
+        raise RuntimeError(f"Archived {written} of {expected} rows from {name}")
+    with open(partial, "rb") as handle:
+        os.fsync(handle.fileno())
+    os.replace(partial, path)
+    return written
+
+
+def retire_partitions(engine, table, cutoff, directory):
+    """Detach, archive and drop partitions entirely before `cutoff`; returns [(name, rows)]."""
+    with engine.begin() as conn:
+        leftovers = detached(conn, table)
+        old = [name for name, upper in partitions(conn, table)
+               if upper is not None and upper <= cutoff and not name.endswith("_default")]
+    for name in old:
+        with engine.begin() as conn:
+            rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            # No trigger sees a detach; take its rows off the table's count with it.
+            counters.add(conn, table, -rows)
+    retired = []
+    for name in leftovers + old:
+        rows = _archive_table(engine, name, archive_path(directory, table, name))
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("Archived and dropped %s (%s rows)", name, rows)
+        retired.append((name, rows))
+    return retired
+
+
+# -------------------------------------------------
+# Retention without partitions (SQLite and friends)
+# -------------------------------------------------
+def retire_rows(engine, model, cutoff, directory, chunk_size=10000):
+    """Archive rows older than `cutoff` a month at a time, then delete them; returns [(name, rows)]."""
+    table = model.__table__
+    key = table.c.timestamp
+    retired = []
+    while True:
+        with engine.connect() as conn:
+            oldest = conn.execute(select(func.min(key)).where(key < cutoff)).scalar()
+        if oldest is None:
+            return retired
+        oldest = datetime.fromisoformat(str(oldest)) if not isinstance(oldest, datetime) else oldest
+        month = month_start(oldest)
+        end = min(add_months(month, 1), cutoff)
+        name = partition_name(table.name, month)
+        path = archive_path(directory, table.name, name)
+        with engine.begin() as conn:
+            window = (key >= month) & (key < end)
+            result = conn.execute(select(table).where(window).order_by(table.c.id).execution_options(yield_per=chunk_size))
+            rows = 0
+            with gzip.open(path + ".partial", "wt", newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(result.keys())
+                for partition in result.partitions():
+                    writer.writerows(partition)
+                    rows += len(partition)
+            os.replace(path + ".partial", path)
+            conn.execute(table.delete().where(window))
+        retired.append((name, rows))
+
+
+# -------------------------------------------------
+# Job
+# -------------------------------------------------
+def run_retention(app=None, today=None):
+    """Create upcoming partitions and retire old ones for every log table; returns {table: retired}."""
+    app = app or current_app
+    engine = db.engine
+    today = today or datetime.utcnow()
+    directory = archive_dir(app)
+    report = {}
+    for table, (model, retention) in TABLES.items():
+        cutoff = add_months(month_start(today), -int(setting(retention, app)))
+        if engine.dialect.name == "postgresql":
+            with engine.connect() as conn:
+                partitioned = is_partitioned(conn, table)
+            if partitioned:
+                ensure_partitions(engine, table, int(setting("PARTITION_MONTHS_AHEAD", app)), today)
+                report[table] = retire_partitions(engine, table, cutoff, directory)
+                continue
+        report[table] = retire_rows(engine, model, cutoff, directory)
+    return report
+
+
+@click.command("logs-retention")
+def logs_retention_command():
+    """Create next months' log partitions; archive (csv.gz) and drop expired ones."""
+    for table, retired in run_retention().items():
+        for name, rows in retired:
+            click.echo(f"{table}: archived {name} ({rows:,} rows)")
+        if not retired:
+            click.echo(f"{table}: nothing to retire")
@@ -0,0 +1,369 @@
+"""
+Patient search for the receptionist typeahead (/patients/search?q=).
+
+Patients carry two normalized copies of what people type, kept current by
+ORM hooks (and written directly by seed-scale):
+
+    search_name   "first last", lowercased, accents and punctuation removed
+    phone_digits  the phone number with everything but digits stripped
+
+A query is classified as an email (contains "@"), a phone number (3+ digits,
+no letters) or a name, and answered:
+
+  * PostgreSQL: word-prefix matches through a GIN tsvector index first
+    ("jo smi" finds John Smith), topped up with pg_trgm similarity matches
+    for typos ("jhon smtih"); phone digits and emails use trigram / prefix
+    indexes. All from migration 0008.
+  * Anywhere else (SQLite dev): an in-memory index built on first use and
+    kept current after each commit: name word -> ids postings (walked from
+    the rarest word typed), sorted phone and email lists for prefix lookups,
+    and typo correction against the (small) vocabulary of distinct words.
+    It is rebuilt after PATIENT_SEARCH_INDEX_TTL seconds to pick up rows
+    written outside the ORM.
+"""
+import difflib
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import case, event, func, literal_column, select
+from sqlalchemy.orm import Session
+
+from models import db, Patient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_QUERY_LENGTH = 2
+INDEX_TTL = 300.0
+CANDIDATES = 500  # name matches ranked per query
+MERGE_LIMIT = 20000
+
+_non_alnum = re.compile(r"[^a-z0-9]+")
+_non_digit = re.compile(r"\D+")
+_letters = re.compile(r"[^\W\d_]")
+
+
+# -------------------------------------------------
+# Normalization
+# -------------------------------------------------
+def normalize_text(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(ch for ch in value if not unicodedata.combining(ch)).lower()
+    return _non_alnum.sub(" ", value).strip()
+
+
+def normalize_name(first_name, last_name):
+    return normalize_text(f"{first_name or ''} {last_name or ''}")
+
+
+def phone_digits(phone):
+    return _non_digit.sub("", phone or "") or None
+
+
+@event.listens_for(Patient, "before_insert")
+@event.listens_for(Patient, "before_update")
+def _normalize_patient(mapper, connection, target):
+    target.search_name = normalize_name(target.first_name, target.last_name)
+    target.phone_digits = phone_digits(target.phone)
+
+
+def classify(query):
+    """("email" | "phone" | "name", normalized query) or None if too short."""
+    query = (query or "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return None
+    if "@" in query:
+        return "email", query.lower()
+    digits = _non_digit.sub("", query)
+    if len(digits) >= 3 and not _letters.search(query):
+        return "phone", digits
+    name = normalize_text(query)
+    return ("name", name) if name else None
+
+
+# -------------------------------------------------
+# PostgreSQL
+# -------------------------------------------------
+SIMPLE = literal_column("'simple'::regconfig")
+
+
+def _top(conditions, rank, limit, clinic_id, exclude=()):
+    """Best `limit` ids by `rank`, ranking only the first CANDIDATES matches.
+
+    A short query ("jo", "555") can match a large share of the table;
+    capping the candidates keeps the ranking cost independent of that.
+    """
+    query = select(Patient.id, rank.label("rank")).where(*conditions)
+    if clinic_id is not None:
+        query = query.where(Patient.clinic_id == clinic_id)
+    if exclude:
+        query = query.where(Patient.id.notin_(exclude))
+    candidates = query.limit(CANDIDATES).subquery()
+    ranked = select(candidates.c.id).order_by(candidates.c.rank.desc(), candidates.c.id).limit(limit)
+    return db.session.execute(ranked).scalars().all()
+
+
+def _postgres_ids(kind, value, limit, clinic_id):
+    if kind == "email":
+        query = select(Patient.id).where(func.lower(Patient.email).like(_escape(value) + "%", escape="\\"))
+        if clinic_id is not None:
+            query = query.where(Patient.clinic_id == clinic_id)
+        return db.session.execute(query.order_by(func.lower(Patient.email)).limit(limit)).scalars().all()
+
+    if kind == "phone":
+        # Whole number first, then numbers starting with what was typed.
+        rank = case((Patient.phone_digits == value, 2), (Patient.phone_digits.startswith(value), 1), else_=0)
+        return _top([Patient.phone_digits.like("%" + _escape(value) + "%", escape="\\")], rank, limit, clinic_id)
+
+    # Names: every word typed is a prefix of some word of the name...
+    similarity = func.similarity(Patient.search_name, value)
+    tsquery = func.to_tsquery(SIMPLE, " & ".join(f"{token}:*" for token in value.split()))
+    ids = _top([func.to_tsvector(SIMPLE, Patient.search_name).op("@@")(tsquery)], similarity, limit, clinic_id)
+    if len(ids) >= limit:
+        return ids
+    # ...topped up with trigram matches, which forgive typos.
+    return ids + _top([Patient.search_name.op("%")(value)], similarity, limit - len(ids), clinic_id, exclude=ids)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# -------------------------------------------------
+# In-memory fallback
+# -------------------------------------------------
+class MemoryIndex:
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._rows = {}
+
+    # -------------------------------------------------
+    # Building and maintenance
+    # -------------------------------------------------
+    @staticmethod
+    def _entries(patient_id, row):
+        _, digits, email, _ = row
+        return (
+            [(digits, patient_id)] if digits else [],
+            [(digits[::-1], patient_id)] if digits else [],
+            [(email, patient_id)] if email else [],
+        )
+
+    def _build(self):
+        rows = db.session.execute(
+            select(Patient.id, Patient.search_name, Patient.phone_digits, Patient.email, Patient.clinic_id)
+            .execution_options(yield_per=10000)
+        )
+        self._rows = {
+            row.id: (row.search_name or "", row.phone_digits or "", (row.email or "").lower(), row.clinic_id)
+            for row in rows
+        }
+        lists = ([], [], [])
+        postings = {}
+        for patient_id, row in self._rows.items():
+            for entries, new in zip(lists, self._entries(patient_id, row)):
+                entries.extend(new)
+            for token in row[0].split():
+                postings.setdefault(token, set()).add(patient_id)
+        for entries in lists:
+            entries.sort()
+        self._phones, self._suffixes, self._emails = lists
+        self._postings = postings  # name word -> patient ids
+        self._vocabulary = sorted(postings)
+        self._built_at = time.monotonic()
+
+    def _lists(self):
+        return self._phones, self._suffixes, self._emails
+
+    def apply(self, upserts, deletes):
+        """Reflect committed ORM changes without a rebuild."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            for patient_id in set(deletes) | set(upserts):
+                old = self._rows.pop(patient_id, None)
+                if old is None:
+                    continue
+                for entries, stale in zip(self._lists(), self._entries(patient_id, old)):
+                    for item in stale:
+                        position = bisect_left(entries, item)
+                        if position < len(entries) and entries[position] == item:
+                            del entries[position]
+                for token in old[0].split():
+                    self._postings.get(token, set()).discard(patient_id)
+            for patient_id, row in upserts.items():
+                self._rows[patient_id] = row
+                for entries, new in zip(self._lists(), self._entries(patient_id, row)):
+                    for item in new:
+                        insort(entries, item)
+                for token in row[0].split():
+                    if token not in self._postings:
+                        self._postings[token] = set()
+                        insort(self._vocabulary, token)
+                    self._postings[token].add(patient_id)
+
+    # -------------------------------------------------
+    # Lookups
+    # -------------------------------------------------
+    @staticmethod
+    def _span(entries, prefix):
+        """Index range of the entries whose key starts with `prefix`."""
+        return bisect_left(entries, (prefix,)), bisect_left(entries, (prefix + "\uffff",))
+
+    def _prefixed(self, entries, prefix):
+        start, stop = self._span(entries, prefix)
+        for position in range(start, stop):
+            yield entries[position][1]
+
+    def _words(self, token):
+        """Name words starting with `token`, or failing that the closest ones (typos)."""
+        start = bisect_left(self._vocabulary, token)
+        words = []
+        for word in self._vocabulary[start:start + 1000]:
+            if not word.startswith(token):
+                break
+            words.append(word)
+        return words or difflib.get_close_matches(token, self._vocabulary, n=3, cutoff=0.6)
+
+    def _name_candidates(self, value):
+        """Ids whose name has a word starting with (or close to) each word typed."""
+        options = [[self._postings[word] for word in self._words(token)] for token in value.split()]
+        if not all(options):
+            return
+        # Walk the rarest word's ids and probe the other words' sets; the
+        # caller stops after CANDIDATES hits, so this never scans a whole
+        # posting list for a common name.
+        options.sort(key=lambda sets: sum(map(len, sets)))
+        # Words with several spellings are merged into one set to probe unless
+        # that would copy more ids than probing them one by one costs.
+        others = [
+            sets if len(sets) > 1 and sum(map(len, sets)) > MERGE_LIMIT
+            else (sets[0] if len(sets) == 1 else set().union(*sets),)
+            for sets in options[1:]
+        ]
+        for ids in options[0]:
+            for patient_id in ids:
+                for sets in others:
+                    if len(sets) == 1:
+                        if patient_id not in sets[0]:
+                            break
+                    elif not any(patient_id in other for other in sets):
+                        break
+                else:
+                    yield patient_id
+
+    def _name_rank(self, value):
+        # Exact name, then names starting with what was typed, then the rest.
+        def rank(patient_id):
+            name = self._rows[patient_id][0]
+            return (name != value, not name.startswith(value), len(name), patient_id)
+        return rank
+
+    def search(self, kind, value, limit, clinic_id):
+        self._ensure()
+        with self._lock:
+            if kind == "email":
+                candidates = self._prefixed(self._emails, value)
+            elif kind == "phone":
+                # Typed from the start (full number) or the end (last digits).
+                candidates = chain(self._prefixed(self._phones, value),
+                                   self._prefixed(self._suffixes, value[::-1]))
+            else:
+                candidates = self._name_candidates(value)
+
+            wanted = CANDIDATES if kind == "name" else limit
+            found = {}
+            for patient_id in candidates:
+                if clinic_id is None or self._rows[patient_id][3] == clinic_id:
+                    found[patient_id] = None
+                    if len(found) >= wanted:
+                        break
+            if kind == "name":
+                return heapq.nsmallest(limit, found, key=self._name_rank(value))
+            return list(found)[:limit]
+
+    def _ensure(self):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+                self._build()
+
+
+def get_memory_index():
+    app = current_app._get_current_object()
+    index = app.extensions.get("patient_search_index")
+    if index is None:
+        index = app.extensions.setdefault(
+            "patient_search_index", MemoryIndex(app.config.get("PATIENT_SEARCH_INDEX_TTL", INDEX_TTL))
+        )
+    return index
+
+
+@event.listens_for(Session, "after_flush")
+def _track_patients(session, flush_context):
+    changed = session.info.setdefault("patient_search", ({}, set()))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Patient):
+            changed[0][obj.id] = (obj.search_name or "", obj.phone_digits or "",
+                                  (obj.email or "").lower(), obj.clinic_id)
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            changed[1].add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_patients(session):
+    upserts, deletes = session.info.pop("patient_search", ({}, set()))
+    if not (upserts or deletes):
+        return
+    index = current_app.extensions.get("patient_search_index")
+    if index is not None:
+        index.apply(upserts, deletes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_patients(session):
+    session.info.pop("patient_search", None)
+
+
+# -------------------------------------------------
+# Search
+# -------------------------------------------------
+def search(query, limit=DEFAULT_LIMIT, clinic_id=None):
+    """Up to `limit` matching patients as dicts, best first."""
+    classified = classify(query)
+    if classified is None:
+        return []
+    kind, value = classified
+    limit = max(1, min(limit, MAX_LIMIT))
+    if db.engine.dialect.name == "postgresql":
+        ids = _postgres_ids(kind, value, limit, clinic_id)
+    else:
+        ids = get_memory_index().search(kind, value, limit, clinic_id)
+    if not ids:
+        return []
+
+    rows = db.session.execute(
+        select(Patient.id, Patient.first_name, Patient.last_name, Patient.phone, Patient.email,
+               Patient.dob, Patient.clinic_id)
+        .where(Patient.id.in_(ids))
+    ).all()
+    by_id = {row.id: row for row in rows}
+    return [
+        {
+            "id": row.id,
+            "name": f"{row.first_name} {row.last_name}",
+            "phone": row.phone,
+            "email": row.email,
+            "dob": row.dob.isoformat() if row.dob else None,
+            "clinic_id": row.clinic_id,
+        }
+        for row in (by_id.get(patient_id) for patient_id in ids)
+        if row is not None
+    ]
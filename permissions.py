@@ -0,0 +1,166 @@
+"""
+Role resolution for the permission helpers in utils.py.
+
+require_role() and the is_* checks used to walk current_user.role on every
+call, which is a lazy relationship load. The role is now resolved once per
+user with a single joined query, memoized on flask.g for the rest of the
+request, and kept in a small process-wide TTL/LRU cache across requests.
+
+The cross-request cache is keyed by (user id, version), where the version
+is the "roles" row in cache_versions (versions.py). Editing a Role, or
+moving a user to a different role, bumps it in the same transaction, which
+orphans every cached entry in every worker. A worker reads the version at
+most every VERSION_POLL_INTERVAL seconds, and right away after its own
+commits, so another worker's change shows up within that interval rather
+than after CACHE_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import g
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+
+from models import db, Role, User
+from versions import bump_version, read_version
+
+CACHE_TTL = 60.0
+CACHE_SIZE = 1024
+VERSION_NAME = "roles"
+VERSION_POLL_INTERVAL = 2.0
+
+
+class RoleCache:
+    def __init__(self, ttl=CACHE_TTL, maxsize=CACHE_SIZE, poll_interval=VERSION_POLL_INTERVAL):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self.version = None  # cache_versions["roles"] as last read
+        self._checked = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"request_hits": 0, "cache_hits": 0, "db_loads": 0, "version_checks": 0}
+
+    def current_version(self):
+        """The shared roles version, re-read once it is poll_interval old."""
+        now = time.monotonic()
+        if self.version is not None and now - self._checked < self.poll_interval:
+            return self.version
+        version = read_version(db.session.connection(), VERSION_NAME)
+        with self._lock:
+            self.stats["version_checks"] += 1
+            if version != self.version:
+                self._entries.clear()  # keyed on an older version: unreachable now
+            self.version, self._checked = version, now
+        return version
+
+    def get(self, user_id):
+        key = (user_id, self.current_version())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            role_name, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return role_name
+
+    def put(self, user_id, role_name):
+        key = (user_id, self.current_version())
+        with self._lock:
+            self._entries[key] = (role_name, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_all(self):
+        """Drop every entry and re-read the version on the next lookup."""
+        with self._lock:
+            self.version = None
+            self._entries.clear()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+
+role_cache = RoleCache()
+
+
+def load_role_name(user_id):
+    """Fetch a user's role name with one joined query."""
+    user = (
+        db.session.query(User)
+        .options(joinedload(User.role))
+        .filter(User.id == user_id)
+        .one_or_none()
+    )
+    if user is None or user.role is None:
+        return None
+    return user.role.name
+
+
+def get_role_name(user):
+    """Return the role name for `user`, hitting the DB at most once per TTL."""
+    if user is None or not getattr(user, "is_authenticated", False):
+        return None
+
+    memo = g.setdefault("_role_names", {})
+    if user.id in memo:
+        role_cache.count("request_hits")
+        return memo[user.id]
+
+    role_name = role_cache.get(user.id)
+    if role_name is not None:
+        role_cache.count("cache_hits")
+    else:
+        role_name = load_role_name(user.id)
+        role_cache.count("db_loads")
+        if role_name is not None:
+            role_cache.put(user.id, role_name)
+
+    memo[user.id] = role_name
+    return role_name
+
+
+def permission_stats():
+    """Counters for monitoring; db_hits_avoided = lookups served from a cache."""
+    stats = dict(role_cache.stats)
+    stats["db_hits_avoided"] = stats["request_hits"] + stats["cache_hits"]
+    return stats
+
+
+# -------------------------------------------------
+# Invalidation
+# -------------------------------------------------
+def _changes_roles(session, obj):
+    """Whether flushing `obj` (dirty or deleted) can change someone's role name."""
+    if isinstance(obj, Role):
+        return obj in session.deleted or session.is_modified(obj)
+    if isinstance(obj, User):
+        attrs = inspect(obj).attrs
+        return obj in session.deleted or attrs.role_id.history.has_changes() or attrs.role.history.has_changes()
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _roles_flushed(session, flush_context):
+    if not any(_changes_roles(session, obj) for obj in chain(session.dirty, session.deleted)):
+        return
+    session.info["roles_changed"] = True
+    bump_version(session.connection(), VERSION_NAME)
+
+
+@event.listens_for(Session, "after_commit")
+def _roles_committed(session):
+    if session.info.pop("roles_changed", False):
+        role_cache.invalidate_all()
+
+
+@event.listens_for(Session, "after_rollback")
+def _roles_rolled_back(session):
+    session.info.pop("roles_changed", None)
@@ -0,0 +1,45 @@
+"""
+Phone number normalization.
+
+Twilio always sends E.164 ("+15551234567"); people type "555-123-4567",
+"(555) 123 4567 ext. 12" or "0044 20 7946 0018". to_e164() turns the
+latter into the former so both can be compared with a plain equality
+(and an index). Numbers without a country code get
+PHONE_DEFAULT_COUNTRY_CODE (1, North America, unless set).
+
+This is deliberately a syntactic check, not a numbering-plan validation:
+anything that normalizes to 8-15 digits with a non-zero first digit is
+accepted, anything else gives None.
+"""
+import os
+import re
+
+DEFAULT_COUNTRY_CODE = os.environ.get("PHONE_DEFAULT_COUNTRY_CODE", "1")
+
+_extension = re.compile(r"(?:[a-z#;,].*)$", re.IGNORECASE)
+_non_digit = re.compile(r"\D+")
+
+
+def to_e164(phone, country_code=None):
+    """'+<country><number>' for `phone`, or None if it can't be one."""
+    country_code = country_code or DEFAULT_COUNTRY_CODE
+    raw = _extension.sub("", (phone or "").strip())
+    digits = _non_digit.sub("", raw)
+    if not digits:
+        return None
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]  # international prefix (most of the world)
+    elif country_code == "1" and digits.startswith("011"):
+        digits = digits[3:]  # international prefix (North America)
+    elif country_code == "1":
+        if len(digits) == 10:
+            digits = "1" + digits
+        elif not (len(digits) == 11 and digits.startswith("1")):
+            return None
+    else:
+        digits = country_code + (digits[1:] if digits.startswith("0") else digits)  # drop the trunk 0
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
@@ -0,0 +1,55 @@
+"""
+Count the SQL statements run inside a block.
+
+    with count_queries() as counter:
+        render_the_page()
+    assert counter.count <= 4, counter.statements
+
+Used by `flask check-dashboards` (dashboards.py) to catch N+1 regressions.
+Only statements issued from the current thread are counted, so background
+flushers (audit sink, registry poller...) don't skew the numbers.
+"""
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+        self._thread = threading.get_ident()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+
+
+class TooManyQueries(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None, label="block"):
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = "\n".join(f"  {i + 1}. {sql.splitlines()[0][:120]}" for i, sql in enumerate(counter.statements))
+        raise TooManyQueries(f"{label} ran {counter.count} queries (budget {limit}):\n{listing}")
@@ -0,0 +1,258 @@
+"""
+Quick replies: canned answers to the texts clinics get all day.
+
+Each clinic keeps its replies in quick_replies, each reply with trigger
+keywords or phrases ("confirm", "cancel", "what is your address"). An
+inbound SMS is checked against all of its clinic's keywords before
+anything expensive runs. The check is one pass over the text through an
+Aho-Corasick automaton, compiled per clinic and cached in the process. On a
+match, the webhook answers with the reply as TwiML, without a round trip to
+a language model. Texts with no match go on to the normal handling.
+
+Matching is on whole words, ignoring case, with punctuation treated as a
+space: "Cancel!" matches "cancel" but "cancellation" does not. When several
+keywords match, the longest wins ("cancel appointment" beats "cancel"),
+then the one earliest in the text.
+
+An edit rebuilds only its clinic's automaton. This process rebuilds it on
+commit. Other workers rebuild it when they see that the clinic's counter
+in cache_versions has moved. They check the counter at most every
+QUICK_REPLY_CHECK_INTERVAL seconds per clinic, so matching stays a dict
+lookup plus one pass over the text.
+"""
+import re
+import threading
+import time
+from collections import deque
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from clinic_registry import get_registry
+from models import db, QuickReply
+from versions import bump_version, read_version
+
+DEFAULTS = {
+    "QUICK_REPLY_CHECK_INTERVAL": 2.0,
+}
+
+_separators = re.compile(r"[\W_]+")
+
+
+def version_name(clinic_id):
+    return f"quick_replies:clinic:{clinic_id}"
+
+
+def normalize(text):
+    """Case-folded words joined by single spaces, with a space at each end."""
+    return f" {_separators.sub(' ', (text or '').casefold()).strip()} "
+
+
+def parse_keywords(text):
+    """Distinct normalized keywords from a comma or newline separated list."""
+    keywords = []
+    for part in re.split(r"[,\n]", text or ""):
+        keyword = normalize(part).strip()
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords
+
+
+# -------------------------------------------------
+# Automaton
+# -------------------------------------------------
+class Automaton:
+    """Aho-Corasick over normalized text, with its failure links folded into
+    the transitions, so matching is one dict lookup per character."""
+
+    def __init__(self, patterns):
+        # patterns: [(keyword, value)]. Keywords are matched with their
+        # surrounding spaces, which is what makes them whole-word matches.
+        self.patterns = [(f" {keyword} ", value) for keyword, value in patterns]
+        goto, outputs = [{}], [[]]
+        for index, (padded, _) in enumerate(self.patterns):
+            state = 0
+            for char in padded:
+                following = goto[state].get(char)
+                if following is None:
+                    following = goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append([])
+                state = following
+            outputs[state].append(index)
+
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for char, following in goto[state].items():
+                fail[following] = delta[fail[state]].get(char, 0)
+                outputs[following] = outputs[following] + outputs[fail[following]]
+                pending.append(following)
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def find_all(self, text):
+        """[(start, keyword, value)] for every keyword in normalized `text`."""
+        delta, outputs, found = self._delta, self._outputs, []
+        state = 0
+        for position, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            for index in outputs[state]:
+                padded, value = self.patterns[index]
+                found.append((position - len(padded) + 1, padded[1:-1], value))
+        return found
+
+    def best(self, text):
+        """(keyword, value) of the longest, then earliest, match in normalized `text`, or None."""
+        delta, outputs = self._delta, self._outputs
+        state, best, best_key = 0, None, None
+        for position, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    padded = self.patterns[index][0]
+                    key = (-len(padded), position - len(padded) + 1)
+                    if best_key is None or key < best_key:
+                        best, best_key = index, key
+        if best is None:
+            return None
+        padded, value = self.patterns[best]
+        return padded[1:-1], value
+
+
+EMPTY = Automaton([])
+
+
+# -------------------------------------------------
+# Per-clinic cache
+# -------------------------------------------------
+class QuickReplyCache:
+    def __init__(self, app, check_interval=2.0):
+        self.app = app
+        self.check_interval = check_interval
+        self.stats = {"matches": 0, "misses": 0, "builds": 0}
+        self._entries = {}  # clinic_id -> (automaton, version, checked_at)
+        self._lock = threading.Lock()  # one build at a time
+        self._counter_lock = threading.Lock()
+
+    def automaton(self, clinic_id):
+        entry = self._entries.get(clinic_id)
+        if entry is not None and time.monotonic() - entry[2] < self.check_interval:
+            return entry[0]
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                version = read_version(conn, version_name(clinic_id))
+                if entry is not None and entry[1] == version:
+                    self._entries[clinic_id] = (entry[0], version, time.monotonic())
+                    return entry[0]
+                with self._lock:
+                    rows = conn.execute(
+                        select(QuickReply.id, QuickReply.keywords, QuickReply.reply)
+                        .where(QuickReply.clinic_id == clinic_id, QuickReply.active.is_(True))
+                        .order_by(QuickReply.id)
+                    ).all()
+                    automaton = build(rows)
+                    self._entries[clinic_id] = (automaton, version, time.monotonic())
+                    with self._counter_lock:
+                        self.stats["builds"] += 1
+        return automaton
+
+    def invalidate(self, clinic_ids):
+        for clinic_id in clinic_ids:
+            self._entries.pop(clinic_id, None)
+
+    def match(self, clinic_id, text):
+        """(reply id, reply text, keyword) for `text`, or None."""
+        found = self.automaton(clinic_id).best(normalize(text))
+        with self._counter_lock:
+            self.stats["matches" if found else "misses"] += 1
+        if found is None:
+            return None
+        keyword, (reply_id, reply) = found
+        return reply_id, reply, keyword
+
+
+def build(rows):
+    """Automaton over the keywords of (id, keywords, reply) rows; a keyword claimed twice goes to the first."""
+    patterns, seen = [], set()
+    for reply_id, keywords, reply in rows:
+        for keyword in parse_keywords(keywords):
+            if keyword not in seen:
+                seen.add(keyword)
+                patterns.append((keyword, (reply_id, reply)))
+    return Automaton(patterns) if patterns else EMPTY
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions["quick_replies"] = QuickReplyCache(
+        app, check_interval=float(app.config["QUICK_REPLY_CHECK_INTERVAL"])
+    )
+
+
+def get_cache():
+    return current_app.extensions["quick_replies"]
+
+
+# -------------------------------------------------
+# Inbound SMS
+# -------------------------------------------------
+def is_inbound_sms(form):
+    status = (form.get("SmsStatus") or form.get("MessageStatus") or "").lower()
+    return bool(form.get("MessageSid") or form.get("SmsSid")) and not form.get("CallSid") and status == "received"
+
+
+def reply_for(form):
+    """The quick reply for an inbound SMS webhook, or None."""
+    if not is_inbound_sms(form) or not form.get("Body"):
+        return None
+    clinic = get_registry().by_number(form.get("To"))
+    if clinic is None:
+        return None
+    match = get_cache().match(clinic.id, form["Body"])
+    return match[1] if match is not None else None
+
+
+# -------------------------------------------------
+# Invalidation
+# -------------------------------------------------
+# A committed reply is expired (expire_on_commit), so moving it to another
+# clinic would record no old clinic_id in its history. active_history loads
+# it first, so the hook below bumps the clinic it left too.
+event.listen(QuickReply.clinic_id, "set", lambda *args: None, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _quick_replies_flushed(session, flush_context):
+    clinics = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, QuickReply):
+            clinics.update(inspect(obj).attrs.clinic_id.history.sum())
+            clinics.add(obj.clinic_id)
+    clinics.discard(None)
+    if not clinics:
+        return
+    for clinic_id in sorted(clinics):  # a fixed lock order across transactions
+        bump_version(session.connection(), version_name(clinic_id))
+    session.info.setdefault("quick_reply_clinics", set()).update(clinics)
+
+
+@event.listens_for(Session, "after_commit")
+def _quick_replies_committed(session):
+    clinics = session.info.pop("quick_reply_clinics", None)
+    if clinics and "quick_replies" in current_app.extensions:
+        get_cache().invalidate(clinics)
+
+
+@event.listens_for(Session, "after_rollback")
+def _quick_replies_rolled_back(session):
+    session.info.pop("quick_reply_clinics", None)
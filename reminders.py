@@ -0,0 +1,387 @@
+"""
+SMS reminder scheduler.
+
+Reminders live in the `reminders` table, indexed on (status, send_time).
+`flask reminders-dispatch` runs a loop that:
+
+  1. claims due reminders in batches (SELECT ... FOR UPDATE SKIP LOCKED on
+     PostgreSQL, so any number of dispatchers can run side by side without
+     double-sending),
+  2. sends them through a pluggable sender on a small thread pool,
+  3. records the outcome and a TwilioLog row per message in one transaction,
+  4. sleeps until the next reminder is due, but never longer than
+     REMINDER_POLL_INTERVAL, so a reminder goes out well under a second
+     after its send_time.
+
+Every REMINDER_GENERATE_EVERY seconds it also creates reminders for upcoming
+appointments (see generate_from_appointments), which is idempotent thanks
+to the unique appointment_id.
+
+Senders implement send(from_number, to_number, body) -> message sid and
+raise SendError on failure. FakeTwilioSender is a local stand-in for tests
+and benchmarks. REMINDER_SENDER=twilio sends each batch through the
+outbound engine (twilio_outbound.py) instead: every clinic's own account,
+with per-number rate limits and retries. Its leases are stretched when a
+batch needs longer than REMINDER_LEASE_SECONDS at those rates.
+"""
+import logging
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, insert, or_, select, update
+
+from models import db, Appointment, Clinic, Patient, Reminder
+import twilio_ingest
+from twilio_outbound import OutboundEngine, OutboundMessage, clinic_credentials
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "REMINDER_BATCH_SIZE": 200,
+    "REMINDER_CONCURRENCY": 16,
+    "REMINDER_LEASE_SECONDS": 60,
+    "REMINDER_MAX_ATTEMPTS": 3,
+    "REMINDER_POLL_INTERVAL": 0.5,
+    "REMINDER_GENERATE_EVERY": 60,
+    "REMINDER_LEAD_HOURS": 24,
+    "REMINDER_HORIZON_HOURS": 48,
+}
+RETRY_BACKOFF = timedelta(seconds=30)
+
+
+def setting(name):
+    return current_app.config.get(name, DEFAULTS[name])
+
+
+# -------------------------------------------------
+# Senders
+# -------------------------------------------------
+class SendError(Exception):
+    pass
+
+
+class FakeTwilioSender:
+    """In-process Twilio stand-in: records messages, with optional latency and failures."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, from_number, to_number, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                raise SendError("fake failure")
+            sid = f"SM{uuid.uuid4().hex}"
+            self.sent.append({"sid": sid, "from": from_number, "to": to_number, "body": body, "at": time.time()})
+        return sid
+
+
+def get_sender(app=None):
+    app = app or current_app
+    sender = app.extensions.get("reminder_sender")
+    if sender is None:
+        kind = app.config.get("REMINDER_SENDER") or ("twilio" if os.environ.get("TWILIO_ACCOUNT_SID") else "fake")
+        if kind == "twilio":
+            # Each clinic's own account, pooled and paced per number (twilio_outbound.py).
+            sender = app.extensions["twilio_outbound"]
+        else:
+            sender = FakeTwilioSender()
+        app.extensions["reminder_sender"] = sender
+    return sender
+
+
+def default_from_number():
+    return os.environ.get("TWILIO_PHONE_NUMBER") or os.environ.get("TWILIO_FROM_NUMBER")
+
+
+# -------------------------------------------------
+# Scheduling
+# -------------------------------------------------
+def _insert_ignoring_duplicates(conn, rows):
+    table = Reminder.__table__
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        conn.execute(insert(table), rows)
+        return
+    conn.execute(dialect_insert(table).on_conflict_do_nothing(index_elements=["appointment_id"]), rows)
+
+
+def reminder_text(first_name, scheduled_time):
+    return (
+        f"Hi {first_name}, this is a reminder of your appointment on "
+        f"{scheduled_time:%a %b %d at %I:%M %p}. Reply CONFIRM or CANCEL."
+    )
+
+
+def generate_from_appointments(lead=None, horizon=None, chunk_size=1000):
+    """Create reminders for appointments in the next `horizon` that don't have one yet."""
+    lead = lead or timedelta(hours=setting("REMINDER_LEAD_HOURS"))
+    horizon = horizon or timedelta(hours=setting("REMINDER_HORIZON_HOURS"))
+    now = datetime.utcnow()
+    query = (
+        select(Appointment.id, Appointment.clinic_id, Appointment.scheduled_time, Patient.first_name, Patient.phone)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .outerjoin(Reminder, Reminder.appointment_id == Appointment.id)
+        .where(
+            Appointment.scheduled_time > now,
+            Appointment.scheduled_time <= now + horizon,
+            Reminder.id.is_(None),
+            Patient.phone.isnot(None),
+        )
+    )
+    queued = 0
+    with db.engine.begin() as conn:
+        result = conn.execute(query.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            rows = [
+                {
+                    "appointment_id": appt_id,
+                    "clinic_id": clinic_id,
+                    "phone": phone,
+                    "message": reminder_text(first_name, scheduled),
+                    "send_time": max(scheduled - lead, now),
+                    "status": "pending",
+                    "attempts": 0,
+                    "created_at": now,
+                }
+                for appt_id, clinic_id, scheduled, first_name, phone in partition
+            ]
+            _insert_ignoring_duplicates(conn, rows)
+            queued += len(rows)
+    return queued
+
+
+def schedule(phone, message, send_time, clinic_id=None):
+    reminder = Reminder(phone=phone, message=message, send_time=send_time, clinic_id=clinic_id)
+    db.session.add(reminder)
+    db.session.commit()
+    return reminder
+
+
+# -------------------------------------------------
+# Dispatching
+# -------------------------------------------------
+def _expired(now):
+    return and_(Reminder.status == "sending", Reminder.locked_until < now)
+
+
+def _due(now, max_attempts):
+    return or_(
+        and_(Reminder.status == "pending", Reminder.send_time <= now),
+        # A dispatcher died mid-batch: its lease ran out, so try again.
+        and_(_expired(now), Reminder.attempts < max_attempts),
+    )
+
+
+def claim_due(limit, lease_seconds, max_attempts=None):
+    """Mark up to `limit` due reminders as ours; returns their send details."""
+    max_attempts = max_attempts or setting("REMINDER_MAX_ATTEMPTS")
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=lease_seconds)
+    with db.engine.begin() as conn:
+        # A reminder whose last allowed attempt ran out its lease most likely
+        # crashes or hangs the dispatcher, and may have reached the patient:
+        # stop sending it.
+        conn.execute(
+            update(Reminder)
+            .where(_expired(now), Reminder.attempts >= max_attempts)
+            .values(status="failed", locked_until=None,
+                    error=f"Lease expired with no attempts left (REMINDER_MAX_ATTEMPTS={max_attempts}): "
+                          "the dispatcher died or hung")
+        )
+        query = select(Reminder.id).where(_due(now, max_attempts)).order_by(Reminder.send_time).limit(limit)
+        if conn.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        ids = conn.execute(query).scalars().all()
+        if not ids:
+            return []
+        conn.execute(
+            update(Reminder)
+            .where(Reminder.id.in_(ids), _due(now, max_attempts))
+            .values(status="sending", locked_until=lease, attempts=Reminder.attempts + 1)
+        )
+        return conn.execute(
+            select(Reminder.id, Reminder.clinic_id, Reminder.phone, Reminder.message,
+                   Reminder.attempts, Clinic.twilio_number)
+            .outerjoin(Clinic, Clinic.id == Reminder.clinic_id)
+            .where(Reminder.id.in_(ids), Reminder.status == "sending", Reminder.locked_until == lease)
+        ).mappings().all()
+
+
+def extend_lease(ids, seconds):
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Reminder)
+            .where(Reminder.id.in_(ids), Reminder.status == "sending")
+            .values(locked_until=datetime.utcnow() + timedelta(seconds=seconds))
+        )
+
+
+def _send_one(sender, reminder, fallback_from):
+    from_number = reminder["twilio_number"] or fallback_from
+    try:
+        return reminder, sender.send(from_number, reminder["phone"], reminder["message"]), None
+    except Exception as exc:  # a sender bug must not take the whole batch down
+        return reminder, None, str(exc) or exc.__class__.__name__
+
+
+def record_results(results, max_attempts):
+    now = datetime.utcnow()
+    outcomes, logs = [], []
+    for reminder, sid, error in results:
+        retry_at = None
+        if error is None:
+            status = "sent"
+        elif reminder["attempts"] < max_attempts:
+            status = "pending"
+            retry_at = now + RETRY_BACKOFF * reminder["attempts"]
+        else:
+            status = "failed"
+        outcomes.append({
+            "rid": reminder["id"], "status": status, "sent_at": now if sid else None,
+            "error": error, "retry_at": retry_at,
+        })
+        logs.append({
+            "sid": sid,  # lets the status callbacks (twilio_ingest.py) update this row
+            "clinic_id": reminder["clinic_id"],
+            "message_type": "sms",
+            "direction": "outbound",
+            "from_number": reminder["twilio_number"] or default_from_number(),
+            "to_number": reminder["phone"],
+            "status": "sent" if sid else "failed",
+            "timestamp": now,
+            "body": reminder["message"],
+        })
+
+    table = Reminder.__table__
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(table.c.id == bindparam("rid"))
+            .values(status=bindparam("status"), sent_at=bindparam("sent_at"),
+                    error=bindparam("error"), locked_until=None,
+                    send_time=func.coalesce(bindparam("retry_at", type_=db.DateTime), table.c.send_time)),
+            outcomes,
+        )
+        twilio_ingest.record_sends(conn, logs)
+
+
+class Dispatcher:
+    def __init__(self, app, sender=None, batch_size=None, concurrency=None):
+        self.app = app
+        with app.app_context():
+            self.sender = sender or get_sender(app)
+            self.batch_size = batch_size or setting("REMINDER_BATCH_SIZE")
+            self.concurrency = concurrency or setting("REMINDER_CONCURRENCY")
+            self.lease_seconds = setting("REMINDER_LEASE_SECONDS")
+            self.max_attempts = setting("REMINDER_MAX_ATTEMPTS")
+            self.poll_interval = setting("REMINDER_POLL_INTERVAL")
+            self.generate_every = setting("REMINDER_GENERATE_EVERY")
+        self.pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="reminder")
+        self.sent = 0
+        self.failed = 0
+
+    def dispatch_once(self):
+        """Claim and send one batch; returns how many reminders were claimed."""
+        with self.app.app_context():
+            batch = claim_due(self.batch_size, self.lease_seconds, self.max_attempts)
+            if not batch:
+                return 0
+            fallback = default_from_number()
+            if isinstance(self.sender, OutboundEngine):
+                results = self._send_through_engine(batch, fallback)
+            else:
+                results = list(self.pool.map(lambda r: _send_one(self.sender, r, fallback), batch))
+            record_results(results, self.max_attempts)
+        failures = sum(1 for _, sid, _ in results if sid is None)
+        self.sent += len(results) - failures
+        self.failed += failures
+        return len(batch)
+
+    def _send_through_engine(self, batch, fallback):
+        messages = [
+            OutboundMessage(r["clinic_id"], r["phone"], r["message"], r["twilio_number"] or fallback) for r in batch
+        ]
+        # One busy number at 1 msg/s can need longer than the lease; keep
+        # other dispatchers from reclaiming the batch meanwhile.
+        needed = self.sender.estimate_seconds(message.from_number for message in messages)
+        if needed > self.lease_seconds / 2:
+            extend_lease([r["id"] for r in batch], needed + self.lease_seconds)
+        credentials = clinic_credentials(r["clinic_id"] for r in batch)
+        return [(reminder, result.sid, result.error)
+                for reminder, result in zip(batch, self.sender.send_many(messages, credentials))]
+
+    def seconds_until_next_due(self):
+        with self.app.app_context():
+            next_due = db.session.execute(
+                select(func.min(Reminder.send_time)).where(Reminder.status == "pending")
+            ).scalar()
+            db.session.remove()
+        if next_due is None:
+            return self.poll_interval
+        return min(max((next_due - datetime.utcnow()).total_seconds(), 0.0), self.poll_interval)
+
+    def run(self, stop=None, once=False):
+        stop = stop or threading.Event()
+        last_generated = float("-inf")
+        while not stop.is_set():
+            if time.monotonic() - last_generated >= self.generate_every:
+                with self.app.app_context():
+                    queued = generate_from_appointments()
+                if queued:
+                    logger.info("Queued %d appointment reminders", queued)
+                last_generated = time.monotonic()
+
+            claimed = self.dispatch_once()
+            if claimed >= self.batch_size:
+                continue  # behind schedule: go straight for the next batch
+            if once:
+                break
+            stop.wait(self.seconds_until_next_due())
+        self.pool.shutdown(wait=True)
+
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+@click.command("reminders-dispatch")
+@click.option("--batch-size", type=int, default=None, help="Reminders claimed per round trip.")
+@click.option("--concurrency", type=int, default=None, help="Messages in flight at once.")
+@click.option("--once", is_flag=True, help="Send everything currently due, then exit.")
+def reminders_dispatch_command(batch_size, concurrency, once):
+    """Run the reminder dispatcher loop."""
+    dispatcher = Dispatcher(current_app._get_current_object(), batch_size=batch_size, concurrency=concurrency)
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    dispatcher.run(stop, once=once)
+    click.echo(f"Sent {dispatcher.sent}, failed {dispatcher.failed}")
+
+
+@click.command("reminders-generate")
+@click.option("--lead-hours", type=float, default=None, help="How long before the appointment to send.")
+@click.option("--horizon-hours", type=float, default=None, help="How far ahead to look for appointments.")
+def reminders_generate_command(lead_hours, horizon_hours):
+    """Create reminders for upcoming appointments."""
+    queued = generate_from_appointments(
+        lead=timedelta(hours=lead_hours) if lead_hours else None,
+        horizon=timedelta(hours=horizon_hours) if horizon_hours else None,
+    )
+    click.echo(f"Queued {queued} reminders")
@@ -5,6 +5,10 @@ set -o errexit
 # Install dependencies
 pip install -r requirements.txt
 
+# Precompile Jinja templates into the on-disk bytecode cache so new workers
+# don't have to parse them on their first request
+flask compile-templates
+
 # Conditionally run migrations
 if [ "$AUTO_MIGRATE" = "true" ]; then
   echo "🚀 Running flask db upgrade..."
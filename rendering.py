@@ -0,0 +1,111 @@
+"""
+Dashboard layout and the shared streaming table renderer.
+
+List views describe their table as a list of Columns and hand over an
+iterable of rows (a list, or a Query which is read through a server-side
+cursor in batches). The layout (templates/layout.html) is compiled once per
+worker and rendered with Template.stream(), so the response goes out in
+chunks as rows are fetched instead of being concatenated into one big
+string first.
+
+Compiled templates are also kept in a Jinja bytecode cache on disk
+(TEMPLATE_CACHE_DIR), which `flask compile-templates` fills at build time so
+freshly started workers skip the parse/compile step entirely.
+"""
+import os
+
+import click
+from flask import Response, current_app, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.orm import Query
+
+LAYOUT_TEMPLATE = "layout.html"
+
+# Rows fetched per round trip when streaming straight from a Query.
+STREAM_BATCH_SIZE = 1000
+# Template events buffered into one HTTP chunk.
+STREAM_BUFFER_SIZE = 256
+
+
+class Column:
+    """One table column: a header and either an attribute name or a callable."""
+
+    def __init__(self, header, value):
+        self.header = header
+        self.value = value
+
+    def __call__(self, row):
+        if callable(self.value):
+            return self.value(row)
+        return getattr(row, self.value)
+
+
+class Table:
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self._rows = rows
+
+    @property
+    def rows(self):
+        rows = self._rows
+        if isinstance(rows, Query):
+            rows = rows.yield_per(STREAM_BATCH_SIZE)
+        for row in rows:
+            yield [column(row) for column in self.columns]
+
+
+# -------------------------------------------------
+# Template layer setup
+# -------------------------------------------------
+def init_app(app):
+    """Attach the on-disk bytecode cache, register the CLI and warm the layout."""
+    cache_dir = app.config.get("TEMPLATE_CACHE_DIR") or os.path.join(app.root_path, ".jinja_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Must be set before the first template is loaded; the environment is
+    # created lazily by app.jinja_env.
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    app.cli.add_command(compile_templates_command)
+
+    # Load the layout at import time so that, under `gunicorn --preload`, the
+    # compiled template is created once in the master and shared by forks.
+    with app.app_context():
+        get_layout()
+
+
+def get_layout():
+    """Return the compiled dashboard layout, loading it once per app."""
+    template = current_app.extensions.get("dashboard_layout")
+    if template is None:
+        template = current_app.jinja_env.get_template(LAYOUT_TEMPLATE)
+        current_app.extensions["dashboard_layout"] = template
+    return template
+
+
+@click.command("compile-templates")
+def compile_templates_command():
+    """Compile every template into the bytecode cache (run at build time)."""
+    env = current_app.jinja_env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    click.echo(f"Compiled {len(names)} templates into {env.bytecode_cache.directory}")
+
+
+def _context(**context):
+    # Compiled templates bypass render_template_string, so apply the app's
+    # context processors (request, g, url_for helpers...) ourselves.
+    current_app.update_template_context(context)
+    return context
+
+
+def render_dashboard(title, body="", **context):
+    """Render a small, fully-built dashboard page in one go."""
+    return get_layout().render(_context(title=title, body=body, **context))
+
+
+def stream_table(title, columns, rows, page=None, body=""):
+    """Stream a dashboard page whose content is a table of `rows`."""
+    context = _context(title=title, body=body, table=Table(columns, rows), page=page)
+    stream = get_layout().stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream), mimetype="text/html")
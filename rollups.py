@@ -0,0 +1,273 @@
+"""
+Incremental rollups of TwilioLog into twilio_rollups.
+
+Each log row counts towards one "day" and one "hour" bucket keyed by
+(clinic, bucket, message_type, direction, status). The counts are kept up to
+date in the same transaction as the log write:
+
+  * ORM writes are picked up by an after_flush hook (inserts, deletes and
+    status transitions, which move a count from the old status to the new).
+  * Core bulk writers (seed-scale, webhook batch writer...) call
+    record_logs() themselves.
+
+`flask rollups-backfill` rebuilds buckets from twilio_logs with one GROUP BY
+per granularity. The reports and superadmin dashboards read only from the
+rollup table, so a chart costs O(days) rather than O(messages).
+"""
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import and_, delete, event, func, inspect, insert, literal, select
+from sqlalchemy.orm import Session
+
+from models import db, TwilioLog, TwilioRollup
+
+GRANULARITIES = ("day", "hour")
+KEY_COLUMNS = ("clinic_id", "granularity", "bucket", "message_type", "direction", "status")
+
+
+def bucket_start(timestamp, granularity):
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _key_for(log, granularity, status=None):
+    return (
+        log["clinic_id"] or 0,
+        granularity,
+        bucket_start(log["timestamp"], granularity),
+        log["message_type"] or "",
+        log["direction"] or "",
+        (log["status"] if status is None else status) or "",
+    )
+
+
+# -------------------------------------------------
+# Incremental maintenance
+# -------------------------------------------------
+def apply_deltas(conn, deltas):
+    """Add {key: [count, duration]} deltas to the rollup table."""
+    rows = [
+        dict(zip(KEY_COLUMNS, key), count=count, duration=duration)
+        for key, (count, duration) in deltas.items()
+        if count or duration
+    ]
+    if not rows:
+        return
+    table = TwilioRollup.__table__
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={
+                "count": table.c.count + stmt.excluded.count,
+                "duration": table.c.duration + stmt.excluded.duration,
+            },
+        )
+        conn.execute(stmt, rows)
+        return
+
+    for row in rows:
+        match = and_(*(table.c[name] == row[name] for name in KEY_COLUMNS))
+        result = conn.execute(
+            table.update()
+            .where(match)
+            .values(count=table.c.count + row["count"], duration=table.c.duration + row["duration"])
+        )
+        if not result.rowcount:
+            conn.execute(insert(table), [row])
+
+
+def _add(deltas, log, sign, status=None):
+    for granularity in GRANULARITIES:
+        entry = deltas[_key_for(log, granularity, status)]
+        entry[0] += sign
+        entry[1] += sign * (log["duration"] or 0)
+
+
+def record_logs(conn, logs):
+    """Count freshly inserted log rows (dicts with TwilioLog column keys)."""
+    deltas = defaultdict(lambda: [0, 0])
+    for log in logs:
+        log = dict(log)
+        log.setdefault("timestamp", datetime.utcnow())
+        for name in ("clinic_id", "message_type", "direction", "status", "duration"):
+            log.setdefault(name, None)
+        _add(deltas, log, +1)
+    apply_deltas(conn, deltas)
+
+
+def record_status_changes(conn, changes):
+    """Move counts for (log dict, old_status) pairs whose status has changed."""
+    deltas = defaultdict(lambda: [0, 0])
+    for log, old_status in changes:
+        _add(deltas, log, -1, status=old_status)
+        _add(deltas, log, +1)
+    apply_deltas(conn, deltas)
+
+
+def record_changes(conn, changes):
+    """Move counts for (old log dict, new log dict) pairs, e.g. a call that
+    completed and gained a duration along with its new status."""
+    deltas = defaultdict(lambda: [0, 0])
+    for old, new in changes:
+        _add(deltas, old, -1)
+        _add(deltas, new, +1)
+    apply_deltas(conn, deltas)
+
+
+def _as_dict(log):
+    return {
+        "clinic_id": log.clinic_id,
+        "message_type": log.message_type,
+        "direction": log.direction,
+        "status": log.status,
+        "duration": log.duration,
+        "timestamp": log.timestamp,
+    }
+
+
+TRACKED_FIELDS = ("clinic_id", "message_type", "direction", "status", "duration", "timestamp")
+
+# A committed log is expired (expire_on_commit), so setting one of these
+# would record no old value in its history. active_history loads the old
+# value first, for the flush hook below to take the count out of its bucket.
+for _name in TRACKED_FIELDS:
+    event.listen(getattr(TwilioLog, _name), "set", lambda *args: None, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_twilio_logs(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0])
+    for obj in session.new:
+        if isinstance(obj, TwilioLog):
+            _add(deltas, _as_dict(obj), +1)
+    for obj in session.deleted:
+        if isinstance(obj, TwilioLog):
+            _add(deltas, _as_dict(obj), -1)
+    for obj in session.dirty:
+        if not isinstance(obj, TwilioLog):
+            continue
+        state = inspect(obj)
+        changed = {
+            name: state.attrs[name].history
+            for name in TRACKED_FIELDS
+            if state.attrs[name].history.has_changes()
+        }
+        if not changed:
+            continue
+        old = _as_dict(obj)
+        for name, history in changed.items():
+            old[name] = history.deleted[0] if history.deleted else None
+        _add(deltas, old, -1)
+        _add(deltas, _as_dict(obj), +1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+# -------------------------------------------------
+# Backfill
+# -------------------------------------------------
+def _bucket_sql(dialect, granularity, column):
+    if dialect == "postgresql":
+        return func.date_trunc(granularity, column)
+    if dialect == "sqlite":
+        # Same text format SQLAlchemy uses for DateTime on SQLite, so backfilled
+        # buckets line up with the ones written incrementally.
+        fmt = "%Y-%m-%d 00:00:00.000000" if granularity == "day" else "%Y-%m-%d %H:00:00.000000"
+        return func.strftime(fmt, column)
+    raise click.ClickException(f"rollups-backfill does not support {dialect}")
+
+
+def backfill(conn, since=None):
+    """Rebuild every bucket from `since` (a datetime, truncated to the day) onwards."""
+    logs = TwilioLog.__table__
+    rollups = TwilioRollup.__table__
+    if since is not None:
+        since = bucket_start(since, "day")
+
+    conn.execute(delete(rollups).where(rollups.c.bucket >= since) if since else delete(rollups))
+    for granularity in GRANULARITIES:
+        bucket = _bucket_sql(conn.dialect.name, granularity, logs.c.timestamp)
+        group = [
+            func.coalesce(logs.c.clinic_id, 0),
+            bucket,
+            func.coalesce(logs.c.message_type, ""),
+            func.coalesce(logs.c.direction, ""),
+            func.coalesce(logs.c.status, ""),
+        ]
+        query = select(
+            group[0], literal(granularity), *group[1:],
+            func.count(), func.coalesce(func.sum(logs.c.duration), 0),
+        ).where(logs.c.timestamp.isnot(None))
+        if since is not None:
+            query = query.where(logs.c.timestamp >= since)
+        query = query.group_by(*group)
+        conn.execute(insert(rollups).from_select(list(KEY_COLUMNS) + ["count", "duration"], query))
+
+
+@click.command("rollups-backfill")
+@click.option("--since", default=None, help="Only rebuild buckets from this date (YYYY-MM-DD).")
+def rollups_backfill_command(since):
+    """Rebuild twilio_rollups from twilio_logs."""
+    since = datetime.fromisoformat(since) if since else None
+    with db.engine.begin() as conn:
+        backfill(conn, since)
+        total = conn.execute(select(func.count()).select_from(TwilioRollup.__table__)).scalar()
+    click.echo(f"Rebuilt rollups ({total:,} buckets)")
+
+
+# -------------------------------------------------
+# Reading
+# -------------------------------------------------
+def series(message_type, days=30, clinic_id=None, direction=None, today=None):
+    """Per-day counts for the last `days` days as [(date, count), ...], zero-filled."""
+    today = bucket_start(today or datetime.utcnow(), "day")
+    start = today - timedelta(days=days - 1)
+    query = (
+        db.session.query(TwilioRollup.bucket, func.sum(TwilioRollup.count))
+        .filter(
+            TwilioRollup.granularity == "day",
+            TwilioRollup.bucket >= start,
+            TwilioRollup.message_type == message_type,
+        )
+        .group_by(TwilioRollup.bucket)
+    )
+    if clinic_id is not None:
+        query = query.filter(TwilioRollup.clinic_id == clinic_id)
+    if direction is not None:
+        query = query.filter(TwilioRollup.direction == direction)
+    counts = {bucket.date(): int(total) for bucket, total in query}
+    return [
+        (day, counts.get(day, 0))
+        for day in ((start + timedelta(days=i)).date() for i in range(days))
+    ]
+
+
+def chart_json(label, points):
+    """Chart.js line-chart data for a series() result."""
+    return json.dumps({
+        "labels": [day.isoformat() for day, _ in points],
+        "datasets": [{"label": label, "data": [count for _, count in points]}],
+    })
+
+
+def totals(days=30, clinic_id=None):
+    """{message_type: count} over the last `days` days."""
+    start = bucket_start(datetime.utcnow(), "day") - timedelta(days=days - 1)
+    query = (
+        db.session.query(TwilioRollup.message_type, func.sum(TwilioRollup.count))
+        .filter(TwilioRollup.granularity == "day", TwilioRollup.bucket >= start)
+        .group_by(TwilioRollup.message_type)
+    )
+    if clinic_id is not None:
+        query = query.filter(TwilioRollup.clinic_id == clinic_id)
+    return {message_type: int(total) for message_type, total in query}
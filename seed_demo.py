@@ -1,5 +1,6 @@
 import os
 from datetime import datetime, timedelta
+import counters
 from app import db, app
 from models import (
     Role, User, Patient, Appointment, DoctorNote,
@@ -10,6 +11,9 @@ def run_seed():
     with app.app_context():
         db.drop_all()
         db.create_all()
+        # What migration 0014 does: counter triggers for the superadmin tiles.
+        with db.engine.begin() as conn:
+            counters.recount(conn)
 
         # ----------------------------------------
         # Roles
@@ -0,0 +1,391 @@
+"""
+Bulk synthetic data generator for load testing.
+
+    flask seed-scale --clinics 200 --patients 2M --appointments 10M --twilio-logs 50M
+
+Unlike seed.py / seed_demo.py this never builds ORM objects. Rows are
+generated in NumPy batches from an RNG seeded per (table, batch), so the same
+arguments always produce the same dataset regardless of how the batches are
+scheduled. Batches are loaded with PostgreSQL COPY (or executemany on other
+databases), and independent tables are loaded in parallel:
+
+    clinics, doctors  ->  patients || twilio_logs  ->  appointments
+
+Row ids are assigned explicitly, continuing after the current max(id), so
+appointments can reference patients without reading them back.
+"""
+import csv
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import func, select, text
+
+import counters
+from availability import DEFAULT_HOURS
+from models import db, Appointment, Clinic, DoctorSchedule, Patient, Role, TwilioLog, User
+from patient_search import normalize_name, phone_digits
+from rollups import backfill as backfill_rollups
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Carlos", "Maria", "Wei", "Aisha", "Mohammed", "Priya",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor",
+    "Moore", "Jackson", "Martin", "Lee", "Nguyen", "Patel", "Khan", "Chen",
+]
+REASONS = ["Check-up", "Follow-up", "Consultation", "Vaccination", "Lab results", "Physical", None]
+SMS_BODIES = [
+    "Reminder: you have an appointment tomorrow",
+    "CONFIRM",
+    "Please call me back",
+    "What is your address?",
+    "CANCEL",
+    "Thanks!",
+]
+LOG_TYPES = ["sms", "call", "fax"]
+LOG_TYPE_WEIGHTS = [0.7, 0.25, 0.05]
+STATUSES = {
+    "sms": (["queued", "sent", "delivered", "failed", "received"], [0.02, 0.08, 0.7, 0.05, 0.15]),
+    "call": (["completed", "no-answer", "busy", "failed"], [0.8, 0.12, 0.05, 0.03]),
+    "fax": (["delivered", "failed", "received"], [0.8, 0.1, 0.1]),
+}
+
+# Seed offsets so each table draws from an independent stream.
+TABLE_SEEDS = {"clinics": 1, "doctors": 2, "patients": 3, "appointments": 4, "twilio_logs": 5,
+               "appointment_slots": 6}
+EPOCH = datetime(2025, 1, 1)
+# Appointments fall on days FIRST_DAY..FIRST_DAY + DAYS - 1 around EPOCH, in
+# 30-minute slots from 09:00 to 17:00.
+FIRST_DAY, DAYS, SLOTS_PER_DAY = -365, 455, 16
+SLOTS_PER_DOCTOR = DAYS * SLOTS_PER_DAY
+
+
+def parse_count(value):
+    """'2M' -> 2_000_000, '500k' -> 500_000, '1200' -> 1200."""
+    value = str(value).strip().lower().replace("_", "").replace(",", "")
+    multiplier = {"k": 10**3, "m": 10**6, "b": 10**9}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def patient_phone(patient_id):
+    """Deterministic, unique E.164 phone number for a generated patient id."""
+    return f"+1{2000000000 + patient_id:010d}"
+
+
+def clinic_number(clinic_id):
+    return f"+1555{clinic_id:07d}"
+
+
+# -------------------------------------------------
+# Progress reporting
+# -------------------------------------------------
+class Progress:
+    def __init__(self, totals, interval=2.0):
+        self.totals = totals
+        self.done = {name: 0 for name in totals}
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, table, rows):
+        with self._lock:
+            self.done[table] += rows
+            now = time.monotonic()
+            if now - self._last < self.interval and self.done[table] < self.totals[table]:
+                return
+            self._last = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        parts = [f"{name} {self.done[name]:,}/{self.totals[name]:,}" for name in self.totals]
+        total = sum(self.done.values())
+        click.echo(f"[{elapsed:7.1f}s] {' | '.join(parts)} — {total / elapsed:,.0f} rows/s")
+
+
+# -------------------------------------------------
+# Loading
+# -------------------------------------------------
+def load_batch(engine, table, columns, rows):
+    """Insert `rows` (tuples in `columns` order) with COPY on PostgreSQL, executemany elsewhere."""
+    if engine.dialect.name == "postgresql":
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+                )
+            raw.commit()
+        finally:
+            raw.close()
+    else:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def next_id(engine, model):
+    with engine.connect() as conn:
+        return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def reset_sequence(engine, model):
+    if engine.dialect.name != "postgresql":
+        return
+    table = model.__tablename__
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+
+
+def batches(total, batch_size):
+    for index, start in enumerate(range(0, total, batch_size)):
+        yield index, start, min(batch_size, total - start)
+
+
+def rng_for(np, seed, table, index):
+    return np.random.default_rng([seed, TABLE_SEEDS[table], index])
+
+
+# -------------------------------------------------
+# Generators (one NumPy batch -> list of row tuples)
+# -------------------------------------------------
+def gen_patients(np, seed, index, first_id, count, clinic_ids):
+    rng = rng_for(np, seed, "patients", index)
+    ids = np.arange(first_id, first_id + count)
+    first = np.asarray(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), count)]
+    last = np.asarray(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), count)]
+    dob_days = rng.integers(0, 90 * 365, count)
+    clinics = clinic_ids[rng.integers(0, len(clinic_ids), count)]
+    born = datetime(1935, 1, 1).date()
+    return [
+        (int(pid), fn, ln, born + timedelta(days=int(d)), f"patient{pid}@example.test",
+         phone, int(cid), normalize_name(fn, ln), phone_digits(phone), phone)  # generated phones are E.164
+        for pid, fn, ln, d, cid, phone in zip(ids, first, last, dob_days, clinics, map(patient_phone, map(int, ids)))
+    ]
+
+
+def slot_orders(np, seed, doctors):
+    """A shuffled order of every (day, slot) per doctor, row i for doctor i."""
+    rng = rng_for(np, seed, "appointment_slots", 0)
+    slots = np.broadcast_to(np.arange(SLOTS_PER_DOCTOR, dtype=np.int16), (doctors, SLOTS_PER_DOCTOR))
+    return rng.permuted(slots, axis=1)
+
+
+def gen_appointments(np, seed, index, first_id, count, patient_range, doctor_ids, clinic_ids, orders, position):
+    """Appointment number `position` onwards of this run. They go to the
+    doctors in turn, and each doctor's take the next of their `orders`, so
+    no two share a doctor and a slot (as availability.book requires)."""
+    rng = rng_for(np, seed, "appointments", index)
+    ids = np.arange(first_id, first_id + count)
+    patients = rng.integers(patient_range[0], patient_range[1], count)
+    numbers = np.arange(position, position + count)
+    doctors = numbers % len(doctor_ids)
+    picked = orders[doctors, numbers // len(doctor_ids)]
+    # Doctor i works at clinic i % clinics.
+    clinics = clinic_ids[doctors % len(clinic_ids)]
+    doctors = doctor_ids[doctors]
+    days = picked // SLOTS_PER_DAY + FIRST_DAY
+    slots = picked % SLOTS_PER_DAY
+    reasons = np.asarray(REASONS, dtype=object)[rng.integers(0, len(REASONS), count)]
+    return [
+        (int(aid), int(pid), int(did), int(cid),
+         EPOCH + timedelta(days=int(day), hours=9, minutes=30 * int(slot)), reason)
+        for aid, pid, did, cid, day, slot, reason in zip(ids, patients, doctors, clinics, days, slots, reasons)
+    ]
+
+
+def gen_twilio_logs(np, seed, index, first_id, count, patient_range, clinic_ids):
+    rng = rng_for(np, seed, "twilio_logs", index)
+    ids = np.arange(first_id, first_id + count)
+    types = rng.choice(len(LOG_TYPES), count, p=LOG_TYPE_WEIGHTS)
+    inbound = rng.random(count) < 0.4
+    patients = rng.integers(patient_range[0], patient_range[1], count)
+    clinics = clinic_ids[rng.integers(0, len(clinic_ids), count)]
+    seconds = rng.integers(0, 365 * 86400, count)
+    status_draw = rng.random(count)
+    bodies = np.asarray(SMS_BODIES, dtype=object)[rng.integers(0, len(SMS_BODIES), count)]
+    durations = rng.gamma(2.0, 90.0, count)  # call length in seconds, ~3 min mean
+
+    statuses = np.empty(count, dtype=object)
+    for t, log_type in enumerate(LOG_TYPES):
+        names, weights = STATUSES[log_type]
+        of_type = types == t
+        picked = np.searchsorted(np.cumsum(weights), status_draw[of_type])
+        statuses[of_type] = np.asarray(names, dtype=object)[np.minimum(picked, len(names) - 1)]
+    rows = []
+    for lid, t, inb, pid, cid, sec, status, body, duration in zip(
+        ids, types, inbound, patients, clinics, seconds, statuses, bodies, durations
+    ):
+        log_type = LOG_TYPES[t]
+        phone, clinic = patient_phone(int(pid)), clinic_number(int(cid))
+        rows.append((
+            int(lid), int(cid), log_type, "inbound" if inb else "outbound",
+            phone if inb else clinic, clinic if inb else phone,
+            status, int(duration) if log_type == "call" else None,
+            EPOCH + timedelta(seconds=int(sec)),
+            body if log_type == "sms" else None,
+        ))
+    return rows
+
+
+# -------------------------------------------------
+# Orchestration
+# -------------------------------------------------
+def ensure_clinics(engine, count, seed):
+    """Create up to `count` generated clinics; returns all clinic ids."""
+    first = next_id(engine, Clinic)
+    rows = [
+        (cid, f"Load Test Clinic {cid}", f"load-{seed}-{cid}", clinic_number(cid))
+        for cid in range(first, first + count)
+    ]
+    if rows:
+        load_batch(engine, Clinic.__table__, ["id", "name", "slug", "twilio_number"], rows)
+        reset_sequence(engine, Clinic)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(select(Clinic.id).order_by(Clinic.id))]
+
+
+def ensure_doctors(engine, count, seed):
+    role = Role.query.filter_by(name="Doctor").first()
+    if role is None:
+        role = Role(name="Doctor")
+        db.session.add(role)
+        db.session.commit()
+    first = next_id(engine, User)
+    rows = [
+        (uid, f"load_dr_{seed}_{uid}", f"load.dr.{seed}.{uid}@example.test", "!", role.id)
+        for uid in range(first, first + count)
+    ]
+    if rows:
+        load_batch(engine, User.__table__, ["id", "username", "email", "password_hash", "role_id"], rows)
+        reset_sequence(engine, User)
+    return list(range(first, first + count))
+
+
+def ensure_schedules(engine, doctor_ids, clinic_ids):
+    """Give new doctors availability.DEFAULT_HOURS at their clinic (doctor i -> clinic i % clinics)."""
+    rows = [
+        {"doctor_id": int(doctor_id), "clinic_id": int(clinic_ids[i % len(clinic_ids)]), "weekday": weekday,
+         "start_time": start, "end_time": end, "slot_minutes": slot}
+        for i, doctor_id in enumerate(doctor_ids)
+        for weekday, shifts in DEFAULT_HOURS.items()
+        for start, end, slot in shifts
+    ]
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(DoctorSchedule.__table__.insert(), rows)
+
+
+def load_table(engine, progress, model, columns, total, batch_size, generate):
+    first = next_id(engine, model)
+    for index, start, count in batches(total, batch_size):
+        load_batch(engine, model.__table__, columns, generate(index, first + start, count))
+        progress.add(model.__tablename__, count)
+    reset_sequence(engine, model)
+    return first
+
+
+def run_seed_scale(clinics, doctors, patients, appointments, twilio_logs, seed, batch_size, workers):
+    import numpy as np
+
+    engine = db.engine
+    progress = Progress({"patients": patients, "appointments": appointments, "twilio_logs": twilio_logs})
+
+    clinic_ids = np.asarray(ensure_clinics(engine, clinics, seed))
+    doctor_ids = np.asarray(ensure_doctors(engine, doctors or clinics * 5, seed))
+    if len(clinic_ids) == 0 or len(doctor_ids) == 0:
+        raise click.ClickException("Need at least one clinic and one doctor.")
+    ensure_schedules(engine, doctor_ids, clinic_ids)
+    click.echo(f"{len(clinic_ids):,} clinics, {len(doctor_ids):,} doctors ready")
+
+    first_patient = next_id(engine, Patient)
+    patient_range = (first_patient, first_patient + patients)
+    if (appointments or twilio_logs) and not patients:
+        raise click.ClickException("--appointments/--twilio-logs need --patients > 0.")
+    if appointments > len(doctor_ids) * SLOTS_PER_DOCTOR:
+        raise click.ClickException(
+            f"{len(doctor_ids):,} doctors have room for {len(doctor_ids) * SLOTS_PER_DOCTOR:,} appointments.")
+    orders = slot_orders(np, seed, len(doctor_ids)) if appointments else None
+
+    app = current_app._get_current_object()
+
+    def in_app(fn, *args):
+        def run():
+            with app.app_context():
+                return fn(*args)
+        return run
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        twilio_job = pool.submit(in_app(
+            load_table, engine, progress, TwilioLog,
+            ["id", "clinic_id", "message_type", "direction", "from_number", "to_number", "status", "duration", "timestamp", "body"],
+            twilio_logs, batch_size,
+            lambda i, first, n: gen_twilio_logs(np, seed, i, first, n, patient_range, clinic_ids),
+        ))
+        pool.submit(in_app(
+            load_table, engine, progress, Patient,
+            ["id", "first_name", "last_name", "dob", "email", "phone", "clinic_id", "search_name", "phone_digits",
+             "phone_e164"],
+            patients, batch_size,
+            lambda i, first, n: gen_patients(np, seed, i, first, n, clinic_ids),
+        )).result()
+        # Appointments reference patients, so they start once patients are in.
+        pool.submit(in_app(
+            load_table, engine, progress, Appointment,
+            ["id", "patient_id", "doctor_id", "clinic_id", "scheduled_time", "reason"],
+            appointments, batch_size,
+            lambda i, first, n: gen_appointments(np, seed, i, first, n, patient_range, doctor_ids, clinic_ids,
+                                                 orders, i * batch_size),
+        )).result()
+        twilio_job.result()
+
+    progress.report()
+    if twilio_logs:
+        # COPY bypasses the ORM hooks that keep twilio_rollups current.
+        with engine.begin() as conn:
+            backfill_rollups(conn)
+        click.echo("Rebuilt twilio_rollups")
+    # A database built with create_all() has no counter triggers or rows, and
+    # the superadmin tiles would fall back to COUNT(*).
+    with engine.begin() as conn:
+        counted = counters.recount(conn)
+    click.echo("Recounted " + ", ".join(f"{name} {rows:,}" for name, rows in counted.items()))
+
+
+@click.command("seed-scale")
+@click.option("--clinics", default="10", help="Clinics to create.")
+@click.option("--doctors", default="0", help="Doctors to create (default: 5 per clinic).")
+@click.option("--patients", default="10k", help="Patients to create, e.g. 2M.")
+@click.option("--appointments", default="50k", help="Appointments to create, e.g. 10M.")
+@click.option("--twilio-logs", default="100k", help="Twilio log rows to create, e.g. 50M.")
+@click.option("--seed", default=42, show_default=True, help="RNG seed; same seed, same data.")
+@click.option("--batch-size", default=50000, show_default=True, help="Rows per COPY/insert batch.")
+@click.option("--workers", default=3, show_default=True, help="Tables loaded in parallel.")
+def seed_scale_command(clinics, doctors, patients, appointments, twilio_logs, seed, batch_size, workers):
+    """Generate a large deterministic dataset for benchmarking."""
+    run_seed_scale(
+        clinics=parse_count(clinics),
+        doctors=parse_count(doctors),
+        patients=parse_count(patients),
+        appointments=parse_count(appointments),
+        twilio_logs=parse_count(twilio_logs),
+        seed=seed,
+        batch_size=batch_size,
+        workers=workers,
+    )
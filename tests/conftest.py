@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest  # noqa: E402
+
+import counters  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "TWILIO_INGEST_THREAD": False,
+        "TWILIO_VALIDATE_SIGNATURE": False,
+        "TWILIO_SPOOL_DIR": str(tmp_path / "spool"),
+    })
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            counters.recount(conn)  # the triggers and rows migration 0014 creates
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,22 @@
+from datetime import time
+
+from models import db, DoctorSchedule
+
+
+def test_booking_accepts_utc_offsets(app):
+    client = app.test_client()
+    response = client.post("/appointments/book", json={"doctor_id": 7, "start": "2030-01-07T10:00Z"})
+    assert response.status_code == 201
+    assert response.get_json()["start"] == "2030-01-07T10:00:00"
+    # The same instant written with another offset is the same, taken, slot.
+    response = client.post("/appointments/book", json={"doctor_id": 7, "start": "2030-01-07T11:00+01:00"})
+    assert response.status_code == 409
+
+
+def test_availability_accepts_utc_offsets(app):
+    db.session.add(DoctorSchedule(doctor_id=7, weekday=0, start_time=time(9), end_time=time(12)))
+    db.session.commit()
+    response = app.test_client().get("/availability?doctor_id=7&start=2030-01-07T00:00Z&end=2030-01-08T00:00%2B00:00")
+    assert response.status_code == 200
+    [doctor] = response.get_json()["doctors"]
+    assert doctor["slots"][0] == "2030-01-07T09:00"
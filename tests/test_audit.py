@@ -0,0 +1,16 @@
+from audit import get_sink
+from models import AuditLog
+
+
+def test_entries_recorded_after_a_flush_are_written(app):
+    sink = get_sink()
+    sink.record(None, "first")
+    sink.flush()
+    first_queue = sink._queue
+    sink.record(None, "second")
+    sink.record(None, "third")
+    assert sink._queue is not first_queue
+    sink.close()
+
+    assert sorted(log.action for log in AuditLog.query) == ["first", "second", "third"]
+    assert sink.stats() == {"written": 3, "dropped": 0, "pending": 0}
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import calendar_feed
+from models import db, Appointment, Clinic
+from versions import read_version
+
+WEEK = "start=2030-01-07T00:00:00&end=2030-01-14T00:00:00"
+
+
+def feed_ids(client, query=""):
+    response = client.get(f"/appointments/feed?{WEEK}{query}")
+    assert response.status_code == 200
+    return sorted(item["id"] for item in response.get_json())
+
+
+def test_unchanged_week_is_a_304(app):
+    client = app.test_client()
+    response = client.get(f"/appointments/feed?{WEEK}")
+    etag = response.headers["ETag"]
+    again = client.get(f"/appointments/feed?{WEEK}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+
+def test_booking_invalidates_the_clinic_and_the_all_clinics_feed(app):
+    clinic = Clinic(name="North", slug="north")
+    db.session.add(clinic)
+    db.session.commit()
+    client = app.test_client()
+    etag = client.get(f"/appointments/feed?{WEEK}").headers["ETag"]
+    assert feed_ids(client, f"&clinic_id={clinic.id}") == []
+
+    booked = client.post("/appointments/book", json={"doctor_id": 7, "start": "2030-01-08T10:00",
+                                                      "clinic_id": clinic.id}).get_json()["id"]
+    unclinic = client.post("/appointments/book", json={"doctor_id": 8, "start": "2030-01-08T10:00"}).get_json()["id"]
+
+    assert feed_ids(client, f"&clinic_id={clinic.id}") == [booked]
+    assert client.get(f"/appointments/feed?{WEEK}", headers={"If-None-Match": etag}).status_code == 200
+    assert feed_ids(client) == sorted([booked, unclinic])
+
+
+def test_moving_a_committed_appointment_bumps_both_clinics(app):
+    north, south = Clinic(name="North", slug="north"), Clinic(name="South", slug="south")
+    db.session.add_all([north, south])
+    db.session.commit()
+    appointment = Appointment(doctor_id=7, clinic_id=north.id, scheduled_time=datetime(2030, 1, 8, 10))
+    db.session.add(appointment)
+    db.session.commit()
+    north_id, south_id, appointment_id = north.id, south.id, appointment.id
+    client = app.test_client()
+    assert feed_ids(client, f"&clinic_id={north_id}") == [appointment_id]
+
+    db.session.expire_all()  # as after a commit
+    appointment.clinic_id = south_id
+    db.session.commit()
+
+    conn = db.session.connection()
+    assert read_version(conn, calendar_feed.version_name(north_id)) == 2
+    assert read_version(conn, calendar_feed.version_name(south_id)) == 1
+    assert feed_ids(client, f"&clinic_id={north_id}") == []
+    assert feed_ids(client, f"&clinic_id={south_id}") == [appointment_id]
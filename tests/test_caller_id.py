@@ -0,0 +1,27 @@
+import caller_id
+from models import db, Clinic, Patient
+
+
+def test_shared_family_number_keys_the_first_patient_only(app):
+    clinic = Clinic(name="North", slug="north", twilio_number="+15550199")
+    parent = Patient(first_name="Ann", last_name="Lee", phone="(555) 010-0100", clinic=clinic)
+    db.session.add_all([clinic, parent])
+    db.session.commit()
+
+    child = Patient(first_name="Bo", last_name="Lee", phone="555-010-0100", clinic=clinic)
+    twin = Patient(first_name="Cy", last_name="Lee", phone="555.010.0100", clinic=clinic)
+    db.session.add_all([child, twin])
+    db.session.commit()
+
+    assert parent.phone_e164 == "+15550100100"
+    assert (child.phone_e164, twin.phone_e164) == (None, None)
+    assert child.phone == "555-010-0100"
+    _, caller = caller_id.identify("+15550100100", "+15550199")
+    assert caller.patient_id == parent.id
+
+    # The number comes free: a later edit of another patient can claim it.
+    parent.phone = None
+    db.session.commit()
+    child.phone = "555 010 0100 "
+    db.session.commit()
+    assert child.phone_e164 == "+15550100100"
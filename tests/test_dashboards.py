@@ -0,0 +1,59 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import dashboards
+from models import db, Appointment, AuditLog, Clinic, DoctorNote, NurseProfile, Patient, Role, TwilioLog, User
+
+ROLE_VIEWS = ("doctor", "receptionist", "nurse")
+
+
+@pytest.fixture
+def staff(app):
+    roles = {name: Role(name=name) for name in ("doctor", "nurse", "superadmin")}
+    users = {
+        name: User(username=name, email=f"{name}@example.com", password_hash="x", role=role)
+        for name, role in roles.items()
+    }
+    clinic = Clinic(name="North", slug="north")
+    db.session.add_all([clinic, *users.values()])
+    db.session.flush()
+    db.session.add(NurseProfile(nurse_id=users["nurse"].id, specialization="triage"))
+    db.session.commit()
+    return {"doctor_id": users["doctor"].id, "user_id": users["nurse"].id, "clinic_id": clinic.id}
+
+
+def seed(params, rows, start=0):
+    """Add `rows` patients, each with an appointment today and tomorrow, a note, an audit entry and two Twilio logs."""
+    today = datetime.combine(date.today(), time.min)
+    for i in range(start, start + rows):
+        patient = Patient(first_name=f"Pat{i}", last_name=f"Ient{i}", email=f"p{i}@example.com",
+                          dob=date(1980, 1, 1), clinic_id=params["clinic_id"])
+        db.session.add(patient)
+        for day in (today, today + timedelta(days=1)):
+            appointment = Appointment(patient=patient, doctor_id=params["doctor_id"], clinic_id=params["clinic_id"],
+                                      scheduled_time=day + timedelta(minutes=i), reason="checkup")
+            db.session.add(appointment)
+        db.session.add(DoctorNote(patient=patient, appointment=appointment, doctor_id=params["doctor_id"],
+                                  content=f"note {i}"))
+        db.session.add(AuditLog(user_id=params["user_id"], action="view", details=f"patient {i}"))
+        for message_type in ("sms", "call"):
+            db.session.add(TwilioLog(sid=f"{message_type}{i}", clinic_id=params["clinic_id"], message_type=message_type,
+                                     direction="inbound", from_number="+15550100", to_number="+15550199",
+                                     status="received", body="hi"))
+    db.session.commit()
+
+
+@pytest.mark.parametrize("rows", [1, 50])
+@pytest.mark.parametrize("name", list(dashboards.QUERY_BUDGETS))
+def test_dashboard_within_budget(staff, name, rows):
+    seed(staff, rows)
+    assert dashboards.check(name, **staff) <= dashboards.QUERY_BUDGETS[name][2]
+
+
+def test_role_dashboards_query_count_does_not_grow_with_rows(staff):
+    seed(staff, 1)
+    few = {name: dashboards.check(name, **staff) for name in ROLE_VIEWS}
+    seed(staff, 49, start=1)
+    many = {name: dashboards.check(name, **staff) for name in ROLE_VIEWS}
+    assert many == few
@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+import exports
+from models import db, AuditLog
+
+
+def add_logs(rows):
+    db.session.add_all(AuditLog(action="view", details=f"row {i}") for i in range(rows))
+    db.session.commit()
+
+
+def test_pdf_export_is_written_up_to_the_row_cap(app):
+    add_logs(30)
+    out = io.BytesIO()
+    exports.write_pdf(exports.audit_log_query(), out, max_rows=30)
+    assert out.getvalue().startswith(b"%PDF")
+
+
+def test_pdf_export_past_the_row_cap_is_refused(app, monkeypatch):
+    add_logs(31)
+    with pytest.raises(exports.ExportTooLarge):
+        exports.write_pdf(exports.audit_log_query(), io.BytesIO(), max_rows=30)
+
+    monkeypatch.setattr(exports, "PDF_MAX_ROWS", 30)
+    response = app.test_client().get("/audit_logs/export/pdf")
+    assert response.status_code == 400
+    assert b"limited to 30 rows" in response.data
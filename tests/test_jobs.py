@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import jobs
+from models import db, Job
+
+
+def test_expired_lease_is_reclaimed_until_the_attempt_cap(app):
+    app.config["JOB_MAX_ATTEMPTS"] = 2
+    stale = datetime.utcnow() - timedelta(minutes=1)
+    retry = Job(kind="export", status="running", attempts=1, locked_until=stale)
+    dead = Job(kind="export", status="running", attempts=2, locked_until=stale)
+    db.session.add_all([retry, dead])
+    db.session.commit()
+
+    assert jobs.claim_jobs(10, "w1") == [retry.id]
+    db.session.expire_all()
+    assert (retry.status, retry.attempts) == ("running", 2)
+    assert (dead.status, dead.attempts, dead.locked_until) == ("failed", 2, None)
+    assert "Lease expired" in dead.error
+
+
+def test_permanent_errors_fail_on_the_first_attempt(app):
+    job = Job(kind="audit_log_export", params='{"format": "doc"}')
+    db.session.add(job)
+    db.session.commit()
+
+    [job_id] = jobs.claim_jobs(1, "w1")
+    assert jobs.run_job(job_id) == "failed"
+    assert job.attempts == 1
+    assert jobs.job_status(job)["error"] == "jobs.PermanentJobError: Unknown export format: doc"
+
+
+def test_failed_attempts_are_retried_after_a_backoff(app, monkeypatch):
+    def flaky(params, artifact_base):
+        raise OSError("disk full")
+
+    monkeypatch.setitem(jobs.HANDLERS, "flaky", flaky)
+    job = Job(kind="flaky")
+    db.session.add(job)
+    db.session.commit()
+
+    [job_id] = jobs.claim_jobs(1, "w1")
+    assert jobs.run_job(job_id) == "queued"
+    assert job.locked_until > datetime.utcnow()
+    assert jobs.claim_jobs(1, "w1") == []
+
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert jobs.claim_jobs(1, "w1") == [job_id]
+
+
+def test_job_status_with_a_blank_error(app):
+    job = Job(kind="export", status="failed", error=" \n")
+    assert jobs.job_status(job)["error"] is None
@@ -0,0 +1,29 @@
+import time
+
+import instrumentation
+
+def test_metrics_creates_a_missing_metrics_dir(app, tmp_path):
+    directory = tmp_path / "not-yet" / "metrics"
+    app.config["METRICS_DIR"] = str(directory)
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert directory.is_dir()
+
+
+def test_sampler_only_wakes_while_a_request_is_in_flight(app):
+    state = app.extensions["instrumentation"]
+    seen = []
+
+    @app.route("/test/slow")
+    def slow():
+        seen.append((state.busy.is_set(), instrumentation._current.get()))
+        time.sleep(state.profile_after + 10 * state.sample_interval)
+        return ""
+
+    app.test_client().get("/metrics")
+    assert not state.busy.is_set() and not state.inflight
+
+    app.test_client().get("/test/slow")
+    [(busy, metrics)] = seen
+    assert busy and sum(metrics.samples.values()) > 0
+    assert not state.busy.is_set()
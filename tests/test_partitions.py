@@ -0,0 +1,45 @@
+import csv
+import gzip
+from datetime import datetime
+
+from sqlalchemy import func
+
+import partitions
+from models import db, AuditLog, Counter, TwilioLog
+
+TODAY = datetime(2026, 6, 15)
+
+
+def exact_count(name):
+    return db.session.query(func.sum(Counter.value)).filter(Counter.name == name).scalar()
+
+
+def test_retention_archives_and_deletes_old_months(app, tmp_path):
+    app.config.update(LOG_ARCHIVE_DIR=str(tmp_path), AUDIT_LOG_RETENTION_MONTHS=12, TWILIO_LOG_RETENTION_MONTHS=18)
+    # Cutoffs: audit_logs 2025-06-01, twilio_logs 2024-12-01.
+    db.session.add_all(
+        [AuditLog(action=f"old {i}", timestamp=datetime(2025, 3, 1 + i)) for i in range(3)]
+        + [AuditLog(action="older", timestamp=datetime(2024, 11, 30, 23, 59))]
+        + [AuditLog(action="kept", timestamp=datetime(2025, 6, 1)), AuditLog(action="new", timestamp=TODAY)]
+        + [TwilioLog(sid="SM1", status="sent", timestamp=datetime(2024, 11, 2)),
+           TwilioLog(sid="SM2", status="sent", timestamp=datetime(2025, 3, 2))]
+    )
+    db.session.commit()
+    assert exact_count("audit_logs") == 6
+
+    report = partitions.run_retention(app, today=TODAY)
+
+    assert report == {
+        "audit_logs": [("audit_logs_p2024_11", 1), ("audit_logs_p2025_03", 3)],
+        "twilio_logs": [("twilio_logs_p2024_11", 1)],
+    }
+    with gzip.open(tmp_path / "audit_logs" / "audit_logs_p2025_03.csv.gz", "rt", newline="") as archive:
+        header, *rows = list(csv.reader(archive))
+    assert "action" in header
+    assert sorted(row[header.index("action")] for row in rows) == ["old 0", "old 1", "old 2"]
+    assert (tmp_path / "twilio_logs" / "twilio_logs_p2024_11.csv.gz").exists()
+
+    assert sorted(log.action for log in AuditLog.query) == ["kept", "new"]
+    assert [log.sid for log in TwilioLog.query] == ["SM2"]
+    assert exact_count("audit_logs") == 2
+    assert partitions.run_retention(app, today=TODAY) == {"audit_logs": [], "twilio_logs": []}
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from flask import g
+
+import permissions
+from models import db, Role, User
+from versions import bump_version
+
+
+def role_of(app, user_id):
+    # The fixture's app context outlives each request: reset what teardown would.
+    with app.test_request_context():
+        g.pop("_role_names", None)
+        try:
+            return permissions.get_role_name(SimpleNamespace(id=user_id, is_authenticated=True))
+        finally:
+            db.session.remove()
+
+
+def add_user(monkeypatch, poll_interval):
+    cache = permissions.RoleCache(poll_interval=poll_interval)
+    monkeypatch.setattr(permissions, "role_cache", cache)
+    doctor, nurse = Role(name="doctor"), Role(name="nurse")
+    user = User(username="u", email="u@example.com", password_hash="x", role=doctor)
+    db.session.add_all([doctor, nurse, user])
+    db.session.commit()
+    return cache, user.id, nurse.id
+
+
+def test_role_change_in_another_worker_is_seen_after_the_poll_interval(app, monkeypatch):
+    cache, user_id, nurse_id = add_user(monkeypatch, poll_interval=0)
+    assert role_of(app, user_id) == "doctor"
+
+    # Another worker moves the user: all this process sees is the version bump.
+    with db.engine.begin() as conn:
+        conn.execute(User.__table__.update().values(role_id=nurse_id))
+        bump_version(conn, permissions.VERSION_NAME)
+    assert role_of(app, user_id) == "nurse"
+
+
+def test_local_role_change_bumps_the_version(app, monkeypatch):
+    cache, user_id, nurse_id = add_user(monkeypatch, poll_interval=3600)
+    assert role_of(app, user_id) == "doctor"
+    version = cache.version
+
+    db.session.get(User, user_id).role = db.session.get(Role, nurse_id)
+    db.session.commit()
+    assert role_of(app, user_id) == "nurse"
+    assert cache.version == version + 1
@@ -0,0 +1,36 @@
+import quick_replies
+from models import db, Clinic, QuickReply
+from versions import read_version
+
+
+def test_matching_is_whole_word_and_longest_first():
+    automaton = quick_replies.build([(1, "cancel", "Cancelled."), (2, "cancel appointment", "Which one?")])
+    normalize = quick_replies.normalize
+    assert automaton.best(normalize("Please CANCEL appointment!"))[0] == "cancel appointment"
+    assert automaton.best(normalize("Cancel!"))[0] == "cancel"
+    assert automaton.best(normalize("cancellation policy?")) is None
+
+
+def test_moving_a_committed_reply_rebuilds_both_clinics_in_other_workers(app):
+    north, south = Clinic(name="North", slug="north"), Clinic(name="South", slug="south")
+    db.session.add_all([north, south])
+    db.session.commit()
+    north_id, south_id = north.id, south.id
+    reply = QuickReply(clinic_id=north_id, keywords="address", reply="12 Main St.")
+    db.session.add(reply)
+    db.session.commit()
+
+    # Another worker: its cache only learns about edits from cache_versions.
+    other = quick_replies.QuickReplyCache(app, check_interval=0)
+    assert other.match(north_id, "what is your address")[1] == "12 Main St."
+    assert other.match(south_id, "what is your address") is None
+
+    db.session.expire_all()
+    reply.clinic_id = south_id
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        assert read_version(conn, quick_replies.version_name(north_id)) == 2
+        assert read_version(conn, quick_replies.version_name(south_id)) == 1
+    assert other.match(north_id, "what is your address") is None
+    assert other.match(south_id, "what is your address")[1] == "12 Main St."
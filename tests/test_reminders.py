@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import reminders
+from models import db, Appointment, Patient, Reminder
+
+
+def due(count, send_time=None):
+    send_time = send_time or datetime.utcnow() - timedelta(seconds=1)
+    rows = [Reminder(phone=f"+1555010{i:04d}", message=f"Reminder {i}", send_time=send_time) for i in range(count)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def dispatcher(app, sender, **options):
+    return reminders.Dispatcher(app, sender=sender, concurrency=2, **options)
+
+
+def test_due_reminders_are_sent_and_marked_sent(app):
+    ids = due(3)
+    later = due(1, send_time=datetime.utcnow() + timedelta(hours=1))
+    sender = reminders.FakeTwilioSender()
+
+    assert dispatcher(app, sender).dispatch_once() == 3
+    assert sorted(message["body"] for message in sender.sent) == ["Reminder 0", "Reminder 1", "Reminder 2"]
+    db.session.expire_all()
+    for reminder in [db.session.get(Reminder, rid) for rid in ids]:
+        assert (reminder.status, reminder.attempts, reminder.locked_until) == ("sent", 1, None)
+        assert reminder.sent_at is not None
+    assert db.session.get(Reminder, later[0]).status == "pending"
+
+
+def test_two_dispatchers_never_send_a_reminder_twice(app):
+    due(10)
+    first, second = reminders.FakeTwilioSender(), reminders.FakeTwilioSender()
+    one, two = dispatcher(app, first, batch_size=3), dispatcher(app, second, batch_size=3)
+
+    # The first has a batch in flight when the second polls.
+    claimed = reminders.claim_due(3, 60)
+    while one.dispatch_once() + two.dispatch_once():
+        pass
+    sent = [message["to"] for message in first.sent + second.sent]
+    assert len(sent) == len(set(sent)) == 7
+    assert {row["phone"] for row in claimed}.isdisjoint(sent)
+
+
+def test_failures_are_retried_until_the_attempt_cap(app):
+    app.config["REMINDER_MAX_ATTEMPTS"] = 3
+    [rid] = due(1)
+    failing = dispatcher(app, reminders.FakeTwilioSender(failure_rate=1.0))
+
+    for attempt in (1, 2, 3):
+        assert failing.dispatch_once() == 1
+        reminder = db.session.get(Reminder, rid)
+        assert reminder.attempts == attempt
+        if attempt < 3:
+            assert reminder.status == "pending"
+            assert reminder.send_time > datetime.utcnow()  # backed off
+            reminder.send_time = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+    assert (reminder.status, reminder.error) == ("failed", "fake failure")
+    assert failing.dispatch_once() == 0
+
+
+def test_generate_from_appointments_is_idempotent(app):
+    patient = Patient(first_name="Ada", last_name="Lovelace", phone="+15550100")
+    db.session.add(patient)
+    db.session.flush()
+    db.session.add(Appointment(patient_id=patient.id, doctor_id=7,
+                               scheduled_time=datetime.utcnow() + timedelta(hours=30)))
+    db.session.commit()
+
+    assert reminders.generate_from_appointments() == 1
+    assert reminders.generate_from_appointments() == 0
+    [reminder] = Reminder.query.all()
+    assert reminder.phone == "+15550100" and reminder.status == "pending"
+
+
+def test_expired_lease_is_reclaimed_until_the_attempt_cap(app):
+    stale = datetime.utcnow() - timedelta(minutes=1)
+    retry = Reminder(phone="+15550100", message="Hi", send_time=stale, status="sending", attempts=1,
+                     locked_until=stale)
+    dead = Reminder(phone="+15550101", message="Hi", send_time=stale, status="sending", attempts=2,
+                    locked_until=stale)
+    db.session.add_all([retry, dead])
+    db.session.commit()
+
+    assert [r["id"] for r in reminders.claim_due(10, 60, max_attempts=2)] == [retry.id]
+    db.session.expire_all()
+    assert (retry.status, retry.attempts) == ("sending", 2)
+    assert (dead.status, dead.attempts, dead.locked_until) == ("failed", 2, None)
+    assert "Lease expired" in dead.error
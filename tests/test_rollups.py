@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from models import db, Clinic, TwilioLog, TwilioRollup
+
+DAY = datetime(2025, 3, 4)
+
+
+def rollup_rows():
+    return sorted(
+        (r.clinic_id, r.granularity, r.bucket, r.message_type, r.direction, r.status, r.count, r.duration)
+        for r in TwilioRollup.query if r.count or r.duration
+    )
+
+
+def day_counts():
+    return {(r.clinic_id, r.status): r.count for r in TwilioRollup.query.filter_by(granularity="day") if r.count}
+
+
+def log(status, **fields):
+    fields.setdefault("timestamp", DAY.replace(hour=9))
+    return TwilioLog(message_type="sms", direction="outbound", status=status, **fields)
+
+
+def test_inserts_and_updates_after_commit_move_the_counts(app):
+    clinic = Clinic(name="North", slug="north")
+    first, second = log("queued"), log("sent")
+    db.session.add_all([clinic, first, second])
+    db.session.commit()
+    assert day_counts() == {(0, "queued"): 1, (0, "sent"): 1}
+
+    # Both are expired by the commit; the hook still sees the old values.
+    first.status = "delivered"
+    second.clinic_id = clinic.id
+    db.session.commit()
+    assert day_counts() == {(0, "delivered"): 1, (clinic.id, "sent"): 1}
+
+    db.session.delete(first)
+    db.session.commit()
+    assert day_counts() == {(clinic.id, "sent"): 1}
+
+
+def test_backfill_agrees_with_the_incremental_rollups(app):
+    logs = [log("queued"), log("delivered", timestamp=DAY.replace(hour=15)),
+            log("completed", duration=90), log("received", timestamp=datetime(2025, 3, 5, 1))]
+    logs[2].message_type = "call"
+    db.session.add_all(logs)
+    db.session.commit()
+    logs[0].status = "failed"
+    db.session.delete(logs[3])
+    db.session.commit()
+    incremental = rollup_rows()
+
+    result = app.test_cli_runner().invoke(args=["rollups-backfill"])
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert rollup_rows() == incremental
+    assert len(incremental) == 6  # three day buckets, three hour buckets
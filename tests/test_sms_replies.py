@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+
+import jobs
+import twilio_ingest
+import twilio_outbound
+from models import db, Clinic, Job
+
+INBOUND = {"MessageSid": "SM1", "SmsStatus": "received", "From": "+15550100", "To": "+15550199",
+           "Body": "What time do you open?"}
+
+
+def test_webhook_queues_the_model_reply_and_the_job_texts_it(app, monkeypatch):
+    app.config["LLM_SMS_REPLIES"] = True
+    clinic = Clinic(name="North", slug="north", twilio_number="+15550199")
+    db.session.add(clinic)
+    db.session.commit()
+    clinic_id = clinic.id
+    sent = []
+    monkeypatch.setattr(twilio_outbound, "send_and_record", lambda messages: sent.extend(messages) or (1, 0))
+
+    response = app.test_client().post("/twilio/webhook", data=INBOUND)
+    assert response.get_data(as_text=True) == twilio_ingest.TWIML_EMPTY
+    job = Job.query.one()
+    assert (job.kind, job.status) == ("sms_reply", "queued")
+    assert not sent
+
+    for job_id in jobs.claim_jobs(1, "test"):
+        assert jobs.run_job(job_id) == "done"
+    [message] = sent
+    assert (message.clinic_id, message.to_number) == (clinic_id, "+15550100")
+    assert message.body
+
+
+def sign(auth_token, url, form):
+    payload = url + "".join(f"{key}{value}" for key, value in sorted(form.items()))
+    return base64.b64encode(hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()).decode()
+
+
+def test_webhooks_refuse_unsigned_posts(app):
+    app.config.update(TWILIO_VALIDATE_SIGNATURE=True, TWILIO_AUTH_TOKEN="secret", LLM_SMS_REPLIES=True)
+    client = app.test_client()
+
+    assert client.post("/twilio/webhook", data=INBOUND).status_code == 403
+    assert client.post("/twilio/voice", data=INBOUND).status_code == 403
+    forged = {"X-Twilio-Signature": sign("guess", "http://localhost/twilio/webhook", INBOUND)}
+    assert client.post("/twilio/webhook", data=INBOUND, headers=forged).status_code == 403
+    assert twilio_ingest.get_spool().appended == 0
+    assert Job.query.count() == 0
+
+    signed = {"X-Twilio-Signature": sign("secret", "http://localhost/twilio/webhook", INBOUND)}
+    assert client.post("/twilio/webhook", data=INBOUND, headers=signed).status_code == 200
+    assert twilio_ingest.get_spool().appended == 1
+
+
+def test_webhooks_refuse_posts_when_no_auth_token_resolves(app):
+    app.config["TWILIO_VALIDATE_SIGNATURE"] = True
+    signed = {"X-Twilio-Signature": sign("", "http://localhost/twilio/webhook", INBOUND)}
+    assert app.test_client().post("/twilio/webhook", data=INBOUND, headers=signed).status_code == 403
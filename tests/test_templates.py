@@ -0,0 +1,21 @@
+import os
+import re
+
+from flask import render_template
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def test_templates_only_link_to_registered_endpoints(app):
+    endpoints = set()
+    for folder, _, files in os.walk(TEMPLATES):
+        for name in files:
+            with open(os.path.join(folder, name), encoding="utf-8") as fh:
+                endpoints.update(re.findall(r"url_for\('([\w.]+)'", fh.read()))
+    assert endpoints
+    assert endpoints <= set(app.view_functions)
+
+
+def test_base_template_renders(app):
+    with app.test_request_context("/"):
+        assert 'href="/"' in render_template("base.html")
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+import twilio_ingest
+import twilio_outbound
+from models import db, Clinic, TwilioLog, TwilioRollup
+from twilio_outbound import OutboundMessage, SendResult
+
+
+def callback(sid, status, **form):
+    return twilio_ingest.parse_callback(dict(form, MessageSid=sid, MessageStatus=status, From="+15550100",
+                                             To="+15550199", Direction="outbound-api"))
+
+
+def rollup_counts():
+    rows = (
+        db.session.query(TwilioRollup.status, func.sum(TwilioRollup.count))
+        .filter(TwilioRollup.granularity == "day")
+        .group_by(TwilioRollup.status)
+    )
+    return {status: count for status, count in rows if count}
+
+
+def sent(sid, clinic_id, body="See you tomorrow at 10:00"):
+    message = OutboundMessage(clinic_id=clinic_id, to_number="+15550199", body=body)
+    return SendResult(message=message, from_number="+15550100", sid=sid, attempts=1)
+
+
+def test_record_after_callback_merges_into_the_callback_row(app):
+    clinic = Clinic(name="North", slug="north")
+    db.session.add(clinic)
+    db.session.commit()
+
+    with db.engine.begin() as conn:
+        assert twilio_ingest.apply_events(conn, [callback("SM1", "delivered")]) == (1, 0)
+    twilio_outbound.record([sent("SM1", clinic.id), sent("SM2", clinic.id)])
+
+    logs = {log.sid: log for log in TwilioLog.query}
+    assert set(logs) == {"SM1", "SM2"}
+    assert logs["SM1"].status == "delivered"
+    assert logs["SM1"].body == "See you tomorrow at 10:00"
+    assert logs["SM1"].clinic_id == clinic.id
+    assert logs["SM2"].status == "sent"
+    assert rollup_counts() == {"delivered": 1, "sent": 1}
+
+
+def test_callback_after_record_moves_the_status_forward(app):
+    twilio_outbound.record([sent("SM1", None), sent(None, None)])
+    with db.engine.begin() as conn:
+        assert twilio_ingest.apply_events(conn, [callback("SM1", "delivered")]) == (0, 1)
+    # A late "sent" from a retried record() leaves the delivered row alone.
+    twilio_outbound.record([sent("SM1", None)])
+
+    assert sorted((log.sid or "", log.status) for log in TwilioLog.query) == [("", "failed"), ("SM1", "delivered")]
+    assert rollup_counts() == {"delivered": 1, "failed": 1}
+
+
+def test_apply_events_keeps_the_sent_body(app):
+    twilio_outbound.record([sent("SM1", None, body="Reminder")])
+    with db.engine.begin() as conn:
+        twilio_ingest.apply_events(conn, [callback("SM1", "delivered", Body="ignored")])
+    log = TwilioLog.query.one()
+    assert (log.status, log.body) == ("delivered", "Reminder")
+    assert log.timestamp <= datetime.utcnow()
+
+
+def test_sid_lock_keys_are_sorted_int4_keys():
+    keys = twilio_ingest.sid_lock_keys(["SM2", "SM1", "SM2", "CA9"])
+    assert len(keys) == 3
+    assert keys == sorted(keys)
+    assert all(-2**31 <= key < 2**31 for key in keys)
+    assert twilio_ingest.sid_lock_keys(["SM1"])[0] in keys
@@ -0,0 +1,616 @@
+"""
+Twilio webhook ingestion.
+
+Status callbacks arrive in bursts of thousands per minute during reminder
+blasts, so the webhook does the minimum: check Twilio's signature and the
+form, append one JSON line to a local write-ahead spool and answer with
+empty TwiML. The database is written by a batch writer:
+
+    incoming/<segment>.jsonl   appended to by the web process, sealed (fsync
+                               + rename) every TWILIO_SPOOL_SEGMENT_EVENTS
+                               events or TWILIO_SPOOL_SEGMENT_SECONDS
+    ready/<segment>.jsonl      sealed, waiting for the writer
+    processing/<segment>.jsonl claimed by a writer (atomic rename)
+
+The writer collapses each segment to one event per SID (the furthest along
+the Twilio lifecycle wins), inserts unknown SIDs in bulk and updates known
+rows in place, so queued -> sent -> delivered is one row whose status moves
+forward. Callbacks that arrive out of order never move a row backwards.
+Applying a segment twice is harmless, which is what makes crash recovery
+(re-queueing stale incoming/processing segments) safe. Senders write their
+rows through record_sends(), which merges into a row a callback created
+first.
+
+The spool is local disk, so the writer runs next to the web workers: as a
+daemon thread in each web process (TWILIO_INGEST_THREAD, the default) and/or
+as `flask twilio-ingest` on the same host.
+"""
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, text, update
+
+import rollups
+from clinic_registry import get_registry
+from models import db, TwilioLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "TWILIO_SPOOL_DIR": None,  # defaults to <instance>/twilio_spool
+    "TWILIO_SPOOL_SEGMENT_EVENTS": 2000,
+    "TWILIO_SPOOL_SEGMENT_SECONDS": 1.0,
+    "TWILIO_SPOOL_FSYNC": False,  # fsync every event, not only when sealing
+    "TWILIO_INGEST_THREAD": True,
+    "TWILIO_INGEST_BATCH_SIZE": 1000,
+    "TWILIO_VALIDATE_SIGNATURE": True,  # False only for dev/test setups
+    "TWILIO_AUTH_TOKEN": None,
+}
+
+# Segments untouched for this long belong to a dead process.
+STALE_SECONDS = 60
+
+# How far along its lifecycle a message/call/fax is; higher never goes back.
+STATUS_RANK = {
+    # messages
+    "accepted": 0, "scheduled": 0, "queued": 1, "sending": 2, "sent": 3,
+    "receiving": 2, "received": 4,
+    "delivered": 5, "undelivered": 5, "failed": 5, "canceled": 5, "read": 6,
+    # calls
+    "initiated": 1, "ringing": 2, "in-progress": 3,
+    "completed": 5, "busy": 5, "no-answer": 5,
+    # faxes
+    "processing": 2,
+}
+
+TWIML_EMPTY = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+
+def setting(name, app=None):
+    return (app or current_app).config.get(name, DEFAULTS[name])
+
+
+# -------------------------------------------------
+# Webhook side
+# -------------------------------------------------
+def parse_callback(form):
+    """Turn a Twilio webhook form into a spool event, or None if it is not one."""
+    if form.get("CallSid"):
+        sid, message_type = form["CallSid"], "call"
+        status = form.get("CallStatus")
+    elif form.get("FaxSid"):
+        sid, message_type = form["FaxSid"], "fax"
+        status = form.get("FaxStatus")
+    else:
+        sid, message_type = form.get("MessageSid") or form.get("SmsSid"), "sms"
+        status = form.get("MessageStatus") or form.get("SmsStatus")
+    if not sid or not status:
+        return None
+
+    direction = form.get("Direction")
+    if direction:
+        direction = "inbound" if direction == "inbound" else "outbound"
+    else:
+        direction = "inbound" if status in ("receiving", "received") else "outbound"
+
+    duration = form.get("CallDuration") or form.get("Duration")
+    return {
+        "sid": sid,
+        "message_type": message_type,
+        "direction": direction,
+        "from_number": form.get("From"),
+        "to_number": form.get("To"),
+        "status": status.lower(),
+        "duration": int(duration) if duration and duration.isdigit() else None,
+        "body": form.get("Body"),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def valid_signature(auth_token, url, form, signature):
+    """Twilio's X-Twilio-Signature: base64 HMAC-SHA1 of the URL plus sorted params."""
+    payload = url + "".join(f"{key}{value}" for key, value in sorted(form.items(multi=True)))
+    digest = hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature or "")
+
+
+class Spool:
+    """Append-only segment files shared by every process on the host."""
+
+    def __init__(self, directory, segment_events=2000, segment_seconds=1.0, fsync=False):
+        self.directory = directory
+        self.incoming = os.path.join(directory, "incoming")
+        self.ready = os.path.join(directory, "ready")
+        self.processing = os.path.join(directory, "processing")
+        for path in (self.incoming, self.ready, self.processing):
+            os.makedirs(path, exist_ok=True)
+        self.segment_events = segment_events
+        self.segment_seconds = segment_seconds
+        self.fsync = fsync
+
+        self.appended = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._path = None
+        self._count = 0
+        self._opened = 0.0
+        self._seq = 0
+        self._timer = None
+        atexit.register(self.seal)
+
+    def append(self, event):
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked from a process with an open segment: that one is the
+                # parent's to seal; start our own (and our own seal timer).
+                self._file = None
+                self._timer = None
+                self._pid = os.getpid()
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._count += 1
+            self.appended += 1
+            if self._count >= self.segment_events:
+                self._seal()
+
+    def _open(self):
+        self._seq += 1
+        name = f"{time.time_ns()}-{socket.gethostname()}-{os.getpid()}-{self._seq}.jsonl"
+        self._path = os.path.join(self.incoming, name)
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._count = 0
+        self._opened = time.monotonic()
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._seal_periodically, name="twilio-spool", daemon=True)
+            self._timer.start()
+
+    def _seal(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.rename(self._path, os.path.join(self.ready, os.path.basename(self._path)))
+        self._file = None
+
+    def _seal_periodically(self):
+        pid = os.getpid()
+        while pid == os.getpid():
+            time.sleep(self.segment_seconds / 2)
+            with self._lock:
+                if self._pid != pid:
+                    return
+                if self._file is not None and time.monotonic() - self._opened >= self.segment_seconds:
+                    self._seal()
+
+    def seal(self):
+        """Hand the current segment to the writer now."""
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._seal()
+
+    # -------------------------------------------------
+    # Writer side
+    # -------------------------------------------------
+    def claim(self):
+        """Move the oldest ready segment to processing/ and return its path, or None."""
+        for name in sorted(os.listdir(self.ready)):
+            target = os.path.join(self.processing, name)
+            try:
+                os.rename(os.path.join(self.ready, name), target)
+            except FileNotFoundError:
+                continue  # another writer got it first
+            os.utime(target)  # recover() goes by mtime, which rename keeps
+            return target
+        return None
+
+    def done(self, path):
+        os.unlink(path)
+
+    def recover(self, stale_seconds=STALE_SECONDS):
+        """Requeue segments left behind by processes that died mid-write or mid-apply."""
+        cutoff = time.time() - stale_seconds
+        recovered = 0
+        for folder in (self.incoming, self.processing):
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.rename(path, os.path.join(self.ready, name))
+                        recovered += 1
+                except FileNotFoundError:
+                    continue
+        return recovered
+
+    def backlog(self):
+        return len(os.listdir(self.ready))
+
+
+def read_segment(path):
+    events = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash; everything before it is intact.
+                logger.warning("Skipping unreadable line in %s", path)
+    return events
+
+
+# -------------------------------------------------
+# Batch writer
+# -------------------------------------------------
+def _rank(status):
+    return STATUS_RANK.get(status or "", -1)
+
+
+def collapse(events):
+    """One event per SID: the furthest status, later arrivals winning ties."""
+    latest = {}
+    for event in events:
+        current = latest.get(event["sid"])
+        if current is None:
+            latest[event["sid"]] = dict(event)
+            continue
+        if _rank(event["status"]) >= _rank(current["status"]):
+            merged = dict(current, status=event["status"])
+        else:
+            merged = dict(current)
+        # Keep the first arrival's timestamp (the row's bucket) and fill in
+        # anything a later callback knew that an earlier one did not.
+        for name in ("duration", "body", "from_number", "to_number", "direction"):
+            if merged.get(name) is None and event.get(name) is not None:
+                merged[name] = event[name]
+        latest[event["sid"]] = merged
+    return latest
+
+
+def clinic_number(event):
+    """The clinic's side of the conversation: To for inbound, From for outbound."""
+    return event["to_number"] if event["direction"] == "inbound" else event["from_number"]
+
+
+def _clinic_id(registry, event):
+    entry = registry.by_number(clinic_number(event))
+    return entry.id if entry is not None else None
+
+
+def _insert_new(conn, rows):
+    """Insert rows whose SID is not taken; returns the SIDs actually inserted."""
+    table = TwilioLog.__table__
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        inserted = set()
+        # A partitioned twilio_logs (migration 0011) has no unique index on
+        # sid alone to name as the conflict target; insert_logs' SID locks keep
+        # SIDs unique there.
+        conflict = {} if dialect == "postgresql" else {"index_elements": ["sid"]}
+        # RETURNING with executemany is not portable, so insert row sets
+        # as one multi-VALUES statement per chunk.
+        for start in range(0, len(rows), 500):
+            stmt = (
+                upsert(table)
+                .values(rows[start:start + 500])
+                .on_conflict_do_nothing(**conflict)
+                .returning(table.c.sid)
+            )
+            inserted.update(conn.execute(stmt).scalars())
+        return inserted
+    conn.execute(insert(table), rows)
+    return {row["sid"] for row in rows}
+
+
+INGEST_LOCK_KEY = 0x7477696C  # "twil": pg_advisory_xact_lock namespace of insert_logs
+LOG_FIELDS = ("clinic_id", "message_type", "direction", "status", "duration", "timestamp")
+# Columns a later write may change on an existing row.
+UPDATE_FIELDS = ("status", "duration", "body", "from_number", "clinic_id")
+
+
+def _existing_rows(conn, sids):
+    table = TwilioLog.__table__
+    query = select(table.c.id, table.c.sid, table.c.body, table.c.from_number,
+                   *(table.c[name] for name in LOG_FIELDS))
+    query = query.where(table.c.sid.in_(sids))
+    if conn.dialect.name == "postgresql":
+        query = query.with_for_update()
+    return {row.sid: row._asdict() for row in conn.execute(query)}
+
+
+def sid_lock_keys(sids):
+    """The advisory lock keys of `sids`, sorted so every writer takes them in
+    the same order and two writers can't deadlock."""
+    return sorted({zlib.crc32(sid.encode()) - 2**31 for sid in sids})
+
+
+def _lock_sids(conn, sids):
+    """Hold a lock per SID (in the INGEST_LOCK_KEY namespace) until commit.
+    Writers only wait on each other when they share a SID (or a hash)."""
+    keys = sid_lock_keys(sids)
+    if keys:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, k.key)"
+                 " FROM unnest(CAST(:keys AS integer[])) WITH ORDINALITY AS k(key, n) ORDER BY k.n"),
+            {"namespace": INGEST_LOCK_KEY, "keys": keys},
+        )
+
+
+def insert_logs(conn, rows):
+    """Insert twilio_logs rows whose SID isn't there yet; every insert into
+    the table goes through here. Returns (the rows inserted, {sid: existing
+    row} for the others).
+
+    A partitioned twilio_logs (migration 0011) can't enforce a unique SID,
+    so on PostgreSQL writers lock the SIDs they write for the rest of their
+    transaction and look them up before inserting.
+    """
+    if conn.dialect.name == "postgresql":
+        _lock_sids(conn, [row["sid"] for row in rows if row["sid"] is not None])
+    # Sends Twilio refused have no SID for a callback to match.
+    unsent = [row for row in rows if row["sid"] is None]
+    if unsent:
+        conn.execute(insert(TwilioLog.__table__), unsent)
+    by_sid = {row["sid"]: row for row in rows if row["sid"] is not None}
+    existing = _existing_rows(conn, list(by_sid)) if by_sid else {}
+    fresh = [row for sid, row in by_sid.items() if sid not in existing]
+    if not fresh:
+        return unsent, existing
+    done = _insert_new(conn, fresh)
+    lost = [row["sid"] for row in fresh if row["sid"] not in done]
+    if lost:
+        existing.update(_existing_rows(conn, lost))
+    return unsent + [row for row in fresh if row["sid"] in done], existing
+
+
+def _apply_changes(conn, changes):
+    """Write (old row, new row) pairs and move their rollup counts."""
+    if not changes:
+        return
+    table = TwilioLog.__table__
+    conn.execute(
+        update(table)
+        .where(table.c.id == bindparam("log_id"))
+        .values(**{name: bindparam(f"new_{name}") for name in UPDATE_FIELDS}),
+        [dict({f"new_{name}": new[name] for name in UPDATE_FIELDS}, log_id=old["id"]) for old, new in changes],
+    )
+    rollups.record_changes(conn, changes)
+
+
+def apply_events(conn, events):
+    """Write a batch of spool events to twilio_logs; returns (inserted, updated)."""
+    latest = collapse(events)
+    if not latest:
+        return 0, 0
+    registry = get_registry()
+    inserted, existing = insert_logs(conn, [
+        {
+            "sid": sid,
+            "clinic_id": _clinic_id(registry, event),
+            "message_type": event["message_type"],
+            "direction": event["direction"],
+            "from_number": event["from_number"],
+            "to_number": event["to_number"],
+            "status": event["status"],
+            "duration": event["duration"],
+            "timestamp": datetime.fromisoformat(event["timestamp"]),
+            "body": event["body"],
+        }
+        for sid, event in latest.items()
+    ])
+    rollups.record_logs(conn, inserted)
+
+    changes = []
+    for sid, old in existing.items():
+        event = latest[sid]
+        if _rank(event["status"]) <= _rank(old["status"]):
+            continue
+        new = dict(old, status=event["status"])
+        if event["duration"] is not None:
+            new["duration"] = event["duration"]
+        if old["body"] is None:
+            new["body"] = event["body"]
+        changes.append((old, new))
+    _apply_changes(conn, changes)
+    return len(inserted), len(changes)
+
+
+def record_sends(conn, logs):
+    """Write the twilio_logs rows of outbound sends (twilio_outbound.py,
+    reminders.py), counting them in the rollups.
+
+    A status callback can reach apply_events before the sender writes its
+    row. Then the row exists already: it keeps a status that is further
+    along and gains the body, From number and clinic the callback lacked.
+    """
+    if not logs:
+        return
+    inserted, existing = insert_logs(conn, logs)
+    rollups.record_logs(conn, inserted)
+
+    rows = {log["sid"]: log for log in logs if log["sid"] is not None}
+    changes = []
+    for sid, old in existing.items():
+        log = rows[sid]
+        new = dict(old)
+        if _rank(log["status"]) > _rank(old["status"]):
+            new["status"] = log["status"]
+        for name in ("body", "from_number", "clinic_id"):
+            if new[name] is None:
+                new[name] = log[name]
+        if new != old:
+            changes.append((old, new))
+    _apply_changes(conn, changes)
+
+
+class BatchWriter:
+    """Drains sealed spool segments into the database."""
+
+    def __init__(self, app, spool, batch_size=None):
+        self.app = app
+        self.spool = spool
+        self.batch_size = batch_size or setting("TWILIO_INGEST_BATCH_SIZE", app)
+        self.inserted = 0
+        self.updated = 0
+        self.segments = 0
+        self.failed = 0
+        self._last_recover = 0.0
+
+    def drain_once(self):
+        """Apply one batch of up to batch_size events; returns the number of events read."""
+        if time.monotonic() - self._last_recover > STALE_SECONDS:
+            self._last_recover = time.monotonic()
+            if self.spool.recover():
+                logger.warning("Requeued stale Twilio spool segments")
+
+        paths, events = [], []
+        while len(events) < self.batch_size:
+            path = self.spool.claim()
+            if path is None:
+                break
+            paths.append(path)
+            events.extend(read_segment(path))
+        if not paths:
+            return 0
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    inserted, updated = apply_events(conn, events)
+        except Exception:
+            # Leave the segments in processing/; recover() requeues them.
+            logger.exception("Failed to apply %d Twilio events", len(events))
+            self.failed += len(paths)
+            return 0
+        for path in paths:
+            self.spool.done(path)
+        self.inserted += inserted
+        self.updated += updated
+        self.segments += len(paths)
+        return len(events)
+
+    def run(self, stop, poll_interval=0.5, once=False):
+        while not stop.is_set():
+            if self.drain_once():
+                continue
+            if once:
+                break
+            stop.wait(poll_interval)
+
+    def stats(self):
+        return {
+            "appended": self.spool.appended,
+            "backlog_segments": self.spool.backlog(),
+            "segments": self.segments,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed_segments": self.failed,
+        }
+
+
+# -------------------------------------------------
+# Wiring
+# -------------------------------------------------
+def init_app(app):
+    directory = setting("TWILIO_SPOOL_DIR", app) or os.path.join(app.instance_path, "twilio_spool")
+    spool = Spool(
+        directory,
+        segment_events=int(setting("TWILIO_SPOOL_SEGMENT_EVENTS", app)),
+        segment_seconds=float(setting("TWILIO_SPOOL_SEGMENT_SECONDS", app)),
+        fsync=bool(setting("TWILIO_SPOOL_FSYNC", app)),
+    )
+    app.extensions["twilio_spool"] = spool
+    app.extensions["twilio_writer"] = BatchWriter(app, spool)
+    app.extensions["twilio_writer_thread"] = (None, None)
+    app.cli.add_command(twilio_ingest_command)
+
+
+def get_spool():
+    return current_app.extensions["twilio_spool"]
+
+
+def get_writer():
+    return current_app.extensions["twilio_writer"]
+
+
+_writer_lock = threading.Lock()
+
+
+def ensure_writer_thread(app=None):
+    """Start this process's background writer if TWILIO_INGEST_THREAD is on."""
+    app = app or current_app._get_current_object()
+    if not setting("TWILIO_INGEST_THREAD", app):
+        return
+    thread, pid = app.extensions["twilio_writer_thread"]
+    if thread is not None and thread.is_alive() and pid == os.getpid():
+        return
+    with _writer_lock:
+        thread, pid = app.extensions["twilio_writer_thread"]
+        if thread is not None and thread.is_alive() and pid == os.getpid():
+            return
+        writer = app.extensions["twilio_writer"]
+        thread = threading.Thread(
+            target=writer.run, args=(threading.Event(),), name="twilio-writer", daemon=True
+        )
+        app.extensions["twilio_writer_thread"] = (thread, os.getpid())
+        thread.start()
+
+
+def verify_request(number, form, url, signature):
+    """True if the post carries Twilio's signature for `url` and `form`.
+
+    Twilio signs with the auth token of the account that owns the clinic's
+    `number` (TWILIO_AUTH_TOKEN for numbers the registry doesn't know). With
+    no token to check against the post is refused. Setting
+    TWILIO_VALIDATE_SIGNATURE to False accepts everything; that is for
+    development and tests only.
+    """
+    if not setting("TWILIO_VALIDATE_SIGNATURE"):
+        return True
+    clinic = get_registry().by_number(number)
+    token = (clinic.auth_token if clinic is not None else None) or setting("TWILIO_AUTH_TOKEN")
+    return bool(token) and valid_signature(token, url, form, signature)
+
+
+def ingest(form, url=None, signature=None):
+    """Validate and spool one webhook; returns an HTTP status code."""
+    event = parse_callback(form)
+    if event is None:
+        return 400
+    if not verify_request(clinic_number(event), form, url, signature):
+        return 403
+    get_spool().append(event)
+    ensure_writer_thread()
+    return 200
+
+
+@click.command("twilio-ingest")
+@click.option("--once", is_flag=True, help="Exit once the spool is empty.")
+@click.option("--poll-interval", default=0.5, show_default=True)
+def twilio_ingest_command(once, poll_interval):
+    """Write spooled Twilio webhook events to twilio_logs."""
+    get_spool().recover()
+    writer = get_writer()
+    writer.run(threading.Event(), poll_interval=poll_interval, once=once)
+    click.echo(
+        f"Applied {writer.segments:,} segments: {writer.inserted:,} new logs, {writer.updated:,} status updates"
+    )
@@ -0,0 +1,481 @@
+"""
+Outbound SMS engine: pooled, rate-limited, retrying sends through Twilio.
+
+Sending one message at a time costs a TLS handshake and an HTTPS round
+trip per message. It also ignores Twilio's per-number throughput: roughly 1
+message/second for a US long code, 3 for toll-free, 100 for a short code.
+The engine instead:
+
+  * keeps one keep-alive connection pool per credential set (a clinic's
+    twilio_sid/twilio_token, or the TWILIO_* environment account), so
+    requests to the same account reuse warm connections;
+  * paces every from-number with its own token bucket, at
+    OUTBOUND_SMS_RATE messages/second (OUTBOUND_SMS_RATES overrides it per
+    number), so a big clinic can't starve the others and no number is
+    pushed past its limit;
+  * keeps at most OUTBOUND_SMS_CONCURRENCY requests in flight on a thread
+    pool;
+  * retries 429s, 5xxs and connection errors up to OUTBOUND_SMS_MAX_ATTEMPTS
+    times. It waits for Retry-After when Twilio sends one, and otherwise for
+    an exponential backoff with full jitter, so throttled senders don't
+    retry in lockstep. A retry takes a token from its number's bucket like
+    any other send.
+
+A message's clinic_id picks its credentials and default from-number from
+the clinic registry. send_and_record() writes the results to twilio_logs in
+bulk, one write per OUTBOUND_SMS_RECORD_BATCH results, through
+twilio_ingest.record_sends() so a status callback that got there first is
+merged rather than duplicated. The reminder dispatcher sends through the
+engine as well (REMINDER_SENDER=twilio).
+
+A 20k-message blast takes minutes, not hours, only when it has the numbers
+for it. One long code needs 5.5 hours for 20k messages at 1/s, so spread a
+blast across clinics' numbers, or give a short code or a messaging service
+its own rate in OUTBOUND_SMS_RATES. The buckets are per process: divide
+the rates between processes that send from the same numbers.
+
+The transport is injectable (anything with send(credentials, form) ->
+(status, headers, payload)), and TWILIO_API_BASE points the HTTP transport
+elsewhere. benchmarks/bench_outbound.py uses both to run a blast against a
+local fake Twilio server.
+"""
+import base64
+import heapq
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+from flask import current_app
+
+import twilio_ingest
+from clinic_registry import get_registry
+from models import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "TWILIO_API_BASE": "https://api.twilio.com",
+    "OUTBOUND_SMS_CONCURRENCY": 32,
+    "OUTBOUND_SMS_RATE": 1.0,  # messages/second per from-number (a US long code)
+    "OUTBOUND_SMS_BURST": 1,
+    "OUTBOUND_SMS_RATES": {},  # from-number -> messages/second
+    "OUTBOUND_SMS_MAX_ATTEMPTS": 4,
+    "OUTBOUND_SMS_BACKOFF": 1.0,  # seconds before the first retry, doubled each time
+    "OUTBOUND_SMS_BACKOFF_CAP": 30.0,
+    "OUTBOUND_SMS_TIMEOUT": 15.0,
+    "OUTBOUND_SMS_POOL_SIZE": 8,  # idle connections kept per credential set
+    "OUTBOUND_SMS_RECORD_BATCH": 500,
+    "OUTBOUND_SMS_STATUS_CALLBACK": None,  # e.g. https://host/twilio/webhook
+}
+
+
+def setting(name, app=None):
+    return (app or current_app).config.get(name, DEFAULTS[name])
+
+
+@dataclass(frozen=True)
+class Credentials:
+    account_sid: str
+    auth_token: str
+    from_number: str = None  # the clinic's number, used when a message has none
+
+
+@dataclass(frozen=True)
+class OutboundMessage:
+    clinic_id: int
+    to_number: str
+    body: str
+    from_number: str = None  # defaults to the clinic's twilio_number
+
+
+@dataclass(frozen=True)
+class SendResult:
+    message: OutboundMessage
+    from_number: str
+    sid: str = None
+    error: str = None
+    attempts: int = 0
+
+
+class TransportError(Exception):
+    """The request never got an HTTP response (connect, TLS, timeout, reset)."""
+
+
+# -------------------------------------------------
+# Transport
+# -------------------------------------------------
+class _ConnectionPool:
+    """Idle keep-alive connections to one host, for one credential set."""
+
+    def __init__(self, base_url, credentials, size, timeout):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+        basic = base64.b64encode(f"{credentials.account_sid}:{credentials.auth_token}".encode()).decode()
+        self.headers = {
+            "Authorization": f"Basic {basic}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+        }
+
+    def get(self):
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def put(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+class HttpTransport:
+    """POSTs to the Messages resource over pooled keep-alive connections."""
+
+    def __init__(self, base_url=DEFAULTS["TWILIO_API_BASE"], pool_size=8, timeout=15.0):
+        self.base_url = base_url.rstrip("/")
+        self.path_prefix = urlsplit(self.base_url).path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, credentials):
+        key = (credentials.account_sid, credentials.auth_token)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = self._pools[key] = _ConnectionPool(self.base_url, credentials, self.pool_size, self.timeout)
+        return pool
+
+    def send(self, credentials, form):
+        """(HTTP status, lower-cased headers, JSON payload); raises TransportError."""
+        pool = self._pool(credentials)
+        path = f"{self.path_prefix}/2010-04-01/Accounts/{credentials.account_sid}/Messages.json"
+        body = urlencode(form)
+        while True:
+            connection, reused = pool.get()
+            try:
+                connection.request("POST", path, body=body, headers=pool.headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                connection.close()
+                if reused:
+                    continue  # the server closed an idle connection; try a fresh one
+                raise TransportError(str(exc) or exc.__class__.__name__) from exc
+            if response.will_close:
+                connection.close()
+            else:
+                pool.put(connection)
+            try:
+                data = json.loads(payload) if payload else {}
+            except ValueError:
+                data = {}
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+
+# -------------------------------------------------
+# Rate limiting
+# -------------------------------------------------
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, now=None):
+        """0 if a token was taken, else the seconds until one will be available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+
+# -------------------------------------------------
+# Engine
+# -------------------------------------------------
+class OutboundEngine:
+    def __init__(self, transport, concurrency=32, rate=1.0, burst=1, rates=None, max_attempts=4,
+                 backoff=1.0, backoff_cap=30.0, status_callback=None, seed=None):
+        self.transport = transport
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.rates = dict(rates or {})
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.status_callback = status_callback
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "throttled": 0}
+        self._random = random.Random(seed)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(concurrency, thread_name_prefix="sms-out")
+
+    def bucket(self, from_number):
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(
+                    from_number, TokenBucket(self.rates.get(from_number, self.rate), self.burst)
+                )
+        return bucket
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def estimate_seconds(self, from_numbers):
+        """Lower bound on the time to send one message per entry of `from_numbers`."""
+        counts = defaultdict(int)
+        for number in from_numbers:
+            counts[number] += 1
+        return max(((count - self.burst) / self.rates.get(number, self.rate) for number, count in counts.items()),
+                   default=0.0)
+
+    def _retry_delay(self, attempt, headers):
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        return self._random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** (attempt - 1)))
+
+    def _attempt(self, credentials, from_number, message, attempt):
+        """One HTTP attempt -> (sid, error, retry delay or None)."""
+        form = {"To": message.to_number, "From": from_number, "Body": message.body}
+        if self.status_callback:
+            form["StatusCallback"] = self.status_callback
+        try:
+            status, headers, payload = self.transport.send(credentials, form)
+        except TransportError as exc:
+            return None, str(exc), self._retry_delay(attempt, {})
+        if 200 <= status < 300 and payload.get("sid"):
+            return payload["sid"], None, None
+        error = f"HTTP {status}"
+        if payload.get("code") or payload.get("message"):
+            error = f"{error} {payload.get('code') or ''}: {payload.get('message') or ''}".strip()
+        if status == 429:
+            self._count("throttled")
+        if status == 429 or status >= 500:
+            return None, error, self._retry_delay(attempt, headers)
+        return None, error, None  # 4xx: bad number, opted out... retrying won't help
+
+    def iter_send(self, messages, credentials):
+        """Send `messages`; yields a SendResult for each as it finishes (not in order).
+
+        `credentials` maps clinic_id -> Credentials (see clinic_credentials()).
+        """
+        queues = defaultdict(deque)  # from-number -> deque of (message, attempts so far)
+        for message in messages:
+            creds = credentials.get(message.clinic_id)
+            from_number = message.from_number or (creds.from_number if creds else None)
+            if creds is None or not from_number:
+                self._count("failed")
+                yield SendResult(message, from_number, error="No Twilio credentials or from-number for the clinic")
+                continue
+            queues[from_number].append((message, 0))
+
+        ready = [(0.0, number) for number in queues]  # (monotonic time the number may send, number)
+        heapq.heapify(ready)
+        scheduled = set(queues)
+        retries = []  # (due, sequence, from-number, message, attempts)
+        done = queue.Queue()
+        in_flight = 0
+        sequence = 0
+
+        def submit(from_number, message, attempts):
+            creds = credentials[message.clinic_id]
+
+            def run():
+                try:
+                    outcome = self._attempt(creds, from_number, message, attempts + 1)
+                except Exception as exc:  # a transport bug must not hang the blast
+                    logger.exception("Outbound SMS attempt failed unexpectedly")
+                    outcome = (None, str(exc) or exc.__class__.__name__, None)
+                done.put((from_number, message, attempts + 1, outcome))
+
+            self._pool.submit(run)
+
+        while ready or retries or in_flight:
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                _, _, number, message, attempts = heapq.heappop(retries)
+                queues[number].appendleft((message, attempts))
+                if number not in scheduled:
+                    scheduled.add(number)
+                    heapq.heappush(ready, (now, number))
+
+            if ready and ready[0][0] <= now and in_flight < self.concurrency:
+                _, number = heapq.heappop(ready)
+                wait = self.bucket(number).take(now)
+                if wait:
+                    heapq.heappush(ready, (now + wait, number))
+                    continue
+                message, attempts = queues[number].popleft()
+                submit(number, message, attempts)
+                in_flight += 1
+                if queues[number]:
+                    heapq.heappush(ready, (now, number))
+                else:
+                    scheduled.discard(number)
+                continue
+
+            # Nothing to start right now: wait for a send to finish or the
+            # next number/retry to come due.
+            wakeups = [due for due, *_ in retries[:1]]
+            if ready and in_flight < self.concurrency:
+                wakeups.append(ready[0][0])
+            timeout = max(min(wakeups) - now, 0.0) if wakeups else None
+            try:
+                number, message, attempts, (sid, error, delay) = done.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+            if delay is not None and attempts < self.max_attempts:
+                self._count("retries")
+                sequence += 1
+                heapq.heappush(retries, (time.monotonic() + delay, sequence, number, message, attempts))
+                continue
+            self._count("sent" if sid else "failed")
+            yield SendResult(message, number, sid=sid, error=error, attempts=attempts)
+
+    def send_many(self, messages, credentials):
+        """Send `messages`; returns their SendResults in the same order."""
+        messages = list(messages)
+        slots = {}
+        for index, message in enumerate(messages):
+            slots.setdefault(id(message), []).append(index)
+        results = [None] * len(messages)
+        for result in self.iter_send(messages, credentials):
+            results[slots[id(result.message)].pop()] = result
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+# -------------------------------------------------
+# Wiring
+# -------------------------------------------------
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    transport = HttpTransport(
+        app.config["TWILIO_API_BASE"],
+        pool_size=int(app.config["OUTBOUND_SMS_POOL_SIZE"]),
+        timeout=float(app.config["OUTBOUND_SMS_TIMEOUT"]),
+    )
+    app.extensions["twilio_outbound"] = engine_from_config(app.config, transport)
+
+
+def engine_from_config(config, transport):
+    return OutboundEngine(
+        transport,
+        concurrency=int(config.get("OUTBOUND_SMS_CONCURRENCY", DEFAULTS["OUTBOUND_SMS_CONCURRENCY"])),
+        rate=float(config.get("OUTBOUND_SMS_RATE", DEFAULTS["OUTBOUND_SMS_RATE"])),
+        burst=int(config.get("OUTBOUND_SMS_BURST", DEFAULTS["OUTBOUND_SMS_BURST"])),
+        rates=config.get("OUTBOUND_SMS_RATES", DEFAULTS["OUTBOUND_SMS_RATES"]),
+        max_attempts=int(config.get("OUTBOUND_SMS_MAX_ATTEMPTS", DEFAULTS["OUTBOUND_SMS_MAX_ATTEMPTS"])),
+        backoff=float(config.get("OUTBOUND_SMS_BACKOFF", DEFAULTS["OUTBOUND_SMS_BACKOFF"])),
+        backoff_cap=float(config.get("OUTBOUND_SMS_BACKOFF_CAP", DEFAULTS["OUTBOUND_SMS_BACKOFF_CAP"])),
+        status_callback=config.get("OUTBOUND_SMS_STATUS_CALLBACK"),
+    )
+
+
+def get_engine():
+    return current_app.extensions["twilio_outbound"]
+
+
+def clinic_credentials(clinic_ids):
+    """{clinic_id: Credentials} from the clinic registry; the TWILIO_* account for the rest."""
+    fallback = None
+    if os.environ.get("TWILIO_ACCOUNT_SID") and os.environ.get("TWILIO_AUTH_TOKEN"):
+        fallback = Credentials(
+            os.environ["TWILIO_ACCOUNT_SID"], os.environ["TWILIO_AUTH_TOKEN"],
+            os.environ.get("TWILIO_PHONE_NUMBER") or os.environ.get("TWILIO_FROM_NUMBER"),
+        )
+    registry = get_registry()
+    result = {}
+    for clinic_id in set(clinic_ids):
+        entry = registry.get(clinic_id) if clinic_id is not None else None
+        if entry is not None and entry.account_sid and entry.auth_token:
+            result[clinic_id] = Credentials(entry.account_sid, entry.auth_token, entry.twilio_number)
+        elif fallback is not None:
+            number = entry.twilio_number if entry is not None and entry.twilio_number else fallback.from_number
+            result[clinic_id] = Credentials(fallback.account_sid, fallback.auth_token, number)
+    return result
+
+
+# -------------------------------------------------
+# Recording
+# -------------------------------------------------
+def log_row(result, now=None):
+    """The twilio_logs row for a send; status callbacks update it later by SID."""
+    return {
+        "sid": result.sid,
+        "clinic_id": result.message.clinic_id,
+        "message_type": "sms",
+        "direction": "outbound",
+        "from_number": result.from_number,
+        "to_number": result.message.to_number,
+        "status": "sent" if result.sid else "failed",
+        "timestamp": now or datetime.utcnow(),
+        "body": result.message.body,
+    }
+
+
+def record(results):
+    if not results:
+        return
+    now = datetime.utcnow()
+    logs = [log_row(result, now) for result in results]
+    with db.engine.begin() as conn:
+        twilio_ingest.record_sends(conn, logs)
+
+
+def send_and_record(messages, engine=None, batch_size=None):
+    """Send `messages` and log every result to twilio_logs; returns (sent, failed)."""
+    engine = engine or get_engine()
+    batch_size = batch_size or int(setting("OUTBOUND_SMS_RECORD_BATCH"))
+    messages = list(messages)
+    credentials = clinic_credentials(message.clinic_id for message in messages)
+    sent = failed = 0
+    pending = []
+    for result in engine.iter_send(messages, credentials):
+        pending.append(result)
+        if result.sid:
+            sent += 1
+        else:
+            failed += 1
+        if len(pending) >= batch_size:
+            record(pending)
+            pending = []
+    record(pending)
+    return sent, failed
@@ -1,18 +1,21 @@
 from flask import abort, request
 from flask_login import current_user
-from app import db
-from models import AuditLog
+from audit import get_sink
+from permissions import get_role_name
 
 
 def log_action(user, action, details=None):
-    """Utility to log any user action into the audit log."""
-    log = AuditLog(
+    """
+    Utility to log any user action into the audit log.
+
+    The entry is handed to the buffered audit sink (see audit.py) and written
+    in the background; the caller's session is left untouched.
+    """
+    get_sink().record(
         user_id=user.id if user and user.is_authenticated else None,
         action=action,
         details=details,
     )
-    db.session.add(log)
-    db.session.commit()
 
 
 def require_role(*roles):
@@ -25,7 +28,7 @@ def require_role(*roles):
         log_action(None, "UNAUTHORIZED_ACCESS", f"Attempted access to {request.path}")
         abort(401)  # Unauthorized
 
-    if current_user.role_obj.name not in roles:
+    if get_role_name(current_user) not in roles:
         log_action(
             current_user,
             "FORBIDDEN_ACCESS",
@@ -42,7 +45,7 @@ def is_superadmin():
         log_action(None, "UNAUTHORIZED_SUPERADMIN_CHECK", "Unauthenticated check")
         return False
 
-    if current_user.role_obj.name == "superadmin":
+    if get_role_name(current_user) == "superadmin":
         return True
 
     log_action(
@@ -59,7 +62,7 @@ def is_admin():
         log_action(None, "UNAUTHORIZED_ADMIN_CHECK", "Unauthenticated check")
         return False
 
-    if current_user.role_obj.name in ["admin", "superadmin"]:
+    if get_role_name(current_user) in ["admin", "superadmin"]:
         return True
 
     log_action(
@@ -76,7 +79,7 @@ def is_staff():
         log_action(None, "UNAUTHORIZED_STAFF_CHECK", "Unauthenticated check")
         return False
 
-    if current_user.role_obj.name == "staff":
+    if get_role_name(current_user) == "staff":
         return True
 
     log_action(
@@ -0,0 +1,40 @@
+"""
+Shared version counters (the cache_versions table).
+
+A process that changes data behind an in-process cache bumps the counter in
+the same transaction; other workers poll it and reload when it moves. One
+row per cache name, so a poll is a primary-key lookup.
+"""
+from sqlalchemy import func, select
+
+from models import CacheVersion
+
+
+def read_version(conn, name):
+    table = CacheVersion.__table__
+    return conn.execute(select(table.c.version).where(table.c.name == name)).scalar() or 0
+
+
+def read_version_total(conn, prefix):
+    """Sum of the counters named `prefix`...: moves whenever any one of them does."""
+    table = CacheVersion.__table__
+    return conn.execute(select(func.sum(table.c.version)).where(table.c.name.startswith(prefix))).scalar() or 0
+
+
+def bump_version(conn, name):
+    """Increment `name`'s counter on `conn` (creating it at 1)."""
+    table = CacheVersion.__table__
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(name=name, version=1)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["name"], set_={"version": table.c.version + 1}
+        ))
+        return
+    result = conn.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+    if not result.rowcount:
+        conn.execute(table.insert().values(name=name, version=1))
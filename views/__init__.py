@@ -0,0 +1,25 @@
+"""
+HTTP views, one blueprint per area of the dashboard. create_app() in app.py
+registers them all with register_blueprints().
+
+Endpoints are named <blueprint>.<view> ("patients.list_patients"); that is
+also the endpoint label on /metrics. The domain logic stays in the top-level
+modules (dashboards.py, exports.py, quick_replies.py...); a view parses the
+request, calls into them and shapes the response. Modules that need heavy
+libraries import them inside the functions that use them (openpyxl and
+reportlab in exports.py, cryptography in clinic_registry.py), so a worker
+only loads them on the first request that needs them.
+"""
+from views import (
+    appointments, audit_logs, dashboards, jobs, metrics, patients, quick_replies, records, reminders, twilio,
+)
+
+BLUEPRINTS = (
+    dashboards.bp, patients.bp, appointments.bp, records.bp, audit_logs.bp, twilio.bp,
+    reminders.bp, jobs.bp, quick_replies.bp, metrics.bp,
+)
+
+
+def register_blueprints(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
@@ -0,0 +1,80 @@
+"""Appointment list, calendar feed, open slots and booking."""
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, jsonify, render_template, request, url_for
+
+import availability
+import calendar_feed
+from models import db, Appointment
+from pagination import paginate
+from rendering import Column, stream_table
+
+bp = Blueprint("appointments", __name__)
+
+
+@bp.route("/appointments")
+def list_appointments():
+    page = paginate(Appointment.query, Appointment.id, sort_column=Appointment.scheduled_time)
+    columns = [
+        Column("ID", "id"),
+        Column("Patient", "patient_id"),
+        Column("Doctor", "doctor_id"),
+        Column("Time", "scheduled_time"),
+    ]
+    body = f'<p><a href="{url_for(".appointments_calendar")}">Calendar view</a></p>'
+    return stream_table("Appointments", columns, page.items, page=page, body=body)
+
+
+@bp.route("/appointments/calendar")
+def appointments_calendar():
+    """FullCalendar view; events come from /appointments/feed for the visible range."""
+    return render_template(
+        "appointments.html", title="Appointments",
+        doctor=request.args.get("doctor", type=int), clinic_id=request.args.get("clinic_id", type=int),
+    )
+
+
+@bp.route("/appointments/feed")
+def appointments_feed():
+    """FullCalendar events: ?start=&end=[&doctor=][&clinic_id=], with ETag/If-None-Match."""
+    body, etag = calendar_feed.feed(*calendar_feed.parse_request(request.args))
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # always revalidate; unchanged weeks cost a 304
+    return response.make_conditional(request)
+
+
+@bp.route("/availability")
+def appointment_availability():
+    """Open slots: ?doctor_id=1&doctor_id=2 (or clinic_id=)&start=&end=[&duration=minutes]."""
+    doctor_ids, start, end, duration = availability.parse_request(request.args)
+    slots = availability.open_slots(doctor_ids, start, end, duration, not_before=datetime.utcnow())
+    return jsonify(start=start.isoformat(), end=end.isoformat(), duration=duration,
+                   doctors=availability.to_json(slots))
+
+
+@bp.route("/appointments/book", methods=["POST"])
+def book_appointment():
+    """Book doctor_id at start (ISO) for duration minutes; 409 if the slot is taken."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        doctor_id = int(data["doctor_id"])
+        start = availability.parse_iso(data["start"])
+        duration = int(data.get("duration") or availability.DEFAULT_DURATION)
+        patient_id = int(data["patient_id"]) if data.get("patient_id") else None
+        clinic_id = int(data["clinic_id"]) if data.get("clinic_id") else None
+    except (KeyError, TypeError, ValueError):
+        abort(400, "doctor_id and start are required; numbers must be integers, start an ISO datetime")
+    try:
+        appointment = availability.book(doctor_id, start, duration, patient_id=patient_id,
+                                        clinic_id=clinic_id, reason=data.get("reason"))
+    except availability.SlotUnavailable as exc:
+        db.session.rollback()
+        return jsonify(error=str(exc)), 409
+    except ValueError as exc:
+        db.session.rollback()
+        abort(400, str(exc))
+    db.session.commit()
+    return jsonify(id=appointment.id, start=appointment.scheduled_time.isoformat(),
+                   duration=appointment.duration_minutes), 201
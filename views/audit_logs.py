@@ -0,0 +1,54 @@
+"""Audit log pages and exports (built by exports.py, which loads openpyxl/reportlab on first use)."""
+from flask import Blueprint, request, url_for
+
+import exports
+from models import AuditLog
+from pagination import paginate
+from rendering import Column, stream_table
+
+bp = Blueprint("audit_logs", __name__)
+
+AUDIT_LOG_COLUMNS = [
+    Column("ID", "id"),
+    Column("User", "user_id"),
+    Column("Action", "action"),
+    Column("Details", "details"),
+    Column("Timestamp", "timestamp"),
+]
+
+
+@bp.route("/audit_logs")
+def list_audit_logs():
+    page = paginate(AuditLog.query, AuditLog.id, sort_column=AuditLog.timestamp, descending=True)
+    body = (
+        f'<p>Export: <a href="{url_for(".export_audit_logs")}">CSV</a> · '
+        f'<a href="{url_for(".export_audit_logs", format="xlsx")}">Excel</a> · '
+        f'<a href="{url_for(".export_audit_logs_pdf")}">PDF</a></p>'
+    )
+    return stream_table("Audit Logs", AUDIT_LOG_COLUMNS, page.items, page=page, body=body)
+
+
+@bp.route("/audit_logs/all")
+def list_all_audit_logs():
+    """Whole audit log on one page, streamed from a server-side cursor."""
+    query = AuditLog.query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())
+    return stream_table("Audit Logs", AUDIT_LOG_COLUMNS, query)
+
+
+@bp.route("/audit_logs/export")
+def export_audit_logs():
+    """Filtered export (?user=&action=&start=&end=) as CSV, or XLSX with ?format=xlsx."""
+    query = exports.audit_log_query(request.args)
+    if request.args.get("format") == "xlsx":
+        return exports.export_xlsx(query)
+    return exports.export_csv(query)
+
+
+@bp.route("/audit_logs/export/all")
+def export_all_audit_logs():
+    return exports.export_xlsx(exports.audit_log_query())
+
+
+@bp.route("/audit_logs/export/pdf")
+def export_audit_logs_pdf():
+    return exports.export_pdf(exports.audit_log_query(request.args))
@@ -0,0 +1,55 @@
+"""Home, reports and the role dashboards (data loaded by dashboards.py, a fixed number of queries each)."""
+from flask import Blueprint, render_template, request
+
+import dashboards
+import rollups
+from rendering import render_dashboard
+
+bp = Blueprint("dashboards", __name__)
+
+
+@bp.route("/")
+def home():
+    body = """
+    <p>Welcome to the <b>AI Receptionist Demo</b> dashboard.</p>
+    <p>Use the navigation menu on the left to explore demo data for patients, appointments, doctor notes, staff profiles, logs, and Twilio activity.</p>
+    """
+    return render_dashboard("Home", body)
+
+# -------------------------------------------------
+# Reports (read from twilio_rollups, see rollups.py)
+# -------------------------------------------------
+@bp.route("/reports")
+def reports():
+    return render_template(
+        "reports.html",
+        title="Reports",
+        calls_chart=rollups.chart_json("Calls", rollups.series("call")),
+        messages_chart=rollups.chart_json("Messages", rollups.series("sms")),
+    )
+
+# -------------------------------------------------
+# Superadmin Dashboard
+# -------------------------------------------------
+@bp.route("/superadmin")
+def superadmin_dashboard():
+    return render_template("superadmin_dashboard.html", title="Superadmin Dashboard", **dashboards.superadmin_view())
+
+# -------------------------------------------------
+# Role Dashboards
+# -------------------------------------------------
+@bp.route("/dashboard/doctor/<int:doctor_id>")
+def doctor_dashboard(doctor_id):
+    return render_template("doctor_dashboard.html", title="Doctor Dashboard", **dashboards.doctor_view(doctor_id))
+
+
+@bp.route("/dashboard/receptionist")
+def receptionist_dashboard():
+    view = dashboards.receptionist_view(request.args.get("clinic_id", type=int))
+    return render_template("receptionist_dashboard.html", title="Receptionist Dashboard", **view)
+
+
+@bp.route("/dashboard/nurse/<int:user_id>")
+def nurse_dashboard(user_id):
+    view = dashboards.nurse_view(user_id, request.args.get("clinic_id", type=int))
+    return render_template("dashboards/nurse_dashboards.html", title="Nurse Dashboard", **view)
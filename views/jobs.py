@@ -0,0 +1,39 @@
+"""Background job submission and status (run by `flask worker`, see jobs.py)."""
+import os
+
+from flask import Blueprint, abort, jsonify, request, send_file, url_for
+
+import exports
+import jobs
+from models import Job
+
+bp = Blueprint("jobs", __name__)
+
+
+@bp.route("/jobs/audit_logs/export", methods=["POST"])
+def enqueue_audit_log_export():
+    """Queue an export (?format=csv|xlsx|pdf plus the usual filters); poll /jobs/<id>."""
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "xlsx", "pdf"):
+        abort(400, f"Unknown export format: {fmt}")
+    filters = {key: request.args[key] for key in ("user", "action", "start", "end") if request.args.get(key)}
+    exports.audit_log_query(filters)  # reject bad filters now rather than in the worker
+    job = jobs.enqueue("audit_log_export", format=fmt, filters=filters)
+    return jsonify(id=job.id, status_url=url_for(".job_status", job_id=job.id)), 202
+
+
+@bp.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    status = jobs.job_status(job)
+    if job.status == "done" and job.artifact_path:
+        status["download_url"] = url_for(".download_job_artifact", job_id=job.id)
+    return jsonify(status)
+
+
+@bp.route("/jobs/<int:job_id>/download")
+def download_job_artifact(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.status != "done" or not job.artifact_path or not os.path.exists(job.artifact_path):
+        abort(404)
+    return send_file(job.artifact_path, as_attachment=True)
@@ -0,0 +1,18 @@
+"""Prometheus metrics and recent slow requests (see instrumentation.py)."""
+from flask import Blueprint
+
+import instrumentation
+
+bp = Blueprint("metrics", __name__)
+
+
+@bp.route("/metrics")
+def metrics():
+    # Prometheus text format, summed across the gunicorn workers.
+    return instrumentation.metrics_response()
+
+
+@bp.route("/metrics/slow")
+def slow_requests():
+    # ?limit=20, ?stacks=1 for the folded stack samples
+    return instrumentation.slow_response()
@@ -0,0 +1,47 @@
+"""Patient list and the typeahead search behind it."""
+from flask import Blueprint, jsonify, request, url_for
+
+import patient_search
+from models import Patient
+from pagination import paginate
+from rendering import Column, stream_table
+
+bp = Blueprint("patients", __name__)
+
+
+@bp.route("/patients")
+def list_patients():
+    page = paginate(Patient.query, Patient.id)
+    columns = [
+        Column("ID", "id"),
+        Column("Name", lambda p: f"{p.first_name} {p.last_name}"),
+        Column("Email", "email"),
+        Column("Phone", "phone"),
+    ]
+    body = (
+        '<input id="patient-search" type="search" placeholder="Search name, phone or email" autocomplete="off">'
+        '<ul id="patient-results"></ul>'
+        '<script>'
+        'const box = document.getElementById("patient-search"), list = document.getElementById("patient-results");'
+        'let timer;'
+        'box.addEventListener("input", () => { clearTimeout(timer); timer = setTimeout(async () => {'
+        f' const res = await fetch("{url_for(".search_patients")}?q=" + encodeURIComponent(box.value));'
+        ' const data = await res.json();'
+        ' list.innerHTML = "";'
+        ' for (const p of data.results) { const li = document.createElement("li");'
+        '  li.textContent = `${p.name} · ${p.phone || ""} · ${p.email || ""}`; list.appendChild(li); }'
+        '}, 120); });'
+        '</script>'
+    )
+    return stream_table("Patients", columns, page.items, page=page, body=body)
+
+
+@bp.route("/patients/search")
+def search_patients():
+    """Typeahead: ?q=<name, phone or email>[&limit=10][&clinic_id=]."""
+    results = patient_search.search(
+        request.args.get("q", ""),
+        limit=request.args.get("limit", patient_search.DEFAULT_LIMIT, type=int),
+        clinic_id=request.args.get("clinic_id", type=int),
+    )
+    return jsonify(results=results)
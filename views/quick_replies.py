@@ -0,0 +1,52 @@
+"""Per-clinic quick replies: list, test, create, edit, delete (matching lives in quick_replies.py)."""
+from flask import Blueprint, abort, redirect, render_template, request, url_for
+
+import quick_replies
+from models import db, Clinic, QuickReply
+
+bp = Blueprint("quick_replies", __name__)
+
+
+@bp.route("/quick-replies")
+def list_quick_replies():
+    clinics = Clinic.query.order_by(Clinic.name).all()
+    clinic_id = request.args.get("clinic_id", type=int) or (clinics[0].id if clinics else None)
+    replies = QuickReply.query.filter_by(clinic_id=clinic_id).order_by(QuickReply.id).all()
+    test = request.args.get("test")
+    match = quick_replies.get_cache().match(clinic_id, test) if test and clinic_id else None
+    return render_template("quick_replies.html", title="Quick Replies", clinics=clinics, clinic_id=clinic_id,
+                           replies=replies, test=test, match=match)
+
+
+def _quick_reply_fields(form):
+    keywords = ", ".join(quick_replies.parse_keywords(form.get("keywords")))
+    reply = (form.get("reply") or "").strip()
+    if not keywords or not reply:
+        abort(400, "keywords and reply are required")
+    return keywords, reply
+
+
+@bp.route("/quick-replies", methods=["POST"])
+def create_quick_reply():
+    keywords, reply = _quick_reply_fields(request.form)
+    clinic = Clinic.query.get_or_404(request.form.get("clinic_id", type=int))
+    db.session.add(QuickReply(clinic_id=clinic.id, keywords=keywords, reply=reply))
+    db.session.commit()
+    return redirect(url_for(".list_quick_replies", clinic_id=clinic.id))
+
+
+@bp.route("/quick-replies/<int:reply_id>", methods=["POST"])
+def update_quick_reply(reply_id):
+    quick_reply = QuickReply.query.get_or_404(reply_id)
+    quick_reply.keywords, quick_reply.reply = _quick_reply_fields(request.form)
+    quick_reply.active = bool(request.form.get("active"))
+    db.session.commit()
+    return redirect(url_for(".list_quick_replies", clinic_id=quick_reply.clinic_id))
+
+
+@bp.route("/quick-replies/<int:reply_id>/delete", methods=["POST"])
+def delete_quick_reply(reply_id):
+    quick_reply = QuickReply.query.get_or_404(reply_id)
+    db.session.delete(quick_reply)
+    db.session.commit()
+    return redirect(url_for(".list_quick_replies", clinic_id=quick_reply.clinic_id))
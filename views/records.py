@@ -0,0 +1,49 @@
+"""Read-only lists: doctor notes and staff profiles."""
+from flask import Blueprint
+
+from models import DoctorNote, NurseProfile, ReceptionistProfile
+from pagination import paginate
+from rendering import Column, stream_table
+
+bp = Blueprint("records", __name__)
+
+# -------------------------------------------------
+# Doctor Notes
+# -------------------------------------------------
+@bp.route("/notes")
+def list_notes():
+    page = paginate(DoctorNote.query, DoctorNote.id)
+    columns = [
+        Column("ID", "id"),
+        Column("Doctor", "doctor_id"),
+        Column("Patient", "patient_id"),
+        Column("Note", "content"),
+        Column("Created", "created_at"),
+    ]
+    return stream_table("Doctor Notes", columns, page.items, page=page)
+
+# -------------------------------------------------
+# Nurse Profiles
+# -------------------------------------------------
+@bp.route("/nurse_profiles")
+def list_nurse_profiles():
+    page = paginate(NurseProfile.query, NurseProfile.id)
+    columns = [
+        Column("ID", "id"),
+        Column("User", "nurse_id"),
+        Column("Department", "specialization"),
+    ]
+    return stream_table("Nurse Profiles", columns, page.items, page=page)
+
+# -------------------------------------------------
+# Receptionist Profiles
+# -------------------------------------------------
+@bp.route("/receptionist_profiles")
+def list_receptionist_profiles():
+    page = paginate(ReceptionistProfile.query, ReceptionistProfile.id)
+    columns = [
+        Column("ID", "id"),
+        Column("User", "receptionist_id"),
+        Column("Front Desk", "desk_location"),
+    ]
+    return stream_table("Receptionist Profiles", columns, page.items, page=page)
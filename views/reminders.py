@@ -0,0 +1,28 @@
+"""Reminder list and scheduling (sent by `flask reminders-dispatch`, see reminders.py)."""
+from datetime import datetime
+
+from flask import Blueprint, abort, redirect, render_template, request, url_for
+
+import reminders
+from models import Reminder
+
+bp = Blueprint("reminders", __name__)
+
+
+@bp.route("/reminders", methods=["GET", "POST"])
+def list_reminders():
+    if request.method == "POST":
+        try:
+            send_time = datetime.fromisoformat(request.form["send_time"])
+        except (KeyError, ValueError):
+            abort(400, "send_time must be a date and time")
+        reminders.schedule(request.form["phone"], request.form["message"], send_time)
+        return redirect(url_for(".list_reminders"))
+
+    upcoming = (
+        Reminder.query.filter(Reminder.status == "pending")
+        .order_by(Reminder.send_time)
+        .limit(50)
+        .all()
+    )
+    return render_template("reminders.html", title="Reminders", reminders=upcoming)
@@ -0,0 +1,56 @@
+"""Twilio log list and the webhooks Twilio calls."""
+from flask import Blueprint, Response, abort, request
+from markupsafe import escape
+
+import caller_id
+import llm_gateway
+import quick_replies
+import twilio_ingest
+from models import TwilioLog
+from pagination import paginate
+from rendering import Column, stream_table
+
+bp = Blueprint("twilio", __name__)
+
+
+@bp.route("/twilio_logs")
+def list_twilio_logs():
+    page = paginate(TwilioLog.query, TwilioLog.id, sort_column=TwilioLog.timestamp, descending=True)
+    columns = [
+        Column("ID", "id"),
+        Column("Type", "message_type"),
+        Column("From", "from_number"),
+        Column("To", "to_number"),
+        Column("Content", "body"),
+        Column("Status", "status"),
+        Column("Time", "timestamp"),
+    ]
+    return stream_table("Twilio Logs", columns, page.items, page=page)
+
+
+@bp.route("/twilio/webhook", methods=["POST"])
+def twilio_webhook():
+    """Status/inbound callbacks: spooled here, written by twilio_ingest's batch writer."""
+    status = twilio_ingest.ingest(request.form, request.url, request.headers.get("X-Twilio-Signature"))
+    if status != 200:
+        abort(status)
+    # Inbound texts with a quick-reply keyword are answered right here. With
+    # LLM_SMS_REPLIES on, a job asks the model and texts the answer back, so
+    # Twilio isn't kept waiting on the model.
+    reply = quick_replies.reply_for(request.form)
+    if reply is not None:
+        return Response(f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{escape(reply)}</Message></Response>',
+                        mimetype="text/xml")
+    llm_gateway.queue_sms_reply(request.form)
+    return Response(twilio_ingest.TWIML_EMPTY, mimetype="text/xml")
+
+
+@bp.route("/twilio/voice", methods=["POST"])
+def twilio_voice():
+    """Inbound call: greet the caller by name when their number is on file."""
+    to_number = request.form.get("To")
+    if not twilio_ingest.verify_request(to_number, request.form, request.url, request.headers.get("X-Twilio-Signature")):
+        abort(403)
+    clinic, caller = caller_id.identify(request.form.get("From"), to_number)
+    say = escape(caller_id.greeting(clinic, caller))
+    return Response(f'<?xml version="1.0" encoding="UTF-8"?><Response><Say>{say}</Say></Response>', mimetype="text/xml")